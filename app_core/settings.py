@@ -8,6 +8,8 @@ load_dotenv()
 
 # Chave API
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Endpoint alternativo (ex: servidor falso local: python manage.py servidor_openai_falso)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Conta as consultas SQL de cada requisição (ver ORCAMENTO_CONSULTAS)
+    'psico_saas.orcamento_consultas.OrcamentoConsultasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +78,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'app_core.wsgi.application'
+# Streaming (SSE) da geração de IA exige o servidor ASGI (ver Procfile)
+ASGI_APPLICATION = 'app_core.asgi.application'
 
 
 # Database
@@ -85,7 +91,10 @@ WSGI_APPLICATION = 'app_core.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600,
+        # O site roda em ASGI (Procfile): cada requisição síncrona ganha uma thread
+        # nova, e uma conexão persistente ficaria presa a uma thread que não volta.
+        # Com 0 a conexão fecha no fim da requisição (o worker de jobs mantém a sua)
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 0)),
         conn_health_checks=True,
     )
 }
@@ -180,4 +189,238 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     )
-}
\ No newline at end of file
+}
+
+
+# --------------------------
+# FILA DE JOBS DE IA
+# --------------------------
+# Gerações de IA rodam no worker (python manage.py processar_jobs_ia).
+# Em desenvolvimento sem worker, IA_JOBS_SINCRONOS=True executa o job na própria requisição.
+IA_JOBS_SINCRONOS = os.environ.get('IA_JOBS_SINCRONOS', 'False') == 'True'
+IA_JOBS_MAX_TENTATIVAS = int(os.environ.get('IA_JOBS_MAX_TENTATIVAS', 3))
+IA_JOBS_TIMEOUT_SEGUNDOS = int(os.environ.get('IA_JOBS_TIMEOUT_SEGUNDOS', 300))
+# Gerações simultâneas por lote (não deve passar de IA_CLIENTE['MAX_CONEXOES'])
+IA_LOTE_MAX_PARALELO = int(os.environ.get('IA_LOTE_MAX_PARALELO', 8))
+IA_LOTE_MAX_PACIENTES = int(os.environ.get('IA_LOTE_MAX_PACIENTES', 100))
+
+
+# --------------------------
+# CACHE DE COMPLETIONS DA IA
+# --------------------------
+# Mesma entrada (modelo + mensagens + parâmetros) reaproveita a resposta anterior.
+IA_CACHE = {
+    'HABILITADO': os.environ.get('IA_CACHE_HABILITADO', 'True') == 'True',
+    'TTL_SEGUNDOS': int(os.environ.get('IA_CACHE_TTL_SEGUNDOS', 7 * 24 * 3600)),
+    'MAX_ITENS_MEMORIA': int(os.environ.get('IA_CACHE_MAX_ITENS_MEMORIA', 512)),
+    # Dados de paciente (anotações, exercícios, revisões de plano) nunca ficam no
+    # cache, qualquer que seja esta lista (ia_cache.PREFIXOS_SEM_CACHE)
+    'ENDPOINTS_DESATIVADOS': ['documentacao', 'documentacao_bloco', 'tarefa', 'plano_revisao'],
+}
+
+
+# --------------------------
+# CLIENTE OPENAI (POOL DE CONEXÕES)
+# --------------------------
+IA_CLIENTE = {
+    'MAX_CONEXOES': int(os.environ.get('IA_CLIENTE_MAX_CONEXOES', 20)),
+    'MAX_CONEXOES_KEEPALIVE': int(os.environ.get('IA_CLIENTE_MAX_CONEXOES_KEEPALIVE', 10)),
+    'KEEPALIVE_SEGUNDOS': 30,
+    'TIMEOUT_CONEXAO': 5.0,
+    'TIMEOUT_LEITURA': float(os.environ.get('IA_CLIENTE_TIMEOUT_LEITURA', 60)),
+    'TIMEOUT_POOL': 5.0,
+    'MAX_RETRIES': 0,
+}
+
+
+# --------------------------
+# ORÇAMENTO DE LATÊNCIA DA IA
+# --------------------------
+# Prazo total por endpoint; após o p95 recente dispara uma requisição extra (hedge).
+IA_LATENCIA = {
+    'PRAZO_PADRAO_SEGUNDOS': float(os.environ.get('IA_PRAZO_PADRAO_SEGUNDOS', 30)),
+    'PRAZOS_SEGUNDOS': {
+        'tarefa': 30.0,
+        'conteudo': 45.0,
+        'documentacao': 25.0,
+        'documentacao_bloco': 30.0,
+        'plano_revisao': 20.0,
+    },
+    'HEDGE_HABILITADO': os.environ.get('IA_HEDGE_HABILITADO', 'True') == 'True',
+    'HEDGE_INICIAL_SEGUNDOS': float(os.environ.get('IA_HEDGE_INICIAL_SEGUNDOS', 8)),
+    'TENTATIVAS': int(os.environ.get('IA_TENTATIVAS', 3)),
+}
+
+
+# --------------------------
+# COMPACTAÇÃO DAS ANOTAÇÕES DE SESSÃO
+# --------------------------
+# Tokens máximos das anotações no prompt; acima disso são analisadas por blocos (map-reduce).
+IA_COMPACTACAO = {
+    'ORCAMENTO_TOKENS': {
+        'gpt-3.5-turbo-1106': int(os.environ.get('IA_ORCAMENTO_TOKENS_DOCUMENTACAO', 6000)),
+    },
+    'TOKENS_POR_BLOCO': int(os.environ.get('IA_TOKENS_POR_BLOCO', 2000)),
+    # Blocos de transcrições longas analisados em paralelo
+    'MAX_PARALELO': int(os.environ.get('IA_COMPACTACAO_MAX_PARALELO', 6)),
+}
+
+
+# --------------------------
+# REAPROVEITAMENTO DE EXERCÍCIOS (SIMILARIDADE)
+# --------------------------
+IA_SIMILARIDADE = {
+    'HABILITADO': os.environ.get('IA_SIMILARIDADE_HABILITADO', 'True') == 'True',
+    'LIMIAR_REUTILIZACAO': float(os.environ.get('IA_LIMIAR_REUTILIZACAO', 0.92)),
+    'LIMIAR_SUGESTAO': float(os.environ.get('IA_LIMIAR_SUGESTAO', 0.55)),
+    # Exercícios de outros psicólogos só entram se habilitado explicitamente
+    'GLOBAL': os.environ.get('IA_SIMILARIDADE_GLOBAL', 'False') == 'True',
+    # Índices por psicólogo mantidos em memória em cada processo
+    'MAX_INDICES': int(os.environ.get('IA_SIMILARIDADE_MAX_INDICES', 200)),
+    'TTL_INDICE_SEGUNDOS': int(os.environ.get('IA_SIMILARIDADE_TTL_INDICE_SEGUNDOS', 3600)),
+}
+
+
+# --------------------------
+# CACHE COMPARTILHADO (web + worker)
+# --------------------------
+# Em banco para valer entre todos os processos (criar com: python manage.py createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'psico_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Vagas e cotas da IA (ia_limites.py) numa tabela própria: o cull do cache
+    # padrão apagaria vagas ocupadas e furaria o limite de chamadas simultâneas.
+    # As chaves são poucas (usuários x endpoints) e expiram sozinhas
+    'ia_limites': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'psico_cache_limites',
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 9},
+    },
+}
+
+
+# --------------------------
+# LIMITES DE USO DA IA
+# --------------------------
+IA_LIMITES = {
+    'HABILITADO': os.environ.get('IA_LIMITES_HABILITADO', 'True') == 'True',
+    'ALIAS_CACHE': 'ia_limites',
+    'PADRAO': {
+        'POR_USUARIO_SIMULTANEAS': int(os.environ.get('IA_LIMITE_USUARIO_SIMULTANEAS', 2)),
+        'GLOBAL_SIMULTANEAS': int(os.environ.get('IA_LIMITE_GLOBAL_SIMULTANEAS', 16)),
+        'POR_USUARIO_POR_MINUTO': int(os.environ.get('IA_LIMITE_USUARIO_POR_MINUTO', 10)),
+        'RAJADA': int(os.environ.get('IA_LIMITE_RAJADA', 4)),
+    },
+    'ENDPOINTS': {
+        # Documentação é a chamada mais cara (transcrições longas)
+        'documentacao': {'POR_USUARIO_SIMULTANEAS': 1, 'GLOBAL_SIMULTANEAS': 8, 'POR_USUARIO_POR_MINUTO': 4, 'RAJADA': 2},
+        'documentacao_bloco': {'GLOBAL_SIMULTANEAS': 24},
+        'plano_revisao': {'POR_USUARIO_POR_MINUTO': 6},
+    },
+    'ESPERA_SEGUNDOS': float(os.environ.get('IA_LIMITE_ESPERA_SEGUNDOS', 20)),
+}
+
+
+# --------------------------
+# TELEMETRIA DA IA
+# --------------------------
+IA_METRICAS = {
+    'HABILITADO': os.environ.get('IA_METRICAS_HABILITADO', 'True') == 'True',
+    # De quanto em quanto tempo cada processo grava o que acumulou
+    'INTERVALO_SEGUNDOS': int(os.environ.get('IA_METRICAS_INTERVALO_SEGUNDOS', 30)),
+}
+
+
+# --------------------------
+# ORÇAMENTO DE CONSULTAS SQL POR VIEW
+# --------------------------
+# Ligado em desenvolvimento; no CI use ORCAMENTO_CONSULTAS_ESTRITO=True para
+# falhar quando uma view passar do orçamento declarado (@orcamento_consultas)
+ORCAMENTO_CONSULTAS = {
+    'HABILITADO': os.environ.get('ORCAMENTO_CONSULTAS_HABILITADO', str(DEBUG)) == 'True',
+    'ESTRITO': os.environ.get('ORCAMENTO_CONSULTAS_ESTRITO', 'False') == 'True',
+}
+
+
+# --------------------------
+# PAGINAÇÃO DAS LISTAS (CURSOR)
+# --------------------------
+PAGINACAO = {
+    'TAMANHO_PAGINA': int(os.environ.get('PAGINACAO_TAMANHO_PAGINA', 50)),
+    'MAX_TAMANHO_PAGINA': int(os.environ.get('PAGINACAO_MAX_TAMANHO_PAGINA', 200)),
+}
+
+
+# --------------------------
+# RESUMO DO DASHBOARD (CACHE)
+# --------------------------
+PAINEL = {
+    'HABILITADO': os.environ.get('PAINEL_CACHE_HABILITADO', 'True') == 'True',
+    'TTL_SEGUNDOS': int(os.environ.get('PAINEL_CACHE_TTL_SEGUNDOS', 300)),
+}
+
+
+# --------------------------
+# BUSCA DE TEXTO COMPLETO
+# --------------------------
+BUSCA = {
+    'RESULTADOS_POR_PAGINA': int(os.environ.get('BUSCA_RESULTADOS_POR_PAGINA', 20)),
+    'MAX_PAGINAS': int(os.environ.get('BUSCA_MAX_PAGINAS', 25)),
+    'MAX_PACIENTES': int(os.environ.get('BUSCA_MAX_PACIENTES', 10)),
+}
+
+
+# --------------------------
+# IMPORTAÇÃO DE PACIENTES (CSV/XLSX)
+# --------------------------
+IMPORTACAO_PACIENTES = {
+    'TAMANHO_LOTE': int(os.environ.get('IMPORTACAO_PACIENTES_TAMANHO_LOTE', 1000)),
+    'MAX_ERROS_RELATORIO': int(os.environ.get('IMPORTACAO_PACIENTES_MAX_ERROS', 500)),
+    'MAX_TAMANHO_ARQUIVO_MB': int(os.environ.get('IMPORTACAO_PACIENTES_MAX_MB', 20)),
+}
+
+
+# --------------------------
+# EXPORTAÇÃO DOS DADOS (LGPD)
+# --------------------------
+EXPORTACAO = {
+    # Linhas por ida ao banco (cursor no servidor no PostgreSQL)
+    'TAMANHO_BLOCO': int(os.environ.get('EXPORTACAO_TAMANHO_BLOCO', 2000)),
+    'TAMANHO_ENVIO': int(os.environ.get('EXPORTACAO_TAMANHO_ENVIO', 64 * 1024)),
+}
+
+
+# --------------------------
+# COMPRESSÃO DOS TEXTOS LONGOS (anotações e saídas da IA)
+# --------------------------
+COMPRESSAO_TEXTO = {
+    # Desligado: textos novos são gravados puros (os já comprimidos continuam legíveis)
+    'HABILITADO': os.environ.get('COMPRESSAO_TEXTO_HABILITADO', 'True') == 'True',
+    # 'zlib' ou 'zstd' (requer o pacote zstandard)
+    'ALGORITMO': os.environ.get('COMPRESSAO_TEXTO_ALGORITMO', 'zlib'),
+    'NIVEL': int(os.environ.get('COMPRESSAO_TEXTO_NIVEL', 6)),
+    'TAMANHO_MINIMO': int(os.environ.get('COMPRESSAO_TEXTO_TAMANHO_MINIMO', 512)),
+}
+
+
+# --------------------------
+# DIRETÓRIO DE PACIENTES DOS FORMULÁRIOS (CACHE)
+# --------------------------
+DIRETORIO_PACIENTES = {
+    'HABILITADO': os.environ.get('DIRETORIO_PACIENTES_CACHE_HABILITADO', 'True') == 'True',
+    'TTL_SEGUNDOS': int(os.environ.get('DIRETORIO_PACIENTES_CACHE_TTL_SEGUNDOS', 3600)),
+}
+
+
+# --------------------------
+# CHAVES DE IDEMPOTÊNCIA DOS ENVIOS DE IA (duplo clique/reenvio não gera de novo)
+# --------------------------
+IDEMPOTENCIA = {
+    'HABILITADO': os.environ.get('IDEMPOTENCIA_HABILITADO', 'True') == 'True',
+    'VALIDADE_SEGUNDOS': int(os.environ.get('IDEMPOTENCIA_VALIDADE_SEGUNDOS', 24 * 3600)),
+    # Stream repetido esperando a geração original terminar
+    'ESPERA_STREAM_SEGUNDOS': int(os.environ.get('IDEMPOTENCIA_ESPERA_STREAM_SEGUNDOS', 120)),
+}
@@ -0,0 +1,25 @@
+"""
+Worker do gunicorn para servir o app_core.asgi (ver o Procfile).
+
+Só os dois streams de geração (SSE) são views assíncronas; o resto do site
+continua síncrono e, no ASGI, cada requisição em andamento roda numa thread
+própria (asgiref) com a sua conexão ao banco. Sem limite, um pico de acessos
+vira um pico de threads e de conexões ao PostgreSQL. O UvicornWorker não
+repassa o --worker-connections do gunicorn, por isso o limite fica aqui.
+"""
+
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+class UvicornWorkerLimitado(UvicornWorker):
+    """
+    UvicornWorker com limite de conexões simultâneas por processo
+    (WEB_LIMITE_CONEXOES); acima dele o uvicorn responde 503 na hora.
+    Streams abertos contam no limite, mas não ocupam thread enquanto esperam.
+    """
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        'limit_concurrency': int(os.environ.get('WEB_LIMITE_CONEXOES', 40)),
+    }
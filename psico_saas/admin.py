@@ -1,6 +1,6 @@
 # psico_saas/admin.py
 from django.contrib import admin
-from .models import PlanoTratamento, DocumentacaoSessao, TarefaExercicios, Paciente # ⬅️ IMPORTAR PACIENTE
+from .models import PlanoTratamento, DocumentacaoSessao, TarefaExercicios, Paciente, JobIA, CacheCompletionIA, MetricaIA # ⬅️ IMPORTAR PACIENTE
 
 
 # -------------------------------------------------------------
@@ -34,4 +34,36 @@ class PacienteAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(usuario=request.user)
\ No newline at end of file
+        return qs.filter(usuario=request.user)
+
+
+# -------------------------------------------------------------
+# FILA DE JOBS DE IA
+# -------------------------------------------------------------
+@admin.register(JobIA)
+class JobIAAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'objeto_id', 'usuario', 'status', 'tentativas', 'progresso_concluido', 'progresso_total', 'data_criacao', 'data_conclusao')
+    list_filter = ('status', 'tipo')
+    readonly_fields = ('data_criacao', 'data_inicio', 'data_conclusao')
+
+
+@admin.register(CacheCompletionIA)
+class CacheCompletionIAAdmin(admin.ModelAdmin):
+    list_display = ('chave', 'endpoint', 'modelo', 'acessos', 'data_criacao', 'expira_em')
+    list_filter = ('endpoint', 'modelo')
+    readonly_fields = ('chave', 'data_criacao')
+
+
+@admin.register(MetricaIA)
+class MetricaIAAdmin(admin.ModelAdmin):
+    """Somente leitura: as linhas são gravadas por psico_saas/ia_metricas.py."""
+    list_display = ('dia', 'endpoint', 'modelo', 'chamadas', 'erros', 'timeouts', 'limitadas',
+                    'cache_hits', 'tokens_prompt', 'tokens_completion')
+    list_filter = ('endpoint', 'modelo', 'dia')
+    date_hierarchy = 'dia'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PsicoSaasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'psico_saas'
+
+    def ready(self):
+        # Mantém o índice de similaridade dos exercícios em dia
+        from . import signals  # noqa: F401
@@ -0,0 +1,411 @@
+# psico_saas/busca.py
+
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import (IndiceBusca, DocumentacaoSessao, PlanoTratamento, TarefaExercicios, Paciente,
+                     normalizar_nome)
+
+# ------------------------------------------------------------------
+# BUSCA DE TEXTO COMPLETO
+# Uma linha de IndiceBusca por documentação, plano ou exercício (título e
+# metadados), mantida pelos signals (signals.py). O texto pesquisável não é
+# copiado: só alimenta a sombra do índice, que depende do banco (migrações
+# 0016 e 0022):
+# - PostgreSQL: coluna tsvector ('portuguese', com stemming; título com
+#   peso A) + GIN, preenchida aqui com to_tsvector; ranking ts_rank_cd;
+# - SQLite (desenvolvimento): FTS5 sem conteúdo (content='') com remoção de
+#   acentos e prefixos; ranking bm25. Uma FTS5 sem conteúdo só apaga uma
+#   linha recebendo de volta os valores indexados: o conteúdo anterior é lido
+#   do registro de origem antes da edição (lembrar_conteudo_indexado, no
+#   pre_save) e passado no comando 'delete' antes de gravar a versão nova;
+# - outros bancos: icontains nos títulos e excertos (sem ranking).
+# Os trechos saem dos registros de origem, só para a página exibida, com os
+# termos marcados por sentinelas, escapadas e trocadas por <mark> aqui, para
+# o texto do usuário nunca entrar como HTML.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'RESULTADOS_POR_PAGINA': 20,
+    # Busca ranqueada não tem cursor estável: limita a profundidade do OFFSET
+    'MAX_PAGINAS': 25,
+    # Palavras do trecho de cada resultado
+    'PALAVRAS_TRECHO': 24,
+    # Seletor de pacientes dos formulários
+    'MAX_PACIENTES': 10,
+}
+
+INICIO_MARCA = '⟦'
+FIM_MARCA = '⟧'
+
+PALAVRA = re.compile(r'\w+', re.UNICODE)
+
+MODELOS_POR_TIPO = {
+    'DOCUMENTACAO': DocumentacaoSessao,
+    'PLANO': PlanoTratamento,
+    'TAREFA': TarefaExercicios,
+}
+MODELOS_INDEXADOS = tuple(MODELOS_POR_TIPO.values())
+CAMPOS_ATUALIZADOS = ['usuario_id', 'titulo', 'data_criacao']
+
+# Campos curtos consultados com icontains nos bancos sem índice de texto
+CAMPOS_SEM_INDICE = {
+    'DOCUMENTACAO': ['resumo_excerto'],
+    'PLANO': ['titulo', 'abordagem_excerto'],
+    'TAREFA': ['tema_principal', 'exercicio_excerto'],
+}
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'BUSCA', {}))
+    return config
+
+
+# --------------------------------------------------------------------------------------
+# INDEXAÇÃO
+# --------------------------------------------------------------------------------------
+def _juntar(*partes):
+    return '\n\n'.join(parte for parte in partes if parte)
+
+
+def _titulo(objeto):
+    if isinstance(objeto, DocumentacaoSessao):
+        return f"Sessão de {objeto.data_sessao:%d/%m/%Y}" if objeto.data_sessao else "Sessão"
+    if isinstance(objeto, PlanoTratamento):
+        return objeto.titulo
+    return objeto.tema_principal
+
+
+def _documento(objeto):
+    """(tipo, título, conteúdo) do objeto, ou None se o modelo não é indexado."""
+    if isinstance(objeto, DocumentacaoSessao):
+        return 'DOCUMENTACAO', _titulo(objeto), _juntar(
+            objeto.anotacoes_brutas, objeto.resumo_ia, objeto.sugestao_diagnostico, objeto.padroes_linguagem)
+    if isinstance(objeto, PlanoTratamento):
+        return 'PLANO', _titulo(objeto), _juntar(
+            objeto.diagnostico_base, objeto.metas_tratamento, objeto.abordagem)
+    if isinstance(objeto, TarefaExercicios):
+        return 'TAREFA', _titulo(objeto), _juntar(
+            objeto.detalhes_personalizacao, objeto.exercicio_ia)
+    return None
+
+
+def _linhas(objetos):
+    """
+    [(entrada do índice, conteúdo, conteúdo indexado)]: o conteúdo só alimenta a
+    sombra, não é gravado. O indexado é o da versão anterior (SQLite) quando o
+    pre_save o guardou; senão é o atual (índice em dia pelos signals).
+    """
+    linhas = []
+    for objeto in objetos:
+        documento = _documento(objeto)
+        if documento is None:
+            continue
+        tipo, titulo, conteudo = documento
+        linhas.append((IndiceBusca(usuario_id=objeto.usuario_id, tipo=tipo, objeto_id=objeto.pk,
+                                   titulo=(titulo or '')[:255], data_criacao=objeto.data_criacao),
+                       conteudo, vars(objeto).pop('_conteudo_indexado', conteudo)))
+    return linhas
+
+
+def _apagar_sombra_sqlite(entradas, conteudos):
+    """Comando 'delete' da FTS5 com os valores indexados; conteudos: {(tipo, objeto_id): conteúdo}."""
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO psico_saas_busca_fts (psico_saas_busca_fts, rowid, dono, titulo, conteudo) "
+            "VALUES ('delete', %s, %s, %s, %s)",
+            [(pk, f'u{usuario_id}', titulo, conteudos[(tipo, objeto_id)])
+             for pk, tipo, objeto_id, usuario_id, titulo in entradas if (tipo, objeto_id) in conteudos])
+
+
+def _entradas(filtro):
+    return list(IndiceBusca.objects.filter(filtro).values_list('pk', 'tipo', 'objeto_id', 'usuario_id', 'titulo'))
+
+
+def _gravar_sqlite(linhas, lote):
+    entradas = [entrada for entrada, _, _ in linhas]
+    por_tipo = {}
+    for entrada in entradas:
+        por_tipo.setdefault(entrada.tipo, []).append(entrada.objeto_id)
+    anteriores = _entradas(reduce(or_, (Q(tipo=tipo, objeto_id__in=ids) for tipo, ids in por_tipo.items())))
+    if anteriores:
+        _apagar_sombra_sqlite(anteriores, {(entrada.tipo, entrada.objeto_id): indexado
+                                           for entrada, _, indexado in linhas})
+        IndiceBusca.objects.filter(pk__in=[anterior[0] for anterior in anteriores]).delete()
+    IndiceBusca.objects.bulk_create(entradas, batch_size=lote)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo) VALUES (%s, %s, %s, %s)",
+            [(entrada.pk, f'u{entrada.usuario_id}', entrada.titulo, conteudo)
+             for entrada, conteudo, _ in linhas])
+
+
+def _gravar_postgres(linhas):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            """
+            UPDATE psico_saas_indicebusca
+            SET vetor = setweight(to_tsvector('portuguese', %s), 'A') ||
+                        setweight(to_tsvector('portuguese', %s), 'B')
+            WHERE tipo = %s AND objeto_id = %s
+            """,
+            [(entrada.titulo, conteudo, entrada.tipo, entrada.objeto_id) for entrada, conteudo, _ in linhas])
+
+
+def indexar_varios(objetos, lote=500):
+    """
+    Indexa em lote: para gravações com bulk_create, que não disparam signals,
+    e para a reindexação (reindexar_busca). Fora do SQLite é um upsert
+    (INSERT ... ON CONFLICT) seguido da sombra.
+    """
+    linhas = _linhas(objetos)
+    if not linhas:
+        return 0
+    with transaction.atomic():
+        if connection.vendor == 'sqlite':
+            _gravar_sqlite(linhas, lote)
+        else:
+            IndiceBusca.objects.bulk_create(
+                [entrada for entrada, _, _ in linhas], batch_size=lote, update_conflicts=True,
+                unique_fields=['tipo', 'objeto_id'], update_fields=CAMPOS_ATUALIZADOS)
+            if connection.vendor == 'postgresql':
+                _gravar_postgres(linhas)
+    return len(linhas)
+
+
+def indexar(objeto):
+    indexar_varios([objeto])
+
+
+def lembrar_conteudo_indexado(objeto):
+    """pre_save: no SQLite, guarda no objeto o conteúdo ainda indexado (ver _apagar_sombra_sqlite)."""
+    if connection.vendor != 'sqlite' or objeto._state.adding or objeto.pk is None:
+        return
+    anterior = type(objeto)._base_manager.filter(pk=objeto.pk).first()
+    if anterior is not None:
+        objeto._conteudo_indexado = _documento(anterior)[2]
+
+
+def desindexar(objeto):
+    documento = _documento(objeto)
+    if documento is None:
+        return
+    filtro = Q(tipo=documento[0], objeto_id=objeto.pk)
+    if connection.vendor == 'sqlite':
+        _apagar_sombra_sqlite(_entradas(filtro), {(documento[0], objeto.pk): documento[2]})
+    IndiceBusca.objects.filter(filtro).delete()
+
+
+def limpar_indice(usuario_id=None):
+    """Apaga o índice (do usuário, se informado), com a sombra do SQLite."""
+    filtro = Q(usuario_id=usuario_id) if usuario_id else Q()
+    if connection.vendor == 'sqlite':
+        if usuario_id is None:
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO psico_saas_busca_fts (psico_saas_busca_fts) VALUES ('delete-all')")
+        else:
+            _apagar_sombra_sqlite(_entradas(filtro), {
+                (tipo, objeto.pk): _documento(objeto)[2]
+                for tipo, modelo in MODELOS_POR_TIPO.items()
+                for objeto in modelo.objects.filter(usuario_id=usuario_id).iterator(chunk_size=500)
+            })
+    apagados, _ = IndiceBusca.objects.filter(filtro).delete()
+    return apagados
+
+
+# --------------------------------------------------------------------------------------
+# CONSULTA
+# --------------------------------------------------------------------------------------
+class ResultadoBusca:
+    def __init__(self, tipo, objeto_id, titulo, trecho, data_criacao, relevancia):
+        self.tipo = tipo
+        self.objeto_id = objeto_id
+        self.titulo = titulo
+        self.trecho = _destacar(trecho)
+        self.data_criacao = data_criacao
+        self.relevancia = relevancia
+
+    @property
+    def tipo_display(self):
+        return dict(IndiceBusca.TIPOS).get(self.tipo, self.tipo)
+
+
+def _destacar(trecho):
+    return mark_safe(escape(trecho or '')
+                     .replace(INICIO_MARCA, '<mark>').replace(FIM_MARCA, '</mark>'))
+
+
+def _termos(texto):
+    return PALAVRA.findall(texto or '')[:12]
+
+
+def _trecho(texto, termos, tamanho):
+    """
+    Janela de `tamanho` palavras em volta do primeiro termo encontrado, com as
+    palavras que começam por algum termo (sem acentos/maiúsculas) marcadas.
+    """
+    texto = ' '.join((texto or '').split())
+    palavras = list(PALAVRA.finditer(texto))
+    if not palavras:
+        return ''
+    prefixos = tuple(normalizar_nome(termo) for termo in termos)
+    marcadas = [normalizar_nome(palavra.group()).startswith(prefixos) for palavra in palavras]
+    primeira = marcadas.index(True) if True in marcadas else 0
+    inicio = max(0, min(primeira - tamanho // 4, len(palavras) - tamanho))
+    fim = min(len(palavras), inicio + tamanho)
+
+    partes = []
+    posicao = palavras[inicio].start()
+    for palavra, marcada in zip(palavras[inicio:fim], marcadas[inicio:fim]):
+        if marcada:
+            partes += [texto[posicao:palavra.start()], INICIO_MARCA, palavra.group(), FIM_MARCA]
+            posicao = palavra.end()
+    partes.append(texto[posicao:palavras[fim - 1].end()])
+    return ('…' if inicio else '') + ''.join(partes) + ('…' if fim < len(palavras) else '')
+
+
+def _com_trechos(usuario_id, linhas, termos):
+    """Resultados da página, com o trecho tirado do registro de origem (uma consulta por tipo)."""
+    ids_por_tipo = {}
+    for tipo, objeto_id, *_ in linhas:
+        ids_por_tipo.setdefault(tipo, []).append(objeto_id)
+    origens = {
+        tipo: MODELOS_POR_TIPO[tipo].objects.filter(usuario_id=usuario_id).in_bulk(ids)
+        for tipo, ids in ids_por_tipo.items()
+    }
+    tamanho = _config()['PALAVRAS_TRECHO']
+
+    resultados = []
+    for tipo, objeto_id, titulo, data_criacao, relevancia in linhas:
+        objeto = origens[tipo].get(objeto_id)
+        trecho = _trecho(_documento(objeto)[2], termos, tamanho) if objeto is not None else ''
+        resultados.append(ResultadoBusca(tipo, objeto_id, titulo, trecho, data_criacao, relevancia))
+    return resultados
+
+
+def _consulta_fts5(termos, usuario_id):
+    # Cada termo entre aspas (nada do texto vira operador FTS5) e com prefixo
+    palavras = ' AND '.join(f'"{termo}"*' for termo in termos)
+    return f'dono:"u{int(usuario_id)}" AND {{titulo conteudo}}: ({palavras})'
+
+
+def _buscar_sqlite(usuario_id, termos, tipos, limite, deslocamento):
+    filtro_tipo = ''
+    parametros = [_consulta_fts5(termos, usuario_id)]
+    if tipos:
+        filtro_tipo = f" AND i.tipo IN ({', '.join(['%s'] * len(tipos))})"
+        parametros += list(tipos)
+    sql = f"""
+        SELECT i.tipo, i.objeto_id, i.titulo, i.data_criacao,
+               bm25(psico_saas_busca_fts, 0.0, 4.0, 1.0) AS relevancia
+        FROM psico_saas_busca_fts
+        JOIN psico_saas_indicebusca i ON i.id = psico_saas_busca_fts.rowid
+        WHERE psico_saas_busca_fts MATCH %s{filtro_tipo}
+        ORDER BY relevancia, i.data_criacao DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros + [limite, deslocamento])
+        linhas = cursor.fetchall()
+    # bm25: menor é melhor; invertido para ficar "maior é melhor" como no Postgres
+    return [(tipo, objeto_id, titulo, data, -relevancia)
+            for tipo, objeto_id, titulo, data, relevancia in linhas]
+
+
+def _buscar_postgres(usuario_id, termos, tipos, limite, deslocamento):
+    # Prefixo no último termo (o usuário pode estar no meio da palavra)
+    consulta = ' & '.join(termos[:-1] + [termos[-1] + ':*'])
+    filtro_tipo = ''
+    parametros = [consulta, usuario_id]
+    if tipos:
+        filtro_tipo = f" AND i.tipo IN ({', '.join(['%s'] * len(tipos))})"
+        parametros += list(tipos)
+    sql = f"""
+        SELECT i.tipo, i.objeto_id, i.titulo, i.data_criacao,
+               ts_rank_cd(i.vetor, q.consulta) AS relevancia
+        FROM psico_saas_indicebusca i, to_tsquery('portuguese', %s) AS q(consulta)
+        WHERE i.usuario_id = %s AND i.vetor @@ q.consulta{filtro_tipo}
+        ORDER BY relevancia DESC, i.data_criacao DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros + [limite, deslocamento])
+        return cursor.fetchall()
+
+
+def _buscar_excertos(usuario_id, termos, tipos, limite, deslocamento):
+    """Bancos sem índice de texto: cada termo em algum título/excerto, mais recentes primeiro."""
+    linhas = []
+    for tipo in tipos or MODELOS_POR_TIPO:
+        filtro = Q(usuario_id=usuario_id)
+        for termo in termos:
+            filtro &= reduce(or_, (Q(**{f'{campo}__icontains': termo}) for campo in CAMPOS_SEM_INDICE[tipo]))
+        consulta = MODELOS_POR_TIPO[tipo].objects.filter(filtro).order_by('-data_criacao', '-pk')
+        linhas += [(tipo, objeto.pk, _titulo(objeto), objeto.data_criacao, 0.0)
+                   for objeto in consulta[:deslocamento + limite]]
+    linhas.sort(key=lambda linha: linha[3], reverse=True)
+    return linhas[deslocamento:deslocamento + limite]
+
+
+def buscar(usuario_id, texto, tipos=None, pagina=1):
+    """
+    Resultados ranqueados e com trechos destacados do usuário.
+    Retorna (resultados, ha_proxima). tipos: subconjunto de IndiceBusca.TIPOS.
+    """
+    config = _config()
+    termos = _termos(texto)
+    if not termos:
+        return [], False
+
+    pagina = max(1, min(int(pagina or 1), config['MAX_PAGINAS']))
+    por_pagina = config['RESULTADOS_POR_PAGINA']
+    deslocamento = (pagina - 1) * por_pagina
+    validos = {tipo for tipo, _ in IndiceBusca.TIPOS}
+    tipos = [tipo for tipo in (tipos or []) if tipo in validos]
+
+    if connection.vendor == 'postgresql':
+        linhas = _buscar_postgres(usuario_id, termos, tipos, por_pagina + 1, deslocamento)
+    elif connection.vendor == 'sqlite':
+        linhas = _buscar_sqlite(usuario_id, termos, tipos, por_pagina + 1, deslocamento)
+    else:
+        linhas = _buscar_excertos(usuario_id, termos, tipos, por_pagina + 1, deslocamento)
+
+    ha_proxima = len(linhas) > por_pagina and pagina < config['MAX_PAGINAS']
+    return _com_trechos(usuario_id, linhas[:por_pagina], termos), ha_proxima
+
+
+# --------------------------------------------------------------------------------------
+# PACIENTES (SELETOR DOS FORMULÁRIOS)
+# Em vez de um <select> com todos os pacientes, os formulários consultam
+# pacientes/buscar/?q=. Cada termo casa com o início de uma palavra do nome
+# normalizado (sem acentos/maiúsculas): "jo sil" acha "João da Silva".
+# Índices: (usuario, nome_busca) e, no PostgreSQL, trigrama (migração 0017).
+# --------------------------------------------------------------------------------------
+def consulta_pacientes(usuario_id, texto, limite=None):
+    """QuerySet da busca (já fatiado); vazio sem termos."""
+    termos = normalizar_nome(texto).split()[:5]
+    if not termos:
+        return Paciente.objects.none()
+    limite = limite or _config()['MAX_PACIENTES']
+
+    filtro = Q(usuario_id=usuario_id)
+    for termo in termos:
+        filtro &= Q(nome_busca__startswith=termo) | Q(nome_busca__contains=f' {termo}')
+
+    # Quem começa com o texto digitado vem primeiro; depois ordem alfabética
+    return (Paciente.objects.filter(filtro)
+            .annotate(prioridade=Case(When(nome_busca__startswith=' '.join(termos), then=Value(0)),
+                                      default=Value(1), output_field=IntegerField()))
+            .only('id', 'nome_completo', 'data_nascimento')
+            .order_by('prioridade', 'nome_busca', 'id')[:limite])
+
+
+def buscar_pacientes(usuario_id, texto, limite=None):
+    return list(consulta_pacientes(usuario_id, texto, limite))
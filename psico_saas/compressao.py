@@ -0,0 +1,158 @@
+# psico_saas/compressao.py
+
+import base64
+import binascii
+import logging
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# COMPRESSÃO DOS TEXTOS LONGOS
+# Anotações e saídas da IA são as maiores colunas do banco. O
+# TextoComprimidoField grava o texto comprimido na mesma coluna TEXT, com um
+# cabeçalho curto:
+#     "\x1f" + algoritmo ("z" = zlib, "s" = zstd) + ":" + base64 dos bytes
+# Linhas antigas (texto puro, sem o cabeçalho) continuam legíveis, e textos
+# curtos ou que não diminuem ficam como estão.
+# A descompressão é preguiçosa: o valor vindo do banco fica no objeto como
+# foi gravado e só é descomprimido no primeiro acesso ao atributo (listas que
+# não leem o campo não pagam nada). Um save() que não mexeu no campo grava de
+# volta o mesmo valor, sem descomprimir/recomprimir.
+# .values()/.values_list() devolvem o valor gravado: passe por descomprimir().
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    # 'zlib' (biblioteca padrão) ou 'zstd' (requer o pacote zstandard)
+    'ALGORITMO': 'zlib',
+    'NIVEL': 6,
+    # Caracteres: abaixo disso cabeçalho + base64 não compensam
+    'TAMANHO_MINIMO': 512,
+}
+
+MARCADOR = '\x1f'
+CODIGOS = {'zlib': 'z', 'zstd': 's'}
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'COMPRESSAO_TEXTO', {}))
+    return config
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("Compressão zstd indisponível: instale o pacote zstandard.")
+    return zstandard
+
+
+def e_comprimido(valor):
+    return isinstance(valor, str) and valor[:1] == MARCADOR and valor[2:3] == ':'
+
+
+def comprimir(texto):
+    """Valor a gravar: o texto comprimido com o cabeçalho, ou o próprio texto quando não compensa."""
+    config = _config()
+    if (not config['HABILITADO'] or not isinstance(texto, str)
+            or len(texto) < config['TAMANHO_MINIMO'] or e_comprimido(texto)):
+        return texto
+    algoritmo = config['ALGORITMO']
+    if algoritmo not in CODIGOS:
+        raise ImproperlyConfigured(f"COMPRESSAO_TEXTO['ALGORITMO'] inválido: use {', '.join(CODIGOS)}.")
+
+    bruto = texto.encode('utf-8')
+    if algoritmo == 'zstd':
+        dados = _zstd().ZstdCompressor(level=config['NIVEL']).compress(bruto)
+    else:
+        dados = zlib.compress(bruto, config['NIVEL'])
+    gravado = f"{MARCADOR}{CODIGOS[algoritmo]}:{base64.b64encode(dados).decode('ascii')}"
+    return gravado if len(gravado) < len(bruto) else texto
+
+
+def descomprimir(valor):
+    """Texto original de um valor gravado (comprimido ou não)."""
+    if not e_comprimido(valor):
+        return valor
+    try:
+        dados = base64.b64decode(valor[3:])
+        if valor[1] == 's':
+            bruto = _zstd().ZstdDecompressor().decompress(dados)
+        else:
+            bruto = zlib.decompress(dados)
+    except (binascii.Error, zlib.error, ValueError):
+        # Não era um valor nosso (texto que por acaso começa com o marcador)
+        logger.warning("Valor com cabeçalho de compressão inválido; devolvido como está.")
+        return valor
+    return bruto.decode('utf-8')
+
+
+# --------------------------------------------------------------------------------------
+# CAMPO
+# --------------------------------------------------------------------------------------
+class DescritorTextoComprimido(DeferredAttribute):
+    """Descomprime no primeiro acesso e guarda o texto no objeto."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        valor = super().__get__(instance, cls)
+        if e_comprimido(valor):
+            valor = descomprimir(valor)
+            instance.__dict__[self.field.attname] = valor
+        return valor
+
+    # Descritor de dados: o __get__ roda mesmo com o valor já no __dict__
+    def __set__(self, instance, valor):
+        instance.__dict__[self.field.attname] = valor
+
+
+class TextoComprimidoField(models.TextField):
+    """TextField gravado comprimido (ver o cabeçalho do módulo)."""
+    descriptor_class = DescritorTextoComprimido
+
+    def pre_save(self, model_instance, add):
+        # Sem passar pelo descritor: campo não lido continua comprimido
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
+    def get_db_prep_save(self, value, connection):
+        # Só na gravação: filtros (icontains etc.) recebem o valor como veio
+        return super().get_db_prep_save(comprimir(value), connection)
+
+
+# --------------------------------------------------------------------------------------
+# CONVERSÃO DE TABELAS
+# --------------------------------------------------------------------------------------
+def converter_tabela(modelo, campos, converter, tamanho_lote=500, filtro=None):
+    """
+    Aplica `converter` (comprimir/descomprimir) aos valores gravados nos `campos`
+    (das linhas do `filtro`, se informado), em lotes por pk, cada lote na sua
+    transação. Usado pelo benchmark_compressao (a migração 0019 tem a sua cópia);
+    devolve o número de linhas alteradas.
+    """
+    ultimo_pk = 0
+    alteradas = 0
+    while True:
+        linhas = list(modelo.objects.filter(pk__gt=ultimo_pk, **(filtro or {})).order_by('pk')
+                      .values_list('pk', *campos)[:tamanho_lote])
+        if not linhas:
+            return alteradas
+        ultimo_pk = linhas[-1][0]
+
+        objetos = []
+        for pk, *valores in linhas:
+            novos = [converter(valor) for valor in valores]
+            if novos != valores:
+                objetos.append(modelo(pk=pk, **dict(zip(campos, novos))))
+        if objetos:
+            with transaction.atomic():
+                modelo.objects.bulk_update(objetos, campos)
+            alteradas += len(objetos)
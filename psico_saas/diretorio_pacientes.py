@@ -0,0 +1,109 @@
+# psico_saas/diretorio_pacientes.py
+
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Paciente, calcular_idade
+
+# ------------------------------------------------------------------
+# DIRETÓRIO DE PACIENTES EM CACHE
+# A lista de pacientes de um psicólogo muda pouco e é usada pelos
+# formulários (paciente já escolhido no seletor, lote de exercícios). O
+# diretório guarda só id, nome e idade, em ordem de nome, no cache por
+# usuário; dentro da requisição fica memorizado no próprio request, então
+# vários usos (view + template) custam no máximo uma leitura do cache.
+# Invalidação: signals de save/delete do Paciente (signals.py) apagam a
+# chave depois do commit; quem grava com bulk_create chama
+# invalidar_diretorio(). A data entra na chave para a idade virar no dia do
+# aniversário; o TTL cobre a corrida rara de uma leitura anterior ao commit
+# regravar o diretório antigo.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'ALIAS_CACHE': 'default',
+    'TTL_SEGUNDOS': 3600,
+}
+
+
+class ItemDiretorio(NamedTuple):
+    id: int
+    nome_completo: str
+    idade: object  # anos ou "N/D", como Paciente.get_idade()
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class DiretorioPacientes:
+    """Pacientes de um usuário em ordem de nome; get(pk) sem consultar o banco."""
+
+    def __init__(self, itens):
+        self.itens = itens
+        self._por_id = None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def get(self, pk):
+        if self._por_id is None:
+            self._por_id = {item.id: item for item in self.itens}
+        return self._por_id.get(pk)
+
+    def __contains__(self, pk):
+        return self.get(pk) is not None
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'DIRETORIO_PACIENTES', {}))
+    return config
+
+
+def _chave(usuario_id, hoje=None):
+    return f"pacientes:diretorio:{usuario_id}:{(hoje or timezone.localdate()).isoformat()}"
+
+
+def montar_diretorio(usuario_id):
+    """Consulta o banco: uma consulta só com as três colunas."""
+    hoje = timezone.localdate()
+    linhas = (Paciente.objects.filter(usuario_id=usuario_id).order_by('nome_completo', 'id')
+              .values_list('id', 'nome_completo', 'data_nascimento'))
+    return [ItemDiretorio(pk, nome, calcular_idade(nascimento, hoje)) for pk, nome, nascimento in linhas]
+
+
+def _itens(usuario_id):
+    config = _config()
+    if not config['HABILITADO']:
+        return montar_diretorio(usuario_id)
+
+    cache = caches[config['ALIAS_CACHE']]
+    itens = cache.get(_chave(usuario_id))
+    if itens is None:
+        itens = montar_diretorio(usuario_id)
+        cache.set(_chave(usuario_id), itens, timeout=config['TTL_SEGUNDOS'])
+    return itens
+
+
+def diretorio_pacientes(request):
+    """Diretório do usuário logado, memorizado na requisição."""
+    diretorio = getattr(request, '_diretorio_pacientes', None)
+    if diretorio is None:
+        diretorio = DiretorioPacientes(_itens(request.user.pk))
+        request._diretorio_pacientes = diretorio
+    return diretorio
+
+
+def invalidar_diretorio(usuario_id):
+    """Apaga o diretório do usuário quando a transação atual terminar."""
+    if usuario_id is None:
+        return
+    alias = _config()['ALIAS_CACHE']
+    transaction.on_commit(lambda: caches[alias].delete(_chave(usuario_id)))
@@ -0,0 +1,270 @@
+# psico_saas/exportacao.py
+
+import csv
+import datetime
+import json
+import logging
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .compressao import TextoComprimidoField, descomprimir
+from .models import Paciente, PlanoTratamento, DocumentacaoSessao, TarefaExercicios, ConteudoEducacional
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# EXPORTAÇÃO DOS DADOS (LGPD)
+# Todo o prontuário de um psicólogo (ou de um único paciente) em JSONL, CSV
+# ou num .zip com um CSV por seção + JSONL. Tudo é gerado sob demanda:
+# - as linhas vêm de .values_list() em blocos de TAMANHO_BLOCO por pk
+#   (keyset), nunca uma lista com a tabela inteira nem um cursor aberto entre
+#   um pedaço e outro;
+# - o site roda em ASGI: o StreamingHttpResponse recebe um iterador
+#   assíncrono que pede cada pedaço ao gerador com sync_to_async (um gerador
+#   síncrono seria juntado inteiro numa lista pelo Django antes do primeiro
+#   byte). O cabeçalho/manifesto sai antes da primeira consulta;
+# - o .zip é escrito num buffer que é esvaziado a cada bloco (zipfile aceita
+#   saída sem seek, com data descriptors).
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'TAMANHO_BLOCO': 2000,
+    # Bytes por pedaço enviado ao cliente (um envio por linha custaria uma troca de thread cada)
+    'TAMANHO_ENVIO': 64 * 1024,
+}
+
+FORMATOS = ('jsonl', 'csv', 'zip')
+
+# Campos internos que não fazem parte do prontuário
+CAMPOS_EXCLUIDOS = {'usuario', 'nome_busca', 'hash_revisao', 'snapshot_revisao',
+                    'abordagem_excerto', 'resumo_excerto', 'exercicio_excerto', 'conteudo_excerto'}
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'EXPORTACAO', {}))
+    return config
+
+
+class Secao:
+    def __init__(self, nome, modelo, filtro_usuario, filtro_paciente):
+        self.nome = nome
+        self.modelo = modelo
+        self.filtro_usuario = filtro_usuario
+        self.filtro_paciente = filtro_paciente
+        campos = [campo for campo in modelo._meta.concrete_fields if campo.name not in CAMPOS_EXCLUIDOS]
+        self.campos = [campo.attname for campo in campos]
+        # Posições dos textos gravados comprimidos (values_list devolve o valor da coluna)
+        self.comprimidos = [i for i, campo in enumerate(campos) if isinstance(campo, TextoComprimidoField)]
+
+    def consulta(self, usuario_id, paciente_id=None):
+        """None quando a seção não existe no escopo (ex: conteúdos não têm paciente)."""
+        if paciente_id is None:
+            filtro = {self.filtro_usuario: usuario_id}
+        elif self.filtro_paciente:
+            filtro = {self.filtro_paciente: paciente_id, self.filtro_usuario: usuario_id}
+        else:
+            return None
+        return self.modelo.objects.filter(**filtro).order_by('pk').values_list(*self.campos)
+
+
+SECOES = [
+    Secao('pacientes', Paciente, 'usuario_id', 'pk'),
+    Secao('planos', PlanoTratamento, 'usuario_id', 'paciente_id'),
+    Secao('documentacoes', DocumentacaoSessao, 'usuario_id', 'paciente_id'),
+    Secao('tarefas', TarefaExercicios, 'usuario_id', 'paciente_id'),
+    Secao('conteudos', ConteudoEducacional, 'usuario_id', None),
+]
+SECOES_POR_NOME = {secao.nome: secao for secao in SECOES}
+
+
+def _linhas(secao, usuario_id, paciente_id):
+    consulta = secao.consulta(usuario_id, paciente_id)
+    if consulta is None:
+        return
+    tamanho = _config()['TAMANHO_BLOCO']
+    posicao_pk = secao.campos.index(secao.modelo._meta.pk.attname)
+    ultimo_pk = None
+    while True:
+        bloco = consulta if ultimo_pk is None else consulta.filter(pk__gt=ultimo_pk)
+        linhas = list(bloco[:tamanho])
+        for linha in linhas:
+            if secao.comprimidos:
+                linha = list(linha)
+                for i in secao.comprimidos:
+                    linha[i] = descomprimir(linha[i])
+            yield linha
+        if len(linhas) < tamanho:
+            return
+        ultimo_pk = linhas[-1][posicao_pk]
+
+
+def _valor_csv(valor):
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+    return '' if valor is None else valor
+
+
+def _agrupar(partes, tamanho):
+    """Junta as linhas em pedaços de ~tamanho; a primeira (manifesto/cabeçalho) sai na hora."""
+    partes = iter(partes)
+    primeira = next(partes, None)
+    if primeira is not None:
+        yield primeira
+    pendente = []
+    acumulado = 0
+    for parte in partes:
+        pendente.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamanho:
+            yield ''.join(pendente)
+            pendente, acumulado = [], 0
+    if pendente:
+        yield ''.join(pendente)
+
+
+_FIM = object()
+
+
+async def em_partes_assincronas(partes):
+    """
+    Iterador assíncrono sobre um gerador síncrono: cada pedaço (e as consultas
+    que ele faz) vem de uma chamada sync_to_async, e o servidor ASGI o envia
+    antes de pedir o próximo.
+    """
+    partes = iter(partes)
+    try:
+        while True:
+            parte = await sync_to_async(next)(partes, _FIM)
+            if parte is _FIM:
+                return
+            yield parte
+    finally:
+        # Cliente desconectado no meio: encerra o gerador (e a consulta) na thread dele
+        if hasattr(partes, 'close'):
+            await sync_to_async(partes.close)()
+
+
+class _Eco:
+    """'Arquivo' cujo write devolve o que recebeu: csv.writer vira gerador de linhas."""
+
+    def write(self, valor):
+        return valor
+
+
+class _BufferZip:
+    """Saída sem seek para o ZipFile; o conteúdo é recolhido a cada bloco."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def recolher(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+# --------------------------------------------------------------------------------------
+# FORMATOS
+# --------------------------------------------------------------------------------------
+def _manifesto(usuario_id, paciente_id, secoes):
+    return {
+        'tipo': 'manifesto',
+        'gerado_em': timezone.now(),
+        'usuario_id': usuario_id,
+        'paciente_id': paciente_id,
+        'secoes': [secao.nome for secao in secoes
+                   if paciente_id is None or secao.filtro_paciente],
+    }
+
+
+def gerar_jsonl(usuario_id, paciente_id=None, secoes=None):
+    """Uma linha JSON por registro: {"tipo": <seção>, ...campos}; a 1ª linha é o manifesto."""
+    secoes = secoes or SECOES
+    yield json.dumps(_manifesto(usuario_id, paciente_id, secoes), cls=DjangoJSONEncoder) + '\n'
+    for secao in secoes:
+        for linha in _linhas(secao, usuario_id, paciente_id):
+            registro = {'tipo': secao.nome, **dict(zip(secao.campos, linha))}
+            yield json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def gerar_csv(secao, usuario_id, paciente_id=None):
+    """CSV de uma seção (separador ';' e BOM, para abrir direto no Excel)."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff' + escritor.writerow(secao.campos)
+    for linha in _linhas(secao, usuario_id, paciente_id):
+        yield escritor.writerow([_valor_csv(valor) for valor in linha])
+
+
+def gerar_zip(usuario_id, paciente_id=None):
+    """Pacote .zip: manifesto.json, um CSV por seção e dados.jsonl."""
+    return (parte for parte in _partes_zip(usuario_id, paciente_id) if parte)
+
+
+def _partes_zip(usuario_id, paciente_id):
+    buffer = _BufferZip()
+    tamanho_envio = _config()['TAMANHO_ENVIO']
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr('manifesto.json', json.dumps(
+            _manifesto(usuario_id, paciente_id, SECOES), cls=DjangoJSONEncoder, indent=2))
+        yield buffer.recolher()
+
+        arquivos = [(f'{secao.nome}.csv', gerar_csv(secao, usuario_id, paciente_id))
+                    for secao in SECOES if paciente_id is None or secao.filtro_paciente]
+        arquivos.append(('dados.jsonl', gerar_jsonl(usuario_id, paciente_id)))
+
+        for nome, partes in arquivos:
+            with pacote.open(nome, 'w', force_zip64=True) as destino:
+                for bloco in _agrupar(partes, tamanho_envio):
+                    destino.write(bloco.encode('utf-8'))
+                    yield buffer.recolher()
+            yield buffer.recolher()
+    # Diretório central, escrito ao fechar o ZipFile
+    yield buffer.recolher()
+
+
+def exportar(formato, usuario_id, paciente_id=None, secao=None):
+    """
+    (gerador, content_type, nome do arquivo) da exportação (a view o passa por
+    em_partes_assincronas; o comando exportar_dados o consome direto).
+    CSV é de uma seção só (secao=); ValueError para formato/seção inválidos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: use {', '.join(FORMATOS)}.")
+    if secao and secao not in SECOES_POR_NOME:
+        raise ValueError(f"Seção inválida: use {', '.join(SECOES_POR_NOME)}.")
+    tamanho_envio = _config()['TAMANHO_ENVIO']
+    escopo = f"paciente{paciente_id}" if paciente_id else f"usuario{usuario_id}"
+    data = timezone.localdate().isoformat()
+    logger.info("Exportação LGPD: usuário %s, paciente %s, formato %s, seção %s",
+                usuario_id, paciente_id, formato, secao or '-')
+
+    if formato == 'jsonl':
+        secoes = [SECOES_POR_NOME[secao]] if secao else None
+        return (_agrupar(gerar_jsonl(usuario_id, paciente_id, secoes), tamanho_envio), 'application/x-ndjson',
+                f'psico_{escopo}_{data}.jsonl')
+    if formato == 'csv':
+        if not secao:
+            raise ValueError(f"Informe a seção do CSV: {', '.join(SECOES_POR_NOME)}.")
+        return (_agrupar(gerar_csv(SECOES_POR_NOME[secao], usuario_id, paciente_id), tamanho_envio),
+                'text/csv; charset=utf-8',
+                f'psico_{escopo}_{secao}_{data}.csv')
+    return gerar_zip(usuario_id, paciente_id), 'application/zip', f'psico_{escopo}_{data}.zip'
@@ -0,0 +1,151 @@
+# psico_saas/ia_cache.py
+
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import CacheCompletionIA
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# CACHE DE COMPLETIONS DA IA
+# Camada 1: LRU em memória com TTL (por processo, cachetools.TTLCache)
+# Camada 2: tabela CacheCompletionIA (compartilhada entre web e worker)
+# A chave é o SHA-256 de modelo + mensagens + parâmetros de amostragem.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'TTL_SEGUNDOS': 7 * 24 * 3600,
+    'MAX_ITENS_MEMORIA': 512,
+    # Endpoints que nunca usam o cache (ex: anotações de sessão são únicas)
+    'ENDPOINTS_DESATIVADOS': [],
+}
+
+# Prompts com dados de paciente nunca vão para o cache, qualquer que seja a
+# configuração: anotações de sessão (e seus blocos), exercícios (detalhes de
+# personalização, idade, sexo) e revisões de plano (diagnóstico). A tabela não
+# acompanha a exclusão do paciente nem entra na exportação LGPD
+PREFIXOS_SEM_CACHE = ('documentacao', 'tarefa', 'plano')
+
+_lock = threading.RLock()
+_memoria = None
+_contadores = Counter()
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_CACHE', {}))
+    return config
+
+
+def _cache_memoria():
+    global _memoria
+    with _lock:
+        if _memoria is None:
+            config = _config()
+            _memoria = TTLCache(maxsize=config['MAX_ITENS_MEMORIA'],
+                                ttl=config['TTL_SEGUNDOS'])
+        return _memoria
+
+
+def cache_habilitado(endpoint):
+    config = _config()
+    return (config['HABILITADO'] and endpoint not in config['ENDPOINTS_DESATIVADOS']
+            and not endpoint.startswith(PREFIXOS_SEM_CACHE))
+
+
+def chave_completion(model, messages, params):
+    """Hash estável da requisição: mesma entrada -> mesma chave."""
+    bruto = json.dumps(
+        {'model': model, 'messages': messages, 'params': params},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+def obter(chave):
+    """Retorna o texto em cache ou None (miss)."""
+    memoria = _cache_memoria()
+    with _lock:
+        texto = memoria.get(chave)
+    if texto is not None:
+        _contadores['hits_memoria'] += 1
+        return texto
+
+    registro = (CacheCompletionIA.objects
+                .filter(chave=chave, expira_em__gt=timezone.now())
+                .values_list('resposta', flat=True)
+                .first())
+    if registro is None:
+        _contadores['misses'] += 1
+        return None
+
+    CacheCompletionIA.objects.filter(chave=chave).update(acessos=F('acessos') + 1)
+    with _lock:
+        memoria[chave] = registro
+    _contadores['hits_banco'] += 1
+    return registro
+
+
+def gravar(endpoint, chave, model, texto):
+    if not texto:
+        return
+
+    with _lock:
+        _cache_memoria()[chave] = texto
+
+    try:
+        CacheCompletionIA.objects.update_or_create(
+            chave=chave,
+            defaults={
+                'endpoint': endpoint,
+                'modelo': model,
+                'resposta': texto,
+                'expira_em': timezone.now() + timedelta(seconds=_config()['TTL_SEGUNDOS']),
+            },
+        )
+    except Exception:
+        # O cache nunca deve derrubar a geração
+        logger.exception("Falha ao gravar completion no cache")
+    _contadores['gravacoes'] += 1
+
+
+def limpar_expirados():
+    removidos, _ = CacheCompletionIA.objects.filter(expira_em__lte=timezone.now()).delete()
+    return removidos
+
+
+def limpar():
+    """Esvazia as duas camadas do cache."""
+    with _lock:
+        _cache_memoria().clear()
+    CacheCompletionIA.objects.all().delete()
+
+
+def estatisticas():
+    """Contadores deste processo + totais persistidos no banco."""
+    memoria = _cache_memoria()
+    hits = _contadores['hits_memoria'] + _contadores['hits_banco']
+    consultas = hits + _contadores['misses']
+    totais = CacheCompletionIA.objects.aggregate(acessos=Sum('acessos'))
+
+    return {
+        'hits_memoria': _contadores['hits_memoria'],
+        'hits_banco': _contadores['hits_banco'],
+        'misses': _contadores['misses'],
+        'gravacoes': _contadores['gravacoes'],
+        'taxa_acerto': round(hits / consultas, 4) if consultas else None,
+        'itens_memoria': len(memoria),
+        'capacidade_memoria': memoria.maxsize,
+        'itens_banco': CacheCompletionIA.objects.count(),
+        'acessos_banco_total': totais['acessos'] or 0,
+    }
@@ -0,0 +1,114 @@
+# psico_saas/ia_client.py
+
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from django.conf import settings
+
+# ------------------------------------------------------------------
+# CLIENTE OPENAI COMPARTILHADO
+# Um único cliente por processo, criado na primeira chamada, com pool de
+# conexões httpx explícito (keep-alive) para reaproveitar conexões TLS.
+# Seguro com gunicorn --preload: após o fork cada worker cria o seu.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'MAX_CONEXOES': 20,
+    'MAX_CONEXOES_KEEPALIVE': 10,
+    'KEEPALIVE_SEGUNDOS': 30,
+    'TIMEOUT_CONEXAO': 5.0,
+    'TIMEOUT_LEITURA': 60.0,
+    'TIMEOUT_POOL': 5.0,
+    # Repetições com backoff e prazo ficam em psico_saas/ia_latencia.py
+    'MAX_RETRIES': 0,
+}
+
+_lock = threading.Lock()
+_cliente = None
+_pid = None
+# Clientes assíncronos ficam presos ao event loop em que foram criados
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_CLIENTE', {}))
+    return config
+
+
+def _parametros_http(config):
+    return {
+        'limits': httpx.Limits(
+            max_connections=config['MAX_CONEXOES'],
+            max_keepalive_connections=config['MAX_CONEXOES_KEEPALIVE'],
+            keepalive_expiry=config['KEEPALIVE_SEGUNDOS'],
+        ),
+        'timeout': httpx.Timeout(
+            connect=config['TIMEOUT_CONEXAO'],
+            read=config['TIMEOUT_LEITURA'],
+            write=config['TIMEOUT_CONEXAO'],
+            pool=config['TIMEOUT_POOL'],
+        ),
+    }
+
+
+def _parametros_openai(config):
+    parametros = {
+        'api_key': settings.OPENAI_API_KEY,
+        'max_retries': config['MAX_RETRIES'],
+    }
+    base_url = getattr(settings, 'OPENAI_BASE_URL', None)
+    if base_url:
+        parametros['base_url'] = base_url
+    return parametros
+
+
+def obter_cliente():
+    """Retorna o cliente OpenAI síncrono do processo atual."""
+    global _cliente, _pid
+
+    pid = os.getpid()
+    if _cliente is None or _pid != pid:
+        with _lock:
+            if _cliente is None or _pid != pid:
+                config = _config()
+                _cliente = OpenAI(
+                    http_client=httpx.Client(**_parametros_http(config)),
+                    **_parametros_openai(config),
+                )
+                _pid = pid
+    return _cliente
+
+
+def obter_cliente_async():
+    """Retorna o cliente AsyncOpenAI do event loop atual (streaming)."""
+    loop = asyncio.get_running_loop()
+    pid = os.getpid()
+
+    with _lock:
+        registro = _clientes_async.get(loop)
+        if registro is None or registro[0] != pid:
+            config = _config()
+            cliente = AsyncOpenAI(
+                http_client=httpx.AsyncClient(**_parametros_http(config)),
+                **_parametros_openai(config),
+            )
+            registro = (pid, cliente)
+            _clientes_async[loop] = registro
+    return registro[1]
+
+
+def _descartar_apos_fork():
+    # As conexões herdadas pertencem ao processo pai: não fechar, só esquecer
+    global _lock, _cliente, _pid, _clientes_async
+    _lock = threading.Lock()
+    _cliente = None
+    _pid = None
+    _clientes_async = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_descartar_apos_fork)
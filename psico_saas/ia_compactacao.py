@@ -0,0 +1,239 @@
+# psico_saas/ia_compactacao.py
+
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .ia_limites import simultaneas_por_usuario, submeter_no_contexto
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# COMPACTAÇÃO DAS ANOTAÇÕES ANTES DO PROMPT
+# 1. Normaliza espaços e remove vícios de fala repetidos da transcrição
+# 2. Conta tokens (tiktoken; sem ele, estimativa por caracteres)
+# 3. Acima do orçamento do modelo, divide nas trocas de falante, analisa
+#    os blocos em paralelo (map) e a chamada final consolida as análises
+#    parciais no JSON da documentação (reduce)
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    # Tokens máximos das anotações dentro do prompt, por modelo
+    'ORCAMENTO_TOKENS': {
+        'gpt-3.5-turbo-1106': 6000,
+        'gpt-3.5-turbo': 3000,
+    },
+    'ORCAMENTO_PADRAO': 3000,
+    'TOKENS_POR_BLOCO': 2000,
+    'MODELO_RESUMO': 'gpt-3.5-turbo-1106',
+    'MAX_TOKENS_RESUMO_BLOCO': 400,
+    # Blocos analisados ao mesmo tempo
+    'MAX_PARALELO': 6,
+    # Níveis de reduce antes de desistir e truncar
+    'MAX_NIVEIS': 3,
+}
+
+# Média observada em português com cl100k_base
+CARACTERES_POR_TOKEN = 3.6
+
+# Interjeições de transcrição que não carregam conteúdo clínico
+VICIOS_FALA = re.compile(
+    r'(?<!\w)(?:h+u+m+|h+m+|a+h+n+|h+ã+|é+h+|u+h+u+m+|ã+h+)[.,!?…]*(?!\w)\s*',
+    re.IGNORECASE,
+)
+# Gagueira de transcrição: "eu eu eu acho" -> "eu acho". Só a partir de três
+# repetições e só palavras: "não, não", "muito muito" e "10 10 10" são conteúdo
+PALAVRA_REPETIDA = re.compile(r'\b([^\W\d_]+)(?:[ \t,]+\1\b){2,}', re.IGNORECASE)
+ESPACOS = re.compile(r'[ \t\u00a0]+')
+LINHAS_VAZIAS = re.compile(r'\n{3,}')
+FIM_FRASE = re.compile(r'(?<=[.!?…])\s+')
+# Início de fala: "[00:12:03] Paciente:", "T:", "Dra. Ana:"
+TROCA_FALANTE = re.compile(
+    r'^(?:\[?\d{1,2}:\d{2}(?::\d{2})?\]?\s*)?[A-ZÀ-Ý][\wÀ-ÿ. ]{0,30}:\s', re.MULTILINE)
+
+_lock = threading.Lock()
+_codificadores = {}
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_COMPACTACAO', {}))
+    return config
+
+
+def _codificador(model):
+    # None quando o tiktoken não está instalado ou não conseguiu baixar o vocabulário
+    with _lock:
+        if model not in _codificadores:
+            try:
+                import tiktoken
+                try:
+                    _codificadores[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _codificadores[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                logger.warning("tiktoken indisponível (%s); usando estimativa de tokens", e)
+                _codificadores[model] = None
+        return _codificadores[model]
+
+
+def contar_tokens(texto, model):
+    if not texto:
+        return 0
+    codificador = _codificador(model)
+    if codificador is None:
+        return int(len(texto) / CARACTERES_POR_TOKEN) + 1
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def orcamento_tokens(model):
+    config = _config()
+    return config['ORCAMENTO_TOKENS'].get(model, config['ORCAMENTO_PADRAO'])
+
+
+def normalizar_anotacoes(texto):
+    """Limpeza sem perda de conteúdo: espaços, vícios de fala e linhas duplicadas."""
+    texto = (texto or '').replace('\r\n', '\n').replace('\r', '\n')
+    texto = VICIOS_FALA.sub('', texto)
+    texto = PALAVRA_REPETIDA.sub(r'\1', texto)
+
+    linhas = []
+    for linha in texto.split('\n'):
+        linha = ESPACOS.sub(' ', linha).strip()
+        # Transcrições automáticas costumam repetir a mesma linha
+        if linha and linhas and linha == linhas[-1]:
+            continue
+        linhas.append(linha)
+
+    return LINHAS_VAZIAS.sub('\n\n', '\n'.join(linhas)).strip()
+
+
+def _unidades(texto):
+    """Falas inteiras quando a transcrição marca o falante; senão, parágrafos."""
+    inicios = [m.start() for m in TROCA_FALANTE.finditer(texto)]
+    if len(inicios) < 2:
+        return texto.split('\n\n')
+
+    if inicios[0] > 0:
+        inicios.insert(0, 0)
+    return [texto[a:b].strip() for a, b in zip(inicios, inicios[1:] + [len(texto)])]
+
+
+def dividir_em_blocos(texto, model, tokens_por_bloco):
+    """Agrupa falas (ou parágrafos) inteiras em blocos de até 'tokens_por_bloco'."""
+    unidades = []
+    for unidade in _unidades(texto):
+        if contar_tokens(unidade, model) <= tokens_por_bloco:
+            unidades.append(unidade)
+        else:
+            # Fala/parágrafo gigante (transcrição sem quebras): divide por frases
+            unidades.extend(FIM_FRASE.split(unidade))
+
+    blocos, atual, tokens_atual = [], [], 0
+    for unidade in unidades:
+        tokens = contar_tokens(unidade, model)
+        if atual and tokens_atual + tokens > tokens_por_bloco:
+            blocos.append('\n\n'.join(atual))
+            atual, tokens_atual = [], 0
+        atual.append(unidade)
+        tokens_atual += tokens
+    if atual:
+        blocos.append('\n\n'.join(atual))
+    return blocos
+
+
+def _analisar_bloco(bloco, indice, total):
+    # Import local: ia_service importa este módulo
+    from .ia_service import _completar_chat
+
+    config = _config()
+    prompt = f"""
+        Trecho {indice} de {total} das anotações de uma sessão de psicoterapia.
+        Analise SOMENTE este trecho e responda em JSON com as chaves EXATAS:
+        resumo (queixas, sintomas, eventos relevantes e intervenções do terapeuta),
+        indicios_diagnosticos (sinais compatíveis com CID-10/DSM-5 observados no trecho) e
+        padroes_linguagem (padrões de fala do paciente, com falas literais marcantes entre aspas).
+
+        Trecho:
+        {bloco}
+        """
+    try:
+        return _completar_chat(
+            "documentacao_bloco",
+            config['MODELO_RESUMO'],
+            [
+                {"role": "system", "content": "Você deve responder apenas com um objeto JSON válido."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=config['MAX_TOKENS_RESUMO_BLOCO'],
+            response_format={"type": "json_object"}
+        )
+    finally:
+        # Cada thread abre a própria conexão (cache de completions)
+        connection.close()
+
+
+def _parcial_compacta(texto):
+    # JSON sem indentação ocupa menos tokens no reduce
+    try:
+        return json.dumps(json.loads(texto), ensure_ascii=False, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return texto
+
+
+def _mapear(blocos):
+    """Analisa os blocos em paralelo; o tempo total acompanha o bloco mais lento."""
+    total = len(blocos)
+    max_paralelo = min(_config()['MAX_PARALELO'], total,
+                       simultaneas_por_usuario('documentacao_bloco') or total)
+    with ThreadPoolExecutor(max_workers=max(1, max_paralelo)) as executor:
+        # As threads levam o contexto do job (usuário): os limites por usuário valem nos blocos
+        futuros = [submeter_no_contexto(executor, _analisar_bloco, bloco, indice, total)
+                   for indice, bloco in enumerate(blocos, 1)]
+        return [_parcial_compacta(futuro.result()) for futuro in futuros]
+
+
+def _map_reduce(texto, model):
+    config = _config()
+    orcamento = orcamento_tokens(model)
+
+    # Se as análises parciais ainda não couberem, elas viram a entrada do próximo nível
+    for _ in range(config['MAX_NIVEIS']):
+        blocos = dividir_em_blocos(texto, model, config['TOKENS_POR_BLOCO'])
+        parciais = _mapear(blocos)
+        texto = '\n\n'.join(f"[Parte {i}] {parcial}" for i, parcial in enumerate(parciais, 1))
+        if contar_tokens(texto, model) <= orcamento:
+            return texto
+
+    # Ainda acima do orçamento: corta no limite para não estourar o contexto
+    codificador = _codificador(model)
+    if codificador is None:
+        return texto[:int(orcamento * CARACTERES_POR_TOKEN)]
+    return codificador.decode(codificador.encode(texto, disallowed_special=())[:orcamento])
+
+
+def compactar_anotacoes(texto, model):
+    """
+    Retorna {'texto', 'tokens_originais', 'tokens_compactados', 'resumido'}
+    com as anotações prontas para entrar no prompt de 'model'. Com
+    resumido=True, 'texto' traz as análises parciais de cada parte.
+    """
+    tokens_originais = contar_tokens(texto, model)
+    compactado = normalizar_anotacoes(texto)
+    resumido = False
+
+    if contar_tokens(compactado, model) > orcamento_tokens(model):
+        compactado = _map_reduce(compactado, model)
+        resumido = True
+
+    return {
+        'texto': compactado,
+        'tokens_originais': tokens_originais,
+        'tokens_compactados': contar_tokens(compactado, model),
+        'resumido': resumido,
+    }
@@ -0,0 +1,210 @@
+# psico_saas/ia_jobs.py
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ia_service
+from .compressao import descomprimir
+from .ia_limites import contexto_usuario, LimiteIAExcedido
+from .ia_lote import processar_lote_tarefas
+from .models import (JobIA, PlanoTratamento, DocumentacaoSessao,
+                     TarefaExercicios, ConteudoEducacional)
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# REGISTRO DOS TIPOS DE JOB
+# tipo -> (modelo, função geradora, campos devolvidos ao frontend)
+# ------------------------------------------------------------------
+GERADORES = {
+    'PLANO_REVISAO': (PlanoTratamento, ia_service.gerar_feedback_plano,
+                      ['feedback_ia']),
+    'DOCUMENTACAO': (DocumentacaoSessao, ia_service.gerar_documentacao_sessao,
+                     ['resumo_ia', 'sugestao_diagnostico', 'padroes_linguagem']),
+    'TAREFA': (TarefaExercicios, ia_service.gerar_exercicio_tarefa,
+               ['exercicio_ia']),
+    'CONTEUDO': (ConteudoEducacional, ia_service.gerar_conteudo_educacional,
+                 ['conteudo_gerado', 'sugestoes_titulos', 'hashtags', 'sugestoes_imagens']),
+}
+
+# Jobs em lote: não apontam para um registro; a função recebe o próprio job
+# e grava o relatório em job.resultado.
+PROCESSADORES_LOTE = {
+    'LOTE_TAREFAS': processar_lote_tarefas,
+}
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def enfileirar_job_ia(usuario, tipo, objeto=None, parametros=None):
+    """
+    Cria um job PENDENTE para preencher os campos de IA de 'objeto'
+    (jobs em lote passam só 'parametros').
+    Com IA_JOBS_SINCRONOS=True (desenvolvimento sem worker) o job roda na hora.
+    """
+    job = JobIA.objects.create(
+        usuario=usuario,
+        tipo=tipo,
+        objeto_id=objeto.pk if objeto is not None else None,
+        parametros=parametros or {},
+    )
+
+    if _config('IA_JOBS_SINCRONOS', False):
+        job.status = 'PROCESSANDO'
+        job.tentativas = 1
+        job.data_inicio = timezone.now()
+        job.save(update_fields=['status', 'tentativas', 'data_inicio'])
+        processar_job(job)
+
+    return job
+
+
+def reservar_proximo_job():
+    """
+    Reserva o job pendente mais antigo. SKIP LOCKED permite vários workers
+    consumindo a mesma tabela sem pegar o mesmo job.
+    """
+    with transaction.atomic():
+        job = (JobIA.objects
+               .select_for_update(skip_locked=True)
+               .filter(status='PENDENTE')
+               .order_by('data_criacao')
+               .first())
+        if job is None:
+            return None
+
+        job.status = 'PROCESSANDO'
+        job.tentativas += 1
+        job.data_inicio = timezone.now()
+        job.save(update_fields=['status', 'tentativas', 'data_inicio'])
+        return job
+
+
+def processar_job(job):
+    """Executa a geração de um job já reservado e grava o resultado."""
+    if job.tipo in PROCESSADORES_LOTE:
+        return _processar_lote(job)
+
+    modelo, gerador, _ = GERADORES[job.tipo]
+
+    try:
+        objeto = modelo.objects.get(pk=job.objeto_id, usuario_id=job.usuario_id)
+        with _contexto_do_job(job):
+            gerador(objeto)
+    except modelo.DoesNotExist:
+        _finalizar(job, 'ERRO', "O registro associado não existe mais.")
+    except LimiteIAExcedido as e:
+        _sem_vaga(job, e)
+    except ia_service.ErroIA as e:
+        _registrar_falha(job, str(e))
+    except Exception as e:
+        logger.exception("Falha inesperada no job de IA %s", job.pk)
+        _registrar_falha(job, f"Erro de processamento: {e}")
+    else:
+        _finalizar(job, 'CONCLUIDO')
+
+    return job
+
+
+def _processar_lote(job):
+    # Um lote não é repetido: os itens que falharam ficam listados no resultado
+    try:
+        with _contexto_do_job(job):
+            PROCESSADORES_LOTE[job.tipo](job)
+    except LimiteIAExcedido as e:
+        _sem_vaga(job, e)
+    except ia_service.ErroIA as e:
+        _finalizar(job, 'ERRO', str(e))
+    except Exception as e:
+        logger.exception("Falha inesperada no lote de IA %s", job.pk)
+        _finalizar(job, 'ERRO', f"Erro de processamento: {e}")
+    else:
+        _finalizar(job, 'CONCLUIDO')
+
+    return job
+
+
+def _contexto_do_job(job):
+    # Limite de chamadas simultâneas por usuário (ia_limites.py)
+    # (no modo síncrono a requisição web não fica esperando vaga)
+    return contexto_usuario(job.usuario_id, esperar=0 if _config('IA_JOBS_SINCRONOS', False) else None)
+
+
+def _sem_vaga(job, erro):
+    if _config('IA_JOBS_SINCRONOS', False):
+        _finalizar(job, 'ERRO', str(erro))
+    else:
+        # Sem vaga não é falha do job: volta para a fila sem gastar tentativa
+        job.tentativas = max(0, job.tentativas - 1)
+        job.save(update_fields=['tentativas'])
+        _finalizar(job, 'PENDENTE', str(erro))
+
+
+def _registrar_falha(job, mensagem):
+    # Volta para a fila enquanto houver tentativas; depois disso fica em ERRO
+    if job.tentativas < _config('IA_JOBS_MAX_TENTATIVAS', 3) and not _config('IA_JOBS_SINCRONOS', False):
+        _finalizar(job, 'PENDENTE', mensagem)
+    else:
+        _finalizar(job, 'ERRO', mensagem)
+
+
+def _finalizar(job, status, erro=None):
+    job.status = status
+    job.erro = erro
+    if status in ('CONCLUIDO', 'ERRO'):
+        job.data_conclusao = timezone.now()
+    job.save(update_fields=['status', 'erro', 'data_conclusao'])
+
+
+def liberar_jobs_travados():
+    """
+    Devolve à fila jobs que ficaram em PROCESSANDO além do tempo limite
+    (ex: worker reiniciado no meio da chamada). Quem já gastou todas as
+    tentativas fica em ERRO: um job que derruba o worker (falta de memória,
+    falha no cliente) não volta para a fila para sempre.
+    """
+    limite = timezone.now() - timedelta(
+        seconds=_config('IA_JOBS_TIMEOUT_SEGUNDOS', 300))
+    travados = JobIA.objects.filter(status='PROCESSANDO', data_inicio__lt=limite)
+    max_tentativas = _config('IA_JOBS_MAX_TENTATIVAS', 3)
+
+    esgotados = travados.filter(tentativas__gte=max_tentativas).update(
+        status='ERRO', data_conclusao=timezone.now(),
+        erro=f"O processamento foi interrompido {max_tentativas} vez(es) (worker reiniciado ou travado).")
+    if esgotados:
+        logger.warning("%s job(s) de IA travado(s) sem tentativas restantes marcados como ERRO", esgotados)
+
+    return travados.filter(tentativas__lt=max_tentativas).update(status='PENDENTE')
+
+
+def status_job(job):
+    """Dicionário usado pelos endpoints de polling."""
+    dados = {
+        'id': job.pk,
+        'tipo': job.tipo,
+        'status': job.status,
+        'objeto_id': job.objeto_id,
+        'erro': job.erro if job.status == 'ERRO' else None,
+    }
+
+    if job.tipo in PROCESSADORES_LOTE:
+        dados.update({
+            'progresso_total': job.progresso_total,
+            'progresso_concluido': job.progresso_concluido,
+            'resultado': job.resultado,
+        })
+        return dados
+
+    if job.status == 'CONCLUIDO':
+        modelo, _, campos = GERADORES[job.tipo]
+        objeto = modelo.objects.filter(pk=job.objeto_id).values(*campos).first()
+        # values() devolve o valor gravado (textos longos comprimidos)
+        dados.update({campo: descomprimir((objeto or {}).get(campo)) or '' for campo in campos})
+
+    return dados
@@ -0,0 +1,167 @@
+# psico_saas/ia_latencia.py
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+from django.conf import settings
+from tenacity import (Retrying, retry_if_exception, stop_after_attempt,
+                      stop_before_delay, wait_random_exponential)
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# ORÇAMENTO DE LATÊNCIA DAS CHAMADAS À IA
+# Cada endpoint tem um prazo total. Dentro dele:
+# - se a tentativa passa do p95 recente do endpoint, uma segunda requisição
+#   (hedge) é disparada e vale a primeira resposta que chegar;
+# - falhas transitórias são repetidas com backoff exponencial com jitter;
+# - estourado o prazo, a chamada falha na hora (PrazoIAEsgotado).
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'PRAZO_PADRAO_SEGUNDOS': 30.0,
+    # Prazo total por endpoint (tarefa, conteudo, documentacao, plano_revisao)
+    'PRAZOS_SEGUNDOS': {},
+    'HEDGE_HABILITADO': True,
+    # Antes de haver amostras suficientes para o p95
+    'HEDGE_INICIAL_SEGUNDOS': 8.0,
+    'HEDGE_MINIMO_SEGUNDOS': 1.0,
+    'AMOSTRAS_P95': 200,
+    'AMOSTRAS_MINIMAS': 20,
+    'TENTATIVAS': 3,
+    'BACKOFF_BASE_SEGUNDOS': 0.5,
+    'BACKOFF_MAX_SEGUNDOS': 4.0,
+    # Threads compartilhadas pelas chamadas (tentativa principal + hedge)
+    'MAX_THREADS': 32,
+}
+
+ERROS_TRANSITORIOS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_lock = threading.Lock()
+_latencias = defaultdict(lambda: deque(maxlen=_config()['AMOSTRAS_P95']))
+_executor = None
+
+
+class PrazoIAEsgotado(Exception):
+    """A chamada não terminou dentro do prazo do endpoint."""
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_LATENCIA', {}))
+    return config
+
+
+def _obter_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_config()['MAX_THREADS'], thread_name_prefix='ia-latencia')
+        return _executor
+
+
+def prazo_endpoint(endpoint):
+    config = _config()
+    return float(config['PRAZOS_SEGUNDOS'].get(endpoint, config['PRAZO_PADRAO_SEGUNDOS']))
+
+
+def registrar_latencia(endpoint, segundos):
+    with _lock:
+        _latencias[endpoint].append(segundos)
+
+
+def p95(endpoint):
+    """p95 das últimas chamadas bem-sucedidas do endpoint (None sem amostras suficientes)."""
+    with _lock:
+        amostras = sorted(_latencias[endpoint])
+    if len(amostras) < _config()['AMOSTRAS_MINIMAS']:
+        return None
+    return amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))]
+
+
+def _atraso_hedge(endpoint):
+    config = _config()
+    valor = p95(endpoint)
+    if valor is None:
+        valor = config['HEDGE_INICIAL_SEGUNDOS']
+    return max(config['HEDGE_MINIMO_SEGUNDOS'], valor)
+
+
+def _tentativa(endpoint, chamada, limite):
+    """
+    Uma tentativa com hedge. 'chamada(timeout)' faz a requisição HTTP e deve
+    respeitar o timeout recebido (as threads perdedoras não são interrompidas).
+    """
+    restante = limite - time.monotonic()
+    if restante <= 0:
+        raise PrazoIAEsgotado()
+
+    executor = _obter_executor()
+    inicio = time.monotonic()
+    pendentes = {executor.submit(chamada, restante)}
+
+    if _config()['HEDGE_HABILITADO']:
+        atraso = _atraso_hedge(endpoint)
+        if atraso < restante:
+            prontos, _ = wait(pendentes, timeout=atraso, return_when=FIRST_COMPLETED)
+            if not prontos:
+                logger.info("Hedge disparado para '%s' após %.1fs", endpoint, atraso)
+                pendentes.add(executor.submit(chamada, limite - time.monotonic()))
+
+    ultimo_erro = None
+    while pendentes:
+        prontos, pendentes = wait(pendentes, timeout=max(0, limite - time.monotonic()),
+                                  return_when=FIRST_COMPLETED)
+        if not prontos:
+            raise PrazoIAEsgotado()
+
+        for futuro in prontos:
+            erro = futuro.exception()
+            if erro is None:
+                registrar_latencia(endpoint, time.monotonic() - inicio)
+                return futuro.result()
+            ultimo_erro = erro
+
+    raise ultimo_erro
+
+
+def executar_com_orcamento(endpoint, chamada):
+    """
+    Executa 'chamada(timeout)' dentro do prazo do endpoint, com hedge e
+    repetição das falhas transitórias. Levanta PrazoIAEsgotado ou o erro da API.
+    """
+    config = _config()
+    prazo = prazo_endpoint(endpoint)
+    limite = time.monotonic() + prazo
+
+    for tentativa in Retrying(
+        # Não espera o backoff se a próxima tentativa já começaria fora do prazo
+        stop=stop_after_attempt(config['TENTATIVAS']) | stop_before_delay(prazo),
+        wait=wait_random_exponential(multiplier=config['BACKOFF_BASE_SEGUNDOS'],
+                                     max=config['BACKOFF_MAX_SEGUNDOS']),
+        retry=retry_if_exception(lambda e: isinstance(e, ERROS_TRANSITORIOS)),
+        reraise=True,
+    ):
+        with tentativa:
+            return _tentativa(endpoint, chamada, limite)
+
+
+def _descartar_apos_fork():
+    # As threads do executor não existem no processo filho
+    global _lock, _executor
+    _lock = threading.Lock()
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_descartar_apos_fork)
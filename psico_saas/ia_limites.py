@@ -0,0 +1,246 @@
+# psico_saas/ia_limites.py
+
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from django.conf import settings
+from django.core.cache import caches
+
+# ------------------------------------------------------------------
+# LIMITES DE USO DA IA (POR USUÁRIO E GLOBAL)
+# Estado no cache do Django (CACHES['ia_limites'], compartilhado entre os
+# processos web e worker e sem cull, que apagaria vagas ocupadas):
+# - cota: token bucket por usuário/endpoint, consumida a cada pedido;
+# - vagas: semáforo de chamadas simultâneas por usuário e global, feito com
+#   chaves "vaga" criadas com cache.add (atômico) e com prazo de validade,
+#   para que um processo que morra não prenda a vaga para sempre.
+# Quem passa do limite recebe LimiteIAExcedido na hora, com o tempo sugerido
+# para tentar de novo. O worker espera um pouco por uma vaga antes de desistir.
+# O usuário da geração fica num ContextVar, que threads de um pool não herdam:
+# quem paraleliza chamadas à IA submete com submeter_no_contexto().
+# Um lote (ia_lote.py) ocupa uma única vaga do usuário enquanto roda
+# (vaga_de_lote); as chamadas dentro dele ocupam só vagas globais.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'ALIAS_CACHE': 'default',
+    'PADRAO': {
+        'POR_USUARIO_SIMULTANEAS': 2,
+        'GLOBAL_SIMULTANEAS': 16,
+        'POR_USUARIO_POR_MINUTO': 10,
+        # Capacidade do balde: pedidos seguidos permitidos antes de limitar
+        'RAJADA': 4,
+    },
+    # Sobrescritas por endpoint (tarefa, conteudo, documentacao, plano_revisao, ...)
+    'ENDPOINTS': {},
+    # Quanto uma vaga dura se não for liberada (processo morto)
+    'VALIDADE_VAGA_SEGUNDOS': 120,
+    # Espera máxima por vaga fora das requisições web (worker)
+    'ESPERA_SEGUNDOS': 20.0,
+}
+
+# Usuário dono da geração em andamento (definido pelo worker a cada job)
+_contexto = ContextVar('ia_limites_contexto', default=None)
+
+
+class LimiteIAExcedido(Exception):
+    """Limite de uso da IA atingido; 'tentar_em' sugere quantos segundos esperar."""
+
+    def __init__(self, mensagem, tentar_em=1):
+        super().__init__(mensagem)
+        self.tentar_em = max(1, int(tentar_em + 0.999))
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_LIMITES', {}))
+    return config
+
+
+def _limites(endpoint):
+    config = _config()
+    limites = dict(config['PADRAO'])
+    limites.update(config['ENDPOINTS'].get(endpoint, {}))
+    return limites
+
+
+def _cache():
+    return caches[_config()['ALIAS_CACHE']]
+
+
+@contextmanager
+def contexto_usuario(usuario_id, esperar=None):
+    """Associa as chamadas feitas dentro do bloco a um usuário (limite por usuário)."""
+    token = _contexto.set({'usuario_id': usuario_id, 'esperar': esperar})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def submeter_no_contexto(executor, funcao, *args):
+    """executor.submit() rodando a função com o contexto (usuário) de quem submete."""
+    return executor.submit(copy_context().run, funcao, *args)
+
+
+def simultaneas_por_usuario(endpoint):
+    """Chamadas simultâneas permitidas a um usuário no endpoint (None sem limite)."""
+    if not _config()['HABILITADO']:
+        return None
+    return _limites(endpoint)['POR_USUARIO_SIMULTANEAS']
+
+
+def contexto_atual():
+    contexto = _contexto.get() or {}
+    esperar = contexto.get('esperar')
+    return {
+        # Dentro de um lote a vaga do usuário já está ocupada pelo lote inteiro
+        'usuario_id': None if contexto.get('lote') else contexto.get('usuario_id'),
+        'esperar': _config()['ESPERA_SEGUNDOS'] if esperar is None else esperar,
+    }
+
+
+# --------------------------------------------------------------------------------------
+# COTA (TOKEN BUCKET)
+# --------------------------------------------------------------------------------------
+@contextmanager
+def _trava(chave):
+    # Trava curta para o ler-calcular-gravar do balde (cache.add é atômico)
+    cache = _cache()
+    for _ in range(20):
+        if cache.add(chave, 1, timeout=5):
+            break
+        time.sleep(0.01)
+    else:
+        raise LimiteIAExcedido("Muitas requisições simultâneas. Tente novamente.", 1)
+    try:
+        yield
+    finally:
+        cache.delete(chave)
+
+
+def consumir_cota(endpoint, usuario_id):
+    """Consome um pedido do balde do usuário; levanta LimiteIAExcedido se vazio."""
+    if not _config()['HABILITADO'] or usuario_id is None:
+        return
+
+    limites = _limites(endpoint)
+    capacidade = limites['RAJADA']
+    taxa = limites['POR_USUARIO_POR_MINUTO'] / 60.0
+    chave = f"ia:cota:{endpoint}:{usuario_id}"
+    cache = _cache()
+
+    with _trava(f"{chave}:trava"):
+        agora = time.time()
+        fichas, ultimo = cache.get(chave) or (capacidade, agora)
+        fichas = min(capacidade, fichas + (agora - ultimo) * taxa)
+        validade = int(capacidade / taxa) + 1 if taxa else None
+
+        if fichas < 1:
+            cache.set(chave, (fichas, agora), timeout=validade)
+            espera = (1 - fichas) / taxa if taxa else 60
+            raise LimiteIAExcedido(
+                f"Você fez muitas gerações em pouco tempo. Tente novamente em {int(espera) + 1}s.", espera)
+
+        cache.set(chave, (fichas - 1, agora), timeout=validade)
+
+
+# --------------------------------------------------------------------------------------
+# VAGAS SIMULTÂNEAS (SEMÁFORO)
+# --------------------------------------------------------------------------------------
+def _ocupar(prefixo, total, dono, validade):
+    cache = _cache()
+    for i in range(total):
+        chave = f"{prefixo}:{i}"
+        if cache.add(chave, dono, timeout=validade):
+            return chave
+    return None
+
+
+def liberar_vagas(vagas):
+    cache = _cache()
+    for chave, dono in vagas:
+        # Só apaga se a vaga ainda é nossa (pode ter expirado e sido reocupada)
+        if cache.get(chave) == dono:
+            cache.delete(chave)
+
+
+def renovar_vagas(vagas):
+    """Estende a validade das vagas ainda ocupadas por nós (processos longos)."""
+    cache = _cache()
+    validade = _config()['VALIDADE_VAGA_SEGUNDOS']
+    for chave, dono in vagas:
+        if cache.get(chave) == dono:
+            cache.touch(chave, validade)
+
+
+def adquirir_vagas(endpoint, usuario_id=None, esperar=0, incluir_global=True):
+    """
+    Ocupa uma vaga do usuário (se informado) e uma vaga global do endpoint
+    (só a do usuário com incluir_global=False).
+    Retorna a lista a ser passada para liberar_vagas().
+    """
+    config = _config()
+    if not config['HABILITADO']:
+        return []
+
+    limites = _limites(endpoint)
+    validade = config['VALIDADE_VAGA_SEGUNDOS']
+    limite_espera = time.monotonic() + (esperar or 0)
+    intervalo = 0.05
+
+    while True:
+        dono = uuid.uuid4().hex
+        vagas = []
+
+        if usuario_id is not None:
+            chave = _ocupar(f"ia:vaga:{endpoint}:u{usuario_id}",
+                            limites['POR_USUARIO_SIMULTANEAS'], dono, validade)
+            if chave is None:
+                motivo = "Você já tem gerações em andamento. Aguarde terminarem e tente novamente."
+            else:
+                vagas.append((chave, dono))
+
+        if vagas and not incluir_global:
+            return vagas
+
+        if usuario_id is None or vagas:
+            chave = _ocupar(f"ia:vaga:{endpoint}:global",
+                            limites['GLOBAL_SIMULTANEAS'], dono, validade)
+            if chave is not None:
+                return vagas + [(chave, dono)]
+            motivo = "O serviço de IA está ocupado no momento. Tente novamente em instantes."
+
+        liberar_vagas(vagas)
+        if time.monotonic() + intervalo > limite_espera:
+            raise LimiteIAExcedido(motivo, 2)
+        time.sleep(intervalo)
+        intervalo = min(intervalo * 2, 1.0)
+
+
+@contextmanager
+def ocupar_vaga(endpoint, usuario_id=None, esperar=0):
+    vagas = adquirir_vagas(endpoint, usuario_id, esperar)
+    try:
+        yield
+    finally:
+        liberar_vagas(vagas)
+
+
+@contextmanager
+def vaga_de_lote(endpoint, usuario_id, esperar=0):
+    """
+    Ocupa uma vaga do usuário para o lote inteiro e associa o bloco ao usuário.
+    As chamadas feitas dentro dele ocupam só vagas globais: o paralelismo do
+    lote é decidido por quem o executa, não por POR_USUARIO_SIMULTANEAS.
+    Retorna as vagas, para renovar_vagas() em lotes mais longos que a validade.
+    """
+    vagas = adquirir_vagas(endpoint, usuario_id, esperar, incluir_global=False)
+    token = _contexto.set({'usuario_id': usuario_id, 'esperar': esperar, 'lote': True})
+    try:
+        yield vagas
+    finally:
+        _contexto.reset(token)
+        liberar_vagas(vagas)
@@ -0,0 +1,133 @@
+# psico_saas/ia_lote.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .busca import indexar_varios
+from .ia_limites import contexto_atual, renovar_vagas, submeter_no_contexto, vaga_de_lote
+from .ia_service import ErroIA, _completar_chat, montar_mensagens_exercicio, PARAMETROS_EXERCICIO
+from .ia_similaridade import exercicio_reaproveitavel
+from .models import JobIA, Paciente, TarefaExercicios
+from .painel import invalidar_resumo
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# GERAÇÃO DE TAREFAS EM LOTE
+# Mesmo tema/abordagem personalizado para vários pacientes. As chamadas à
+# IA rodam em paralelo (limitado por IA_LOTE_MAX_PARALELO) e as tarefas são
+# gravadas com bulk_create no final. O lote ocupa uma vaga "tarefa" do
+# usuário enquanto roda; cada chamada ocupa só uma vaga global (ia_limites.py).
+# ------------------------------------------------------------------
+
+
+def _detalhes_paciente(paciente, detalhes):
+    """Personalização enviada à IA (sem dados identificáveis do paciente)."""
+    partes = []
+    idade = paciente.get_idade()
+    if idade != "N/D":
+        partes.append(f"Paciente com {idade} anos.")
+    if paciente.sexo and paciente.sexo != 'N':
+        partes.append(f"Sexo: {paciente.get_sexo_display()}.")
+    if detalhes:
+        partes.append(detalhes)
+    return ' '.join(partes) or None
+
+
+def _gerar_para_paciente(usuario_id, paciente, parametros):
+    detalhes = _detalhes_paciente(paciente, parametros.get('detalhes_personalizacao'))
+    try:
+        reaproveitado = exercicio_reaproveitavel(
+            usuario_id, parametros['abordagem_teorica'], parametros['tema_principal'], detalhes)
+        if reaproveitado:
+            return reaproveitado
+
+        return _completar_chat(
+            "tarefa",
+            "gpt-3.5-turbo",
+            montar_mensagens_exercicio(
+                parametros['abordagem_teorica'], parametros['tema_principal'], detalhes),
+            **PARAMETROS_EXERCICIO
+        )
+    finally:
+        # Cada thread abre a própria conexão (cache de completions)
+        connection.close()
+
+
+def processar_lote_tarefas(job):
+    """Executa um job LOTE_TAREFAS e grava o relatório em job.resultado."""
+    parametros = job.parametros
+    pacientes = list(
+        Paciente.objects
+        .filter(usuario_id=job.usuario_id, pk__in=parametros.get('pacientes', []))
+        .only('id', 'nome_completo', 'data_nascimento', 'sexo')
+    )
+
+    job.progresso_total = len(pacientes)
+    job.progresso_concluido = 0
+    job.save(update_fields=['progresso_total', 'progresso_concluido'])
+
+    novas_tarefas = []
+    erros = []
+    max_paralelo = max(1, min(getattr(settings, 'IA_LOTE_MAX_PARALELO', 8), len(pacientes) or 1))
+
+    # Sem vaga do usuário, LimiteIAExcedido sobe e o job volta para a fila (ia_jobs.py)
+    with vaga_de_lote('tarefa', job.usuario_id, contexto_atual()['esperar']) as vagas, \
+            ThreadPoolExecutor(max_workers=max_paralelo) as executor:
+        # As threads levam o contexto do lote: cada chamada ocupa só uma vaga global
+        futuros = {
+            submeter_no_contexto(executor, _gerar_para_paciente, job.usuario_id, paciente, parametros): paciente
+            for paciente in pacientes
+        }
+
+        for futuro in as_completed(futuros):
+            paciente = futuros[futuro]
+            try:
+                exercicio = futuro.result()
+                novas_tarefas.append(TarefaExercicios(
+                    usuario_id=job.usuario_id,
+                    paciente=paciente,
+                    abordagem_teorica=parametros['abordagem_teorica'],
+                    tema_principal=parametros['tema_principal'],
+                    detalhes_personalizacao=parametros.get('detalhes_personalizacao'),
+                    exercicio_ia=exercicio,
+                ))
+            except ErroIA as e:
+                erros.append({'paciente_id': paciente.pk, 'paciente': paciente.nome_completo, 'erro': str(e)})
+            except Exception as e:
+                logger.exception("Falha no lote %s para o paciente %s", job.pk, paciente.pk)
+                erros.append({'paciente_id': paciente.pk, 'paciente': paciente.nome_completo,
+                              'erro': f"Erro de processamento: {e}"})
+
+            # Progresso visível no polling; data_inicio serve de heartbeat para
+            # liberar_jobs_travados não devolver à fila um lote longo em andamento
+            JobIA.objects.filter(pk=job.pk).update(
+                progresso_concluido=F('progresso_concluido') + 1,
+                data_inicio=timezone.now())
+            renovar_vagas(vagas)
+
+    for tarefa in novas_tarefas:
+        # bulk_create não passa pelo save()
+        tarefa.preencher_excertos()
+    criadas = TarefaExercicios.objects.bulk_create(novas_tarefas, batch_size=100)
+    # bulk_create não dispara signals: índice de busca e resumo do dashboard aqui
+    indexar_varios(criadas)
+    invalidar_resumo(job.usuario_id)
+
+    job.progresso_concluido = len(pacientes)
+    job.resultado = {
+        'tarefas': [
+            {'id': tarefa.pk, 'paciente_id': tarefa.paciente_id, 'paciente': tarefa.paciente.nome_completo}
+            for tarefa in criadas
+        ],
+        'erros': erros,
+    }
+    job.save(update_fields=['progresso_concluido', 'resultado'])
+
+    if pacientes and not criadas:
+        raise ErroIA(f"Nenhum exercício do lote pôde ser gerado: {erros[0]['erro']}")
@@ -0,0 +1,241 @@
+# psico_saas/ia_metricas.py
+
+import atexit
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import MetricaIA
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# TELEMETRIA DAS CHAMADAS À IA
+# Cada chamada (síncrona ou em stream) registra latência total, tempo até o
+# primeiro token, tokens de prompt/completion, modelo e resultado.
+# Os números ficam acumulados em memória por (dia, endpoint, modelo) e uma
+# thread os grava a cada INTERVALO_SEGUNDOS na tabela MetricaIA, somando ao
+# que outros processos já gravaram (uma escrita por linha, não por chamada).
+# Latências vão para um histograma de faixas fixas, de onde saem p50/p95/p99.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'INTERVALO_SEGUNDOS': 30,
+}
+
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima de"
+FAIXAS_MS = [
+    50, 100, 200, 350, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000,
+    7500, 10000, 15000, 20000, 30000, 45000, 60000, 90000, 120000,
+]
+
+RESULTADOS = ('ok', 'erro', 'timeout', 'limite', 'cache')
+
+_lock = threading.Lock()
+_pendentes = {}
+_thread = None
+_pid = None
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_METRICAS', {}))
+    return config
+
+
+def _histograma_vazio():
+    return [0] * (len(FAIXAS_MS) + 1)
+
+
+def _faixa(ms):
+    return bisect_left(FAIXAS_MS, ms)
+
+
+def _novo_acumulado():
+    return {
+        'chamadas': 0, 'erros': 0, 'timeouts': 0, 'limitadas': 0, 'cache_hits': 0,
+        'tokens_prompt': 0, 'tokens_completion': 0, 'latencia_total_ms': 0,
+        'histograma_latencia': _histograma_vazio(),
+        'histograma_primeiro_token': _histograma_vazio(),
+    }
+
+
+def registrar_chamada(endpoint, modelo, resultado, latencia=None, primeiro_token=None,
+                      tokens_prompt=None, tokens_completion=None):
+    """
+    Registra uma chamada (só em memória; a gravação é feita em lote).
+    latencia/primeiro_token em segundos; resultado em RESULTADOS.
+    """
+    if not _config()['HABILITADO']:
+        return
+
+    chave = (timezone.localdate(), endpoint, modelo)
+    with _lock:
+        _iniciar_thread()
+        acumulado = _pendentes.get(chave)
+        if acumulado is None:
+            acumulado = _pendentes[chave] = _novo_acumulado()
+
+        if resultado == 'cache':
+            acumulado['cache_hits'] += 1
+            return
+        if resultado == 'limite':
+            acumulado['limitadas'] += 1
+            return
+
+        acumulado['chamadas'] += 1
+        if resultado == 'erro':
+            acumulado['erros'] += 1
+        elif resultado == 'timeout':
+            acumulado['timeouts'] += 1
+
+        acumulado['tokens_prompt'] += tokens_prompt or 0
+        acumulado['tokens_completion'] += tokens_completion or 0
+        if latencia is not None:
+            ms = int(latencia * 1000)
+            acumulado['latencia_total_ms'] += ms
+            acumulado['histograma_latencia'][_faixa(ms)] += 1
+        if primeiro_token is not None:
+            acumulado['histograma_primeiro_token'][_faixa(int(primeiro_token * 1000))] += 1
+
+
+# --------------------------------------------------------------------------------------
+# GRAVAÇÃO EM LOTE
+# --------------------------------------------------------------------------------------
+def _somar_histogramas(a, b):
+    a = list(a or []) + [0] * (len(FAIXAS_MS) + 1 - len(a or []))
+    for i, valor in enumerate(b):
+        a[i] += valor
+    return a
+
+
+def _gravar_linha(chave, acumulado):
+    dia, endpoint, modelo = chave
+    with transaction.atomic():
+        metrica = (MetricaIA.objects.select_for_update()
+                   .filter(dia=dia, endpoint=endpoint, modelo=modelo).first())
+        if metrica is None:
+            metrica = MetricaIA.objects.create(dia=dia, endpoint=endpoint, modelo=modelo)
+
+        for campo in ('chamadas', 'erros', 'timeouts', 'limitadas', 'cache_hits',
+                      'tokens_prompt', 'tokens_completion', 'latencia_total_ms'):
+            setattr(metrica, campo, getattr(metrica, campo) + acumulado[campo])
+        metrica.histograma_latencia = _somar_histogramas(
+            metrica.histograma_latencia, acumulado['histograma_latencia'])
+        metrica.histograma_primeiro_token = _somar_histogramas(
+            metrica.histograma_primeiro_token, acumulado['histograma_primeiro_token'])
+        metrica.save()
+
+
+def gravar_pendentes():
+    """Soma o que está em memória às linhas de MetricaIA. Retorna quantas linhas gravou."""
+    with _lock:
+        pendentes = dict(_pendentes)
+        _pendentes.clear()
+
+    gravadas = 0
+    for chave, acumulado in pendentes.items():
+        for _ in range(2):
+            try:
+                _gravar_linha(chave, acumulado)
+                gravadas += 1
+                break
+            except IntegrityError:
+                # Outro processo criou a linha do dia entre o select e o create
+                continue
+            except Exception:
+                logger.exception("Falha ao gravar métricas da IA (%s)", chave)
+                break
+    return gravadas
+
+
+def _laco_gravacao():
+    while True:
+        time.sleep(_config()['INTERVALO_SEGUNDOS'])
+        close_old_connections()
+        try:
+            gravar_pendentes()
+        finally:
+            connection.close()
+
+
+def _iniciar_thread():
+    # Chamado com _lock; a thread é criada no processo que registra (após o fork)
+    global _thread, _pid
+    if _thread is not None and _pid == os.getpid():
+        return
+    _pid = os.getpid()
+    _thread = threading.Thread(target=_laco_gravacao, name='ia-metricas', daemon=True)
+    _thread.start()
+
+
+def _gravar_ao_sair():
+    if _pid == os.getpid() and _pendentes:
+        try:
+            gravar_pendentes()
+        except Exception:
+            pass
+
+
+atexit.register(_gravar_ao_sair)
+
+
+# --------------------------------------------------------------------------------------
+# CONSULTA (PAINEL)
+# --------------------------------------------------------------------------------------
+def percentil(histograma, p):
+    """Percentil (ms) estimado do histograma, interpolando dentro da faixa."""
+    total = sum(histograma or [])
+    if not total:
+        return None
+
+    alvo = p / 100.0 * total
+    acumulado = 0
+    for i, contagem in enumerate(histograma):
+        if contagem and acumulado + contagem >= alvo:
+            inicio = FAIXAS_MS[i - 1] if i > 0 else 0
+            if i >= len(FAIXAS_MS):
+                return inicio
+            fim = FAIXAS_MS[i]
+            return int(inicio + (fim - inicio) * (alvo - acumulado) / contagem)
+        acumulado += contagem
+    return FAIXAS_MS[-1]
+
+
+def resumo_por_dia(dias=7):
+    """Linhas por (dia, endpoint), somando os modelos, com p50/p95/p99."""
+    desde = timezone.localdate() - timedelta(days=dias - 1)
+    grupos = {}
+    for metrica in MetricaIA.objects.filter(dia__gte=desde).order_by('-dia', 'endpoint'):
+        grupo = grupos.get((metrica.dia, metrica.endpoint))
+        if grupo is None:
+            grupo = grupos[(metrica.dia, metrica.endpoint)] = dict(
+                _novo_acumulado(), dia=metrica.dia, endpoint=metrica.endpoint, modelos=[])
+        grupo['modelos'].append(metrica.modelo)
+        for campo in ('chamadas', 'erros', 'timeouts', 'limitadas', 'cache_hits',
+                      'tokens_prompt', 'tokens_completion', 'latencia_total_ms'):
+            grupo[campo] += getattr(metrica, campo)
+        for campo in ('histograma_latencia', 'histograma_primeiro_token'):
+            grupo[campo] = _somar_histogramas(grupo[campo], getattr(metrica, campo) or [])
+
+    linhas = []
+    for grupo in grupos.values():
+        chamadas = grupo['chamadas']
+        histograma = grupo['histograma_latencia']
+        linhas.append(dict(
+            grupo,
+            taxa_erro=round(100.0 * (grupo['erros'] + grupo['timeouts']) / chamadas, 1) if chamadas else 0,
+            latencia_media_ms=int(grupo['latencia_total_ms'] / sum(histograma)) if sum(histograma) else None,
+            p50_ms=percentil(histograma, 50),
+            p95_ms=percentil(histograma, 95),
+            p99_ms=percentil(histograma, 99),
+            primeiro_token_p95_ms=percentil(grupo['histograma_primeiro_token'], 95),
+        ))
+    return linhas
@@ -1,35 +1,40 @@
 # psico_saas/ia_services.py
 
-from openai import OpenAI
-from django.conf import settings
+import json
+import time
 
-# Inicializa o cliente da OpenAI
+from . import ia_cache
+from .ia_client import obter_cliente
+from .ia_compactacao import compactar_anotacoes, contar_tokens
+from .ia_latencia import executar_com_orcamento, prazo_endpoint, PrazoIAEsgotado
+from .ia_limites import ocupar_vaga, contexto_atual, LimiteIAExcedido
+from .ia_metricas import registrar_chamada
+from .ia_similaridade import exercicio_reaproveitavel
+
+# O cliente da OpenAI é único por processo (psico_saas/ia_client.py)
 # Assume que OPENAI_API_KEY está definido em settings.py ou no .env
 
-def generate_task_exercise(abordagem_teorica, tema_principal, detalhes_personalizacao=None):
-    """
-    Gera um exercício de casa personalizado usando a API Chat Completions.
-    """
-    
-    # 0. Inicialização do Cliente da OpenAI (Tratamento de erro de chave)
-    try:
-        # Tenta inicializar o cliente
-        client = OpenAI(api_key=settings.OPENAI_API_KEY) 
-    except AttributeError:
-        # Se a chave não estiver configurada no settings.py, retorna imediatamente
-        return "Erro de Configuração: A chave OPENAI_API_KEY não foi encontrada nas configurações do Django."
 
-    # 1. Monta o Prompt (Instrução para a IA)
+class ErroIA(Exception):
+    """Falha na geração de conteúdo pela IA (API, configuração ou resposta inválida)."""
+
+
+# Parâmetros de amostragem do gerador de exercícios (reusados pelo streaming)
+PARAMETROS_EXERCICIO = {"temperature": 0.7, "max_tokens": 800}
+
+
+def montar_mensagens_exercicio(abordagem_teorica, tema_principal, detalhes_personalizacao=None):
+    """Monta as mensagens (system + user) do gerador de exercícios de casa."""
     prompt = f"""
     Você é um assistente de psicólogo especializado em criação de tarefas de casa e exercícios práticos.
     Gere um exercício ou tarefa de casa detalhada e prática para um paciente.
-    
+
     Abordagem Teórica Principal: {abordagem_teorica}
     Tema Principal da Sessão/Tarefa: {tema_principal}
-    
+
     Requisitos Adicionais para Personalização (Detalhes do Paciente):
     {detalhes_personalizacao if detalhes_personalizacao else 'Nenhum detalhe adicional fornecido.'}
-    
+
     A resposta deve ser estruturada em tópicos, contendo:
     1. Título criativo do exercício.
     2. Objetivo (O que o paciente deve aprender).
@@ -37,54 +42,276 @@ def generate_task_exercise(abordagem_teorica, tema_principal, detalhes_personali
     4. Perguntas de Reflexão (Para a próxima sessão).
     """
 
-    # 2. Chamada à API (Try/Except específico para erros de API, como limites de taxa ou chave inválida)
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  
-            messages=[
-                {"role": "system", "content": "Você é um assistente de psicólogo que cria tarefas de casa."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7, 
-            max_tokens=800
-        )
+    return [
+        {"role": "system", "content": "Você é um assistente de psicólogo que cria tarefas de casa."},
+        {"role": "user", "content": prompt}
+    ]
 
-        # 3. Retorna o conteúdo da resposta
-        return response.choices[0].message.content
-    
-    except Exception as e:
-        # Captura erros de rede, limites, ou falha geral da API
-        return f"Erro na API: {str(e)}"
+
+# --------------------------------------------------------------------------------------
+# GERADORES USADOS PELA FILA DE JOBS (psico_saas/ia_jobs.py)
+# Cada função recebe a instância já salva, preenche os campos de IA e salva de novo.
 # --------------------------------------------------------------------------------------
-# Opcional: Função de Revisão do Plano de Tratamento (Será usada mais tarde)
-def generate_plano_review(plano_data):
+def _completar_chat(endpoint, model, messages, **params):
     """
-    Gera um feedback de revisão para o Plano de Tratamento.
+    Executa uma chamada Chat Completions e retorna o texto da resposta.
+    'endpoint' identifica o ponto de uso (tarefa, conteudo, ...) para o cache.
     """
-    
-    # ⬅️ PASSO 0: Inicialização do Cliente da OpenAI (Corrigido)
+    chave = None
+    if ia_cache.cache_habilitado(endpoint):
+        chave = ia_cache.chave_completion(model, messages, params)
+        texto = ia_cache.obter(chave)
+        if texto is not None:
+            registrar_chamada(endpoint, model, 'cache')
+            return texto
+
+    try:
+        client = obter_cliente()
+    except Exception as e:
+        raise ErroIA(f"Cliente OpenAI não configurado: {e}")
+
+    def chamada(timeout):
+        return client.chat.completions.create(
+            model=model, messages=messages, timeout=timeout, **params)
+
+    # Vagas simultâneas (ia_limites.py) e prazo/hedge/repetições (ia_latencia.py);
+    # sem vaga, LimiteIAExcedido sobe para quem chamou. Telemetria em ia_metricas.py
+    # (a espera pela vaga não entra na latência)
     try:
-        # Tenta inicializar o cliente DENTRO da função
-        client = OpenAI(api_key=settings.OPENAI_API_KEY) 
-    except AttributeError:
-        # Se a chave não estiver configurada no settings.py, retorna imediatamente
-        return "Erro de Configuração: A chave OPENAI_API_KEY não foi encontrada nas configurações do Django."
+        with ocupar_vaga(endpoint, **contexto_atual()):
+            inicio = time.monotonic()
+            try:
+                response = executar_com_orcamento(endpoint, chamada)
+            except PrazoIAEsgotado:
+                registrar_chamada(endpoint, model, 'timeout', latencia=time.monotonic() - inicio)
+                raise ErroIA(f"Tempo limite de {prazo_endpoint(endpoint):.0f}s excedido na chamada à OpenAI.")
+            except Exception as e:
+                registrar_chamada(endpoint, model, 'erro', latencia=time.monotonic() - inicio)
+                raise ErroIA(f"Erro na API da OpenAI: {e}")
+            latencia = time.monotonic() - inicio
+    except LimiteIAExcedido:
+        registrar_chamada(endpoint, model, 'limite')
+        raise
+
+    uso = getattr(response, 'usage', None)
+    registrar_chamada(endpoint, model, 'ok', latencia=latencia, primeiro_token=latencia,
+                      tokens_prompt=getattr(uso, 'prompt_tokens', None),
+                      tokens_completion=getattr(uso, 'completion_tokens', None))
+
+    texto = response.choices[0].message.content
+    if chave:
+        ia_cache.gravar(endpoint, chave, model, texto)
+    return texto
+
 
+def _prompt_revisao_incremental(plano, atuais):
+    """Prompt só com o que mudou desde a última revisão e o feedback anterior."""
+    nomes = {
+        'diagnostico_base': 'Diagnóstico Base',
+        'metas_tratamento': 'Metas de Tratamento',
+        'abordagem': 'Abordagem',
+        'frequencia_sessoes': 'Frequência das Sessões',
+    }
+    mudancas = '\n'.join(
+        f"- {nomes[campo]}:\n  Antes: {plano.snapshot_revisao.get(campo) or '(vazio)'}\n  Agora: {valor or '(vazio)'}"
+        for campo, valor in atuais.items()
+        if valor != plano.snapshot_revisao.get(campo, '')
+    )
 
-    # 1. Monta o Prompt
-    prompt = f"Revise e comente o Plano de Tratamento com o Título: {plano_data.get('titulo', 'N/D')}. Diagnóstico: {plano_data.get('diagnostico_base', 'N/D')}. Metas: {plano_data.get('metas_tratamento', 'N/D')}. Abordagem: {plano_data.get('abordagem', 'N/D')}."
+    return f"""
+        Você é um assistente de revisão de planos de tratamento. O plano abaixo já foi revisado e o psicólogo alterou alguns campos.
+        Atualize o feedback anterior considerando APENAS as alterações: mantenha o que continua válido, corrija o que deixou de fazer sentido e comente as mudanças (máximo 150 palavras no total).
+
+        Feedback Anterior:
+        {plano.feedback_ia}
+
+        Alterações:
+        {mudancas}
+        """
+
+
+def gerar_feedback_plano(plano):
+    """Preenche plano.feedback_ia com a revisão da IA (incremental quando já existe feedback)."""
+    atuais = plano.campos_revisao()
+    feedback_valido = plano.feedback_ia and not plano.feedback_ia.startswith('Erro')
+
+    if feedback_valido and plano.snapshot_revisao == atuais:
+        # Editado e desfeito antes de o worker chegar aqui: nada a revisar
+        return
+
+    if feedback_valido and plano.snapshot_revisao:
+        prompt_texto = _prompt_revisao_incremental(plano, atuais)
+    else:
+        prompt_texto = f"""
+        Você é um assistente de revisão de planos de tratamento. Analise o seguinte plano e forneça um feedback construtivo e conciso (máximo 150 palavras).
+        Foque em sugerir aprimoramentos, validação da coerência entre diagnóstico e metas, ou estratégias adicionais (ex: uso de técnicas de mindfulness, psicoeducação, etc.).
+
+        Diagnóstico Base: {plano.diagnostico_base}
+        Metas de Tratamento: {plano.metas_tratamento}
+        """
 
-    # 2. Chamada à API (Agora o 'client' está definido)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você é um revisor de planos de tratamento, focando em consistência e clareza."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=500
+        plano.feedback_ia = _completar_chat(
+            "plano_revisao",
+            "gpt-3.5-turbo",
+            [
+                {"role": "system", "content": "Você é um assistente de revisão de planos."},
+                {"role": "user", "content": prompt_texto}
+            ]
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Erro na API durante a revisão do plano: {str(e)}"
\ No newline at end of file
+    except ErroIA:
+        # Plano novo fica salvo com o aviso no feedback; numa re-revisão o
+        # feedback anterior é preservado até a próxima tentativa do job
+        if not feedback_valido:
+            plano.feedback_ia = "Erro na comunicação com a IA."
+            plano.save(update_fields=['feedback_ia'])
+        raise
+
+    plano.snapshot_revisao = atuais
+    plano.save(update_fields=['feedback_ia', 'snapshot_revisao'])
+
+
+def gerar_documentacao_sessao(documentacao):
+    """Preenche resumo_ia, sugestao_diagnostico e padroes_linguagem da sessão."""
+    model = "gpt-3.5-turbo-1106"
+
+    # Transcrições longas são limpas e, acima do orçamento do modelo, resumidas por blocos
+    anotacoes = compactar_anotacoes(documentacao.anotacoes_brutas, model)
+
+    if anotacoes['resumido']:
+        # Reduce: consolida as análises parciais dos trechos no mesmo JSON final
+        prompt_texto = f"""
+        Você é um assistente de documentação psicológica. A sessão foi longa e cada parte já foi analisada separadamente, em ordem cronológica.
+        Consolide as análises parciais abaixo em três saídas no formato JSON: um resumo conciso da sessão inteira, sugestão de diagnóstico (CID-10 ou DSM-5) considerando todos os indícios e padrões de linguagem recorrentes.
+
+        Análises Parciais da Sessão:
+        {anotacoes['texto']}
+
+        Gere a resposta em um objeto JSON válido, contendo as chaves EXATAS: resumo_ia, sugestao_diagnostico, padroes_linguagem.
+        """
+    else:
+        prompt_texto = f"""
+        Você é um assistente de documentação psicológica. Analise as anotações e gere três saídas no formato JSON: um resumo conciso, sugestão de diagnóstico (CID-10 ou DSM-5) e padrões de linguagem.
+
+        Anotações da Sessão: {anotacoes['texto']}
+
+        Gere a resposta em um objeto JSON válido, contendo as chaves EXATAS: resumo_ia, sugestao_diagnostico, padroes_linguagem.
+        """
+    messages = [
+        {"role": "system", "content": "Você deve responder apenas com um objeto JSON válido."},
+        {"role": "user", "content": prompt_texto}
+    ]
+
+    documentacao.tokens_anotacoes = anotacoes['tokens_originais']
+    documentacao.tokens_prompt = sum(contar_tokens(m['content'], model) for m in messages)
+    if anotacoes['tokens_originais']:
+        documentacao.taxa_compactacao = round(
+            anotacoes['tokens_compactados'] / anotacoes['tokens_originais'], 4)
+
+    resposta = _completar_chat(
+        "documentacao",
+        model,
+        messages,
+        response_format={"type": "json_object"}
+    )
+
+    try:
+        ia_output = json.loads(resposta)
+    except (TypeError, ValueError) as e:
+        raise ErroIA(f"Resposta da IA não é um JSON válido: {e}")
+
+    documentacao.resumo_ia = ia_output.get('resumo_ia')
+    documentacao.sugestao_diagnostico = ia_output.get('sugestao_diagnostico')
+    documentacao.padroes_linguagem = ia_output.get('padroes_linguagem')
+    documentacao.save(update_fields=[
+        'resumo_ia', 'sugestao_diagnostico', 'padroes_linguagem',
+        'tokens_anotacoes', 'tokens_prompt', 'taxa_compactacao'])
+
+
+def gerar_exercicio_tarefa(tarefa):
+    """Preenche tarefa.exercicio_ia com o exercício gerado."""
+    # Pedido quase idêntico a um exercício já gerado: reaproveita sem chamar a IA
+    reaproveitado = exercicio_reaproveitavel(
+        tarefa.usuario_id, tarefa.abordagem_teorica, tarefa.tema_principal,
+        tarefa.detalhes_personalizacao, excluir=tarefa.pk)
+    if reaproveitado:
+        tarefa.exercicio_ia = reaproveitado
+        tarefa.save(update_fields=['exercicio_ia'])
+        return
+
+    tarefa.exercicio_ia = _completar_chat(
+        "tarefa",
+        "gpt-3.5-turbo",
+        montar_mensagens_exercicio(
+            tarefa.abordagem_teorica, tarefa.tema_principal, tarefa.detalhes_personalizacao),
+        **PARAMETROS_EXERCICIO
+    )
+    tarefa.save(update_fields=['exercicio_ia'])
+
+
+def montar_prompt_conteudo(conteudo):
+    """Monta o prompt de geração de conteúdo educacional."""
+    publico_alvo = conteudo.publico_alvo or 'Público geral interessado em saúde mental'
+    tom_voz = conteudo.tom_voz or 'Profissional e acolhedor'
+
+    return f"""
+        Você é um criador de conteúdo especializado em saúde mental. Crie um conteúdo educativo baseado nos seguintes parâmetros:
+
+        TIPO DE CONTEÚDO: {conteudo.tipo_conteudo}
+        TEMA PRINCIPAL: {conteudo.tema_principal}
+        PÚBLICO-ALVO: {publico_alvo}
+        TOM DE VOZ: {tom_voz}
+        PALAVRAS-CHAVE: {conteudo.palavras_chave or ''}
+
+        **INSTRUÇÕES ESPECÍFICAS:**
+        1. CONTEÚDO PRINCIPAL: Crie um texto bem estruturado, informativo e engajador
+        2. SUGESTÕES DE TÍTULOS: Forneça 3 títulos alternativos em formato de lista
+        3. HASHTAGS: Sugira 5-8 hashtags relevantes separadas por vírgula
+        4. SUGESTÕES DE IMAGENS: Descreva 3 tipos de imagens que combinariam com este conteúdo
+
+        **FORMATO DA RESPOSTA (JSON OBRIGATÓRIO):**
+        {{
+            "conteudo_principal": "texto aqui...",
+            "sugestoes_titulos": ["Título 1", "Título 2", "Título 3"],
+            "hashtags": "#saudemental #ansiedade #terapia",
+            "sugestoes_imagens": "1. Imagem de pessoa meditando\\n2. Infográfico sobre ansiedade\\n3. Natureza tranquila"
+        }}
+        """
+
+
+def aplicar_saida_conteudo(conteudo, ia_output):
+    """Copia o JSON retornado pela IA para os campos do conteúdo educacional."""
+    conteudo.conteudo_gerado = ia_output.get('conteudo_principal', '')
+    titulos = ia_output.get('sugestoes_titulos', [])
+    if isinstance(titulos, list):
+        titulos = ', '.join(titulos)
+    conteudo.sugestoes_titulos = titulos
+    conteudo.hashtags = ia_output.get('hashtags', '')
+    conteudo.sugestoes_imagens = ia_output.get('sugestoes_imagens', '')
+
+
+def montar_mensagens_conteudo(conteudo):
+    """Mensagens (system + user) da geração de conteúdo educacional."""
+    return [
+        {"role": "system", "content": "Você deve responder APENAS com um objeto JSON válido, sem texto adicional."},
+        {"role": "user", "content": montar_prompt_conteudo(conteudo)}
+    ]
+
+
+def gerar_conteudo_educacional(conteudo):
+    """Preenche os campos gerados do conteúdo educacional."""
+    resposta = _completar_chat(
+        "conteudo",
+        "gpt-3.5-turbo-1106",
+        montar_mensagens_conteudo(conteudo),
+        response_format={"type": "json_object"}
+    )
+
+    try:
+        ia_output = json.loads(resposta)
+    except (TypeError, ValueError) as e:
+        raise ErroIA(f"Resposta da IA não é um JSON válido: {e}")
+
+    aplicar_saida_conteudo(conteudo, ia_output)
+    conteudo.save(update_fields=['conteudo_gerado', 'sugestoes_titulos',
+                                 'hashtags', 'sugestoes_imagens', 'data_atualizacao'])
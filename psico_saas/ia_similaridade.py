@@ -0,0 +1,265 @@
+# psico_saas/ia_similaridade.py
+
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+from cachetools import TTLCache
+from django.conf import settings
+
+from .models import TarefaExercicios
+
+# ------------------------------------------------------------------
+# ÍNDICE DE SIMILARIDADE DOS EXERCÍCIOS JÁ GERADOS
+# Cada exercício vira um vetor de n-gramas com hashing (tema + detalhes),
+# normalizado para que o produto escalar seja a similaridade de cosseno.
+# Um índice por psicólogo, carregado na primeira busca e atualizado:
+# - na hora, pelos signals de save/delete deste processo (signals.py);
+# - a cada busca, com as linhas de id maior que o último visto (lotes
+#   gravados com bulk_create e registros criados por outros processos).
+# Os índices ficam num TTLCache limitado (por processo): com o cache cheio
+# sai o menos usado, e cada índice vale por TTL_INDICE_SEGUNDOS desde a carga
+# (o que também traz exclusões feitas por outros processos). O que sai é
+# recarregado do banco na próxima busca.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    # Acima disso o exercício existente é reaproveitado sem chamar a IA
+    'LIMIAR_REUTILIZACAO': 0.92,
+    # Abaixo disso nem aparece como sugestão
+    'LIMIAR_SUGESTAO': 0.55,
+    'MAX_SUGESTOES': 5,
+    # Inclui exercícios de outros psicólogos nas sugestões/reaproveitamento
+    'GLOBAL': False,
+    # Índices em memória por processo (~2 KB por exercício indexado)
+    'MAX_INDICES': 200,
+    'TTL_INDICE_SEGUNDOS': 3600,
+}
+
+DIMENSAO = 1024
+# Peso do tema em relação aos detalhes de personalização
+PESO_TEMA = 0.7
+
+_lock = threading.Lock()
+_indices = None
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IA_SIMILARIDADE', {}))
+    return config
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in texto).split())
+
+
+def _vetor_texto(texto):
+    vetor = np.zeros(DIMENSAO, dtype=np.float32)
+    texto = _normalizar(texto)
+    if not texto:
+        return vetor
+
+    # Palavras inteiras + trigramas de caracteres (tolerante a plural/flexão)
+    for palavra in texto.split():
+        vetor[zlib.crc32(b'p:' + palavra.encode('utf-8')) % DIMENSAO] += 1
+    acolchoado = f' {texto} '
+    for i in range(len(acolchoado) - 2):
+        vetor[zlib.crc32(acolchoado[i:i + 3].encode('utf-8')) % DIMENSAO] += 1
+
+    vetor = np.log1p(vetor)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+def vetorizar(tema, detalhes=None):
+    """Vetor unitário de um pedido de exercício."""
+    vetor = _vetor_texto(tema)
+    if detalhes:
+        vetor = PESO_TEMA * vetor + (1 - PESO_TEMA) * _vetor_texto(detalhes)
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+
+class IndiceExercicios:
+    """Matriz (n x DIMENSAO) em float16 com capacidade que dobra ao crescer."""
+
+    def __init__(self, usuario_id):
+        # usuario_id=None: índice global
+        self.usuario_id = usuario_id
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.abordagens = []
+        self.matriz = np.zeros((0, DIMENSAO), dtype=np.float16)
+        self.total = 0
+        self.ultimo_id = 0
+        self._posicoes = {}
+        self._lock = threading.Lock()
+
+    def _garantir_capacidade(self, extra):
+        necessario = self.total + extra
+        if necessario <= len(self.ids):
+            return
+        capacidade = max(necessario, 2 * len(self.ids), 64)
+        ids = np.zeros(capacidade, dtype=np.int64)
+        matriz = np.zeros((capacidade, DIMENSAO), dtype=np.float16)
+        ids[:self.total] = self.ids[:self.total]
+        matriz[:self.total] = self.matriz[:self.total]
+        self.ids, self.matriz = ids, matriz
+
+    def adicionar(self, linhas):
+        """linhas: iterável de (pk, abordagem, tema, detalhes)."""
+        with self._lock:
+            linhas = list(linhas)
+            self._garantir_capacidade(len(linhas))
+            for pk, abordagem, tema, detalhes in linhas:
+                posicao = self._posicoes.get(pk)
+                if posicao is None:
+                    posicao = self.total
+                    self.total += 1
+                    self.abordagens.append(abordagem)
+                    self._posicoes[pk] = posicao
+                else:
+                    self.abordagens[posicao] = abordagem
+                self.ids[posicao] = pk
+                self.matriz[posicao] = vetorizar(tema, detalhes)
+
+    def remover(self, pk):
+        with self._lock:
+            posicao = self._posicoes.pop(pk, None)
+            if posicao is None:
+                return
+            # Move a última linha para o buraco
+            ultima = self.total - 1
+            if posicao != ultima:
+                self.ids[posicao] = self.ids[ultima]
+                self.matriz[posicao] = self.matriz[ultima]
+                self.abordagens[posicao] = self.abordagens[ultima]
+                self._posicoes[int(self.ids[posicao])] = posicao
+            self.abordagens.pop()
+            self.total = ultima
+
+    def atualizar(self):
+        """Carrega as linhas novas do banco (só colunas curtas, sem o texto gerado)."""
+        consulta = TarefaExercicios.objects.filter(pk__gt=self.ultimo_id)
+        if self.usuario_id is not None:
+            consulta = consulta.filter(usuario_id=self.usuario_id)
+        linhas = list(consulta.order_by('pk').values_list(
+            'pk', 'abordagem_teorica', 'tema_principal', 'detalhes_personalizacao'))
+        if linhas:
+            self.adicionar(linhas)
+            self.ultimo_id = max(self.ultimo_id, linhas[-1][0])
+
+    def buscar(self, abordagem, vetor, k, excluir=None):
+        """Retorna [(pk, similaridade)] da mesma abordagem, mais parecidos primeiro."""
+        with self._lock:
+            if not self.total:
+                return []
+            similaridades = self.matriz[:self.total].astype(np.float32) @ vetor
+            mascara = np.fromiter((a == abordagem for a in self.abordagens),
+                                  dtype=bool, count=self.total)
+            if excluir is not None and excluir in self._posicoes:
+                mascara[self._posicoes[excluir]] = False
+            similaridades = np.where(mascara, similaridades, -1.0)
+            ids = self.ids[:self.total]
+
+        k = min(k, len(similaridades))
+        melhores = np.argpartition(-similaridades, k - 1)[:k]
+        melhores = melhores[np.argsort(-similaridades[melhores])]
+        return [(int(ids[i]), float(similaridades[i])) for i in melhores if similaridades[i] >= 0]
+
+
+def _cache_indices():
+    # Chamado com _lock (TTLCache não é thread-safe)
+    global _indices
+    if _indices is None:
+        config = _config()
+        _indices = TTLCache(maxsize=config['MAX_INDICES'], ttl=config['TTL_INDICE_SEGUNDOS'])
+    return _indices
+
+
+def obter_indice(usuario_id):
+    with _lock:
+        indices = _cache_indices()
+        indice = indices.get(usuario_id)
+        if indice is None:
+            indice = indices[usuario_id] = IndiceExercicios(usuario_id)
+    return indice
+
+
+def _indices_carregados(usuario_id):
+    """Índices já em memória que contêm os exercícios do usuário (o dele e o global)."""
+    with _lock:
+        indices = _cache_indices()
+        return [indice for indice in (indices.get(usuario_id), indices.get(None)) if indice is not None]
+
+
+def registrar_tarefa(tarefa):
+    """Chamado pelo post_save: atualiza só a memória (sem consultas ao banco)."""
+    linha = [(tarefa.pk, tarefa.abordagem_teorica, tarefa.tema_principal, tarefa.detalhes_personalizacao)]
+    for indice in _indices_carregados(tarefa.usuario_id):
+        indice.adicionar(linha)
+
+
+def remover_tarefa(tarefa):
+    for indice in _indices_carregados(tarefa.usuario_id):
+        indice.remover(tarefa.pk)
+
+
+def _exercicio_valido(texto):
+    return bool(texto) and not texto.startswith('Erro')
+
+
+def buscar_similares(usuario_id, abordagem, tema, detalhes=None, k=None, excluir=None):
+    """
+    Exercícios já gerados mais parecidos com o pedido, como
+    [{'tarefa': TarefaExercicios, 'similaridade': float}].
+    """
+    config = _config()
+    if not config['HABILITADO'] or not tema:
+        return []
+
+    k = k or config['MAX_SUGESTOES']
+    vetor = vetorizar(tema, detalhes)
+    candidatos = {}
+    for chave in ([usuario_id, None] if config['GLOBAL'] else [usuario_id]):
+        indice = obter_indice(chave)
+        indice.atualizar()
+        # Busca alguns a mais: exercícios ainda vazios ou com erro são descartados
+        for pk, similaridade in indice.buscar(abordagem, vetor, k * 2, excluir=excluir):
+            if similaridade >= config['LIMIAR_SUGESTAO']:
+                candidatos[pk] = max(similaridade, candidatos.get(pk, 0))
+
+    if not candidatos:
+        return []
+
+    tarefas = (TarefaExercicios.objects
+               .filter(pk__in=candidatos)
+               .only('id', 'usuario_id', 'abordagem_teorica', 'tema_principal', 'exercicio_ia', 'data_criacao'))
+    resultado = [
+        {'tarefa': tarefa, 'similaridade': round(candidatos[tarefa.pk], 4)}
+        for tarefa in tarefas if _exercicio_valido(tarefa.exercicio_ia)
+    ]
+    resultado.sort(key=lambda item: item['similaridade'], reverse=True)
+    return resultado[:k]
+
+
+def exercicio_reaproveitavel(usuario_id, abordagem, tema, detalhes=None, excluir=None):
+    """Texto de um exercício quase idêntico já gerado, ou None."""
+    similares = buscar_similares(usuario_id, abordagem, tema, detalhes, k=1, excluir=excluir)
+    if similares and similares[0]['similaridade'] >= _config()['LIMIAR_REUTILIZACAO']:
+        return similares[0]['tarefa'].exercicio_ia
+    return None
+
+
+def exercicio_para_reuso(usuario_id, pk):
+    """Exercício escolhido nas sugestões, se o usuário pode reaproveitá-lo."""
+    consulta = TarefaExercicios.objects.filter(pk=pk)
+    if not _config()['GLOBAL']:
+        consulta = consulta.filter(usuario_id=usuario_id)
+    tarefa = consulta.only('id', 'exercicio_ia').first()
+    if tarefa is None or not _exercicio_valido(tarefa.exercicio_ia):
+        return None
+    return tarefa.exercicio_ia
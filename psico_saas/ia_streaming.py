@@ -0,0 +1,82 @@
+# psico_saas/ia_streaming.py
+
+import json
+import time
+
+from asgiref.sync import sync_to_async
+
+from . import ia_cache
+from .ia_client import obter_cliente_async
+from .ia_latencia import prazo_endpoint
+from .ia_metricas import registrar_chamada
+from .ia_service import ErroIA
+
+
+def evento_sse(evento, dados):
+    """Formata um evento Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+async def transmitir_chat(endpoint, model, messages, **params):
+    """
+    Faz a chamada Chat Completions com stream=True e devolve os pedaços de
+    texto à medida que chegam da OpenAI. Respostas em cache saem de uma vez.
+    """
+    chave = None
+    if ia_cache.cache_habilitado(endpoint):
+        chave = ia_cache.chave_completion(model, messages, params)
+        texto = await sync_to_async(ia_cache.obter)(chave)
+        if texto is not None:
+            registrar_chamada(endpoint, model, 'cache')
+            yield texto
+            return
+
+    try:
+        client = obter_cliente_async()
+    except Exception as e:
+        raise ErroIA(f"Cliente OpenAI não configurado: {e}")
+
+    # Mesmo prazo das chamadas síncronas; sem hedge (o texto já está na tela)
+    prazo = prazo_endpoint(endpoint)
+    limite = time.monotonic() + prazo
+
+    inicio = time.monotonic()
+    primeiro_token = None
+    uso = None
+    partes = []
+    try:
+        # include_usage: o último pedaço traz os tokens de prompt/completion
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=prazo,
+            stream_options={"include_usage": True}, **params)
+
+        async for chunk in stream:
+            if time.monotonic() > limite:
+                await stream.close()
+                registrar_chamada(endpoint, model, 'timeout', latencia=time.monotonic() - inicio,
+                                  primeiro_token=primeiro_token)
+                raise ErroIA(f"Tempo limite de {prazo:.0f}s excedido na chamada à OpenAI.")
+            if getattr(chunk, 'usage', None):
+                uso = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if primeiro_token is None:
+                    primeiro_token = time.monotonic() - inicio
+                partes.append(delta)
+                yield delta
+    except ErroIA:
+        raise
+    except Exception as e:
+        registrar_chamada(endpoint, model, 'erro', latencia=time.monotonic() - inicio,
+                          primeiro_token=primeiro_token)
+        raise ErroIA(f"Erro na API da OpenAI: {e}")
+
+    registrar_chamada(endpoint, model, 'ok', latencia=time.monotonic() - inicio,
+                      primeiro_token=primeiro_token,
+                      tokens_prompt=getattr(uso, 'prompt_tokens', None),
+                      tokens_completion=getattr(uso, 'completion_tokens', None))
+
+    if chave:
+        await sync_to_async(ia_cache.gravar)(endpoint, chave, model, ''.join(partes))
@@ -0,0 +1,153 @@
+# psico_saas/idempotencia.py
+
+import logging
+import re
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import EnvioIA
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# CHAVES DE IDEMPOTÊNCIA DOS ENVIOS QUE GERAM COM IA
+# Cada formulário que chama a IA leva uma chave (campo oculto
+# 'chave_idempotencia', gerada a cada renderização; a API usa o cabeçalho
+# Idempotency-Key). O primeiro envio reserva a chave gravando um EnvioIA
+# (insert com UNIQUE em usuário + endpoint + chave) e, assim que existem, o
+# registro criado e o job da IA. Um envio repetido (duplo clique, reenvio do
+# navegador, nova tentativa do cliente) perde a corrida do insert e reaproveita
+# o original: responde com o mesmo job/registro, sem criar linha nem chamar o
+# modelo. Se o original ainda não gravou nada, a repetição volta na hora (sem
+# segurar o worker): a view responde "em andamento" (409 com Retry-After nas
+# respostas JSON) e o cliente confere de novo.
+# Envios que falham antes de gerar (validação, limite de uso, erro) desfazem
+# a reserva: a mesma chave pode ser reenviada. Sem chave o envio segue como
+# antes. Reservas vencidas são apagadas pelo worker (limpar_expirados).
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    # Depois disso a mesma chave vale como envio novo
+    'VALIDADE_SEGUNDOS': 24 * 3600,
+    # Quanto um stream repetido espera a geração original terminar
+    'ESPERA_STREAM_SEGUNDOS': 120,
+}
+
+CAMPO_FORMULARIO = 'chave_idempotencia'
+CABECALHO = 'Idempotency-Key'
+FORMATO_CHAVE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IDEMPOTENCIA', {}))
+    return config
+
+
+def nova_chave():
+    """Chave para o campo oculto de um formulário."""
+    return uuid.uuid4().hex
+
+
+def chave_da_requisicao(request):
+    """Chave do cabeçalho Idempotency-Key ou do campo do formulário; None se ausente/inválida."""
+    chave = (request.headers.get(CABECALHO) or request.POST.get(CAMPO_FORMULARIO) or '').strip()
+    return chave if FORMATO_CHAVE.match(chave) else None
+
+
+class Envio:
+    """
+    Resultado de reservar_envio(). Sem chave (ou desligado) não há registro e
+    concluir()/liberar() não fazem nada.
+    """
+
+    def __init__(self, registro=None, repetido=False):
+        self.registro = registro
+        self.repetido = repetido
+        self.concluido = False
+
+    @property
+    def objeto_id(self):
+        return self.registro.objeto_id if self.registro else None
+
+    @property
+    def job(self):
+        return self.registro.job if self.registro else None
+
+    def concluir(self, objeto=None, job=None):
+        """Grava o registro e/ou o job do envio original: repetições passam a reaproveitá-los."""
+        self.concluido = True
+        if self.registro is None or self.repetido:
+            return
+        campos = {}
+        if objeto is not None:
+            campos['objeto_id'] = self.registro.objeto_id = objeto.pk
+        if job is not None:
+            self.registro.job = job
+            campos['job'] = job
+        if campos:
+            EnvioIA.objects.filter(pk=self.registro.pk).update(**campos)
+
+    def liberar(self):
+        """Desfaz a reserva não concluída (a mesma chave pode ser reenviada)."""
+        if self.registro is not None and not self.repetido and not self.concluido:
+            EnvioIA.objects.filter(pk=self.registro.pk).delete()
+            self.registro = None
+
+
+def reservar_envio(usuario_id, chave, endpoint):
+    """
+    Reserva a chave para este envio ou devolve o envio original (repetido=True),
+    sem esperar: com o original ainda em andamento, objeto_id e job vêm vazios.
+    """
+    config = _config()
+    if not config['HABILITADO'] or not chave:
+        return Envio()
+
+    filtro = {'usuario_id': usuario_id, 'endpoint': endpoint, 'chave': chave}
+    validade = timedelta(seconds=config['VALIDADE_SEGUNDOS'])
+    while True:
+        try:
+            with transaction.atomic():
+                return Envio(EnvioIA.objects.create(**filtro))
+        except IntegrityError:
+            pass
+
+        registro = EnvioIA.objects.select_related('job').filter(**filtro).first()
+        if registro is None:
+            # O original desistiu (liberou a chave) entre o insert e a consulta
+            continue
+        if registro.data_criacao < timezone.now() - validade:
+            EnvioIA.objects.filter(pk=registro.pk).delete()
+            continue
+        logger.info("Envio repetido (%s, usuário %s): reaproveitando o original", endpoint, usuario_id)
+        return Envio(registro, repetido=True)
+
+
+@contextmanager
+def envio_unico(request, endpoint):
+    """
+    reservar_envio() com a chave da requisição; a reserva não concluída dentro
+    do bloco (erro de validação, limite, exceção) é desfeita na saída.
+    """
+    envio = reservar_envio(request.user.pk, chave_da_requisicao(request), endpoint)
+    try:
+        yield envio
+    finally:
+        envio.liberar()
+
+
+def espera_stream():
+    """Segundos que um stream repetido espera a geração do original (views.py)."""
+    return _config()['ESPERA_STREAM_SEGUNDOS']
+
+
+def limpar_expirados():
+    limite = timezone.now() - timedelta(seconds=_config()['VALIDADE_SEGUNDOS'])
+    removidos, _ = EnvioIA.objects.filter(data_criacao__lt=limite).delete()
+    return removidos
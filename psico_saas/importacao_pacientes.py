@@ -0,0 +1,317 @@
+# psico_saas/importacao_pacientes.py
+
+import csv
+import datetime
+import io
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .diretorio_pacientes import invalidar_diretorio
+from .models import Paciente, normalizar_nome
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# IMPORTAÇÃO DE PACIENTES EM LOTE (CSV/XLSX)
+# O arquivo é lido linha a linha (csv.reader / openpyxl em modo read_only):
+# a memória não cresce com o tamanho do arquivo. Cada linha é validada com
+# as regras dos campos do modelo Paciente (obrigatório, tamanhos, e-mail,
+# escolhas de sexo, data) e as válidas vão para o banco em lotes de bulk_create, cada lote na
+# sua transação. Nomes já cadastrados (ou repetidos no arquivo) respeitam o
+# unique (usuario, nome_completo) e viram erro da linha, não do arquivo.
+# Usado pelo comando importar_pacientes e pela view de upload.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'TAMANHO_LOTE': 1000,
+    # Erros guardados no relatório (os demais só entram na contagem)
+    'MAX_ERROS_RELATORIO': 500,
+    'MAX_TAMANHO_ARQUIVO_MB': 20,
+}
+
+# Cabeçalho normalizado (minúsculas, sem acentos, "_" no lugar de espaços) -> campo
+COLUNAS = {
+    'nome_completo': 'nome_completo', 'nome': 'nome_completo', 'paciente': 'nome_completo',
+    'data_nascimento': 'data_nascimento', 'data_de_nascimento': 'data_nascimento',
+    'nascimento': 'data_nascimento',
+    'sexo': 'sexo', 'genero': 'sexo',
+    'email': 'email', 'e-mail': 'email',
+    'telefone': 'telefone', 'celular': 'telefone',
+    'contato_emergencia': 'contato_emergencia', 'contato_de_emergencia': 'contato_emergencia',
+    'cep': 'cep',
+    'logradouro': 'logradouro', 'rua': 'logradouro', 'endereco': 'logradouro',
+    'numero': 'numero',
+    'complemento': 'complemento',
+    'bairro': 'bairro',
+    'cidade': 'cidade',
+    'estado': 'estado', 'uf': 'estado',
+}
+CAMPOS = sorted(set(COLUNAS.values()))
+
+# Rótulos aceitos na coluna sexo, além dos códigos
+SEXOS = {normalizar_nome(rotulo): codigo for codigo, rotulo in Paciente.SEXO_CHOICES}
+
+# dd/mm/aaaa (ou com "-"/".") e aaaa-mm-dd
+DATA_BR = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$')
+DATA_ISO = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T].*)?$')
+
+# Tamanhos máximos tirados do modelo (validados sem o Field.clean completo,
+# que custa caro em dezenas de milhares de linhas)
+TAMANHOS = {campo: Paciente._meta.get_field(campo).max_length for campo in CAMPOS
+            if Paciente._meta.get_field(campo).max_length}
+
+
+class ArquivoInvalido(ValueError):
+    pass
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'IMPORTACAO_PACIENTES', {}))
+    return config
+
+
+def tamanho_maximo_mb():
+    """Limite do arquivo enviado pela view de upload."""
+    return _config()['MAX_TAMANHO_ARQUIVO_MB']
+
+
+class RelatorioImportacao:
+    def __init__(self, max_erros):
+        self.linhas = 0
+        self.importados = 0
+        self.total_erros = 0
+        self.erros = []
+        self.max_erros = max_erros
+
+    def erro(self, linha, nome, mensagens):
+        self.total_erros += 1
+        if len(self.erros) < self.max_erros:
+            self.erros.append({'linha': linha, 'nome': nome, 'mensagens': mensagens})
+
+    @property
+    def erros_omitidos(self):
+        return self.total_erros - len(self.erros)
+
+
+# --------------------------------------------------------------------------------------
+# LEITURA
+# --------------------------------------------------------------------------------------
+def _linhas_csv(arquivo):
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', errors='replace', newline='')
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+    except csv.Error:
+        dialeto = csv.excel
+    try:
+        yield from csv.reader(texto, dialeto)
+    finally:
+        # Não fecha o arquivo de quem chamou junto com o wrapper
+        texto.detach()
+
+
+def _linhas_xlsx(arquivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ArquivoInvalido("Importação de XLSX indisponível: instale o pacote openpyxl.")
+    try:
+        planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ArquivoInvalido(f"Não foi possível abrir a planilha: {e}")
+    try:
+        yield from planilha.active.iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """(número da linha no arquivo, {campo: valor}) para cada linha não vazia."""
+    extensao = os.path.splitext(nome_arquivo or '')[1].lower()
+    if extensao == '.xlsx':
+        linhas = _linhas_xlsx(arquivo)
+    elif extensao in ('.csv', '.txt'):
+        linhas = _linhas_csv(arquivo)
+    else:
+        raise ArquivoInvalido("Formato não suportado: envie um arquivo .csv ou .xlsx.")
+
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        raise ArquivoInvalido("Arquivo vazio.")
+    campos = [COLUNAS.get(normalizar_nome(str(coluna or '')).replace(' ', '_')) for coluna in cabecalho]
+    if 'nome_completo' not in campos:
+        raise ArquivoInvalido("O cabeçalho precisa de uma coluna 'nome_completo' (ou 'nome').")
+
+    for numero, valores in enumerate(linhas, start=2):
+        dados = {campo: valor for campo, valor in zip(campos, valores) if campo}
+        if any(valor not in (None, '') for valor in dados.values()):
+            yield numero, dados
+
+
+# --------------------------------------------------------------------------------------
+# VALIDAÇÃO
+# --------------------------------------------------------------------------------------
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        # Planilhas guardam telefone/número/CEP como número
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _data(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    valor = _texto(valor)
+    if not valor:
+        return None
+    if encontrado := DATA_BR.match(valor):
+        dia, mes, ano = map(int, encontrado.groups())
+    elif encontrado := DATA_ISO.match(valor):
+        ano, mes, dia = map(int, encontrado.groups())
+    else:
+        raise ValidationError("Data inválida (use dd/mm/aaaa).")
+    try:
+        return datetime.date(ano, mes, dia)
+    except ValueError:
+        raise ValidationError("Data inválida (use dd/mm/aaaa).")
+
+
+def _cep(valor):
+    digitos = re.sub(r'\D', '', valor)
+    if not digitos:
+        return None
+    if len(digitos) == 7:
+        # Zero à esquerda perdido quando a planilha trata o CEP como número
+        digitos = '0' + digitos
+    if len(digitos) != 8:
+        raise ValidationError("CEP deve ter 8 dígitos.")
+    return f"{digitos[:5]}-{digitos[5:]}"
+
+
+def _sexo(valor):
+    if not valor:
+        return None
+    if valor.upper() in dict(Paciente.SEXO_CHOICES):
+        return valor.upper()
+    codigo = SEXOS.get(normalizar_nome(valor))
+    if codigo:
+        return codigo
+    raise ValidationError("Sexo inválido (use M, F, O ou N).")
+
+
+def validar_linha(dados):
+    """Valores limpos para Paciente(...) ou ValidationError com as mensagens por campo."""
+    valores = {}
+    erros = {}
+    for campo in CAMPOS:
+        bruto = dados.get(campo)
+        try:
+            if campo == 'data_nascimento':
+                valor = _data(bruto)
+            elif campo == 'cep':
+                valor = _cep(_texto(bruto))
+            elif campo == 'sexo':
+                valor = _sexo(_texto(bruto))
+            else:
+                valor = _texto(bruto) or None
+                if valor and campo == 'email':
+                    validate_email(valor)
+            # Mesmas regras do modelo: obrigatório e tamanho máximo
+            if valor is None and campo == 'nome_completo':
+                raise ValidationError("Campo obrigatório.")
+            if valor and campo in TAMANHOS and len(valor) > TAMANHOS[campo]:
+                raise ValidationError(f"Máximo de {TAMANHOS[campo]} caracteres.")
+        except ValidationError as e:
+            erros[campo] = e.messages
+            continue
+        valores[campo] = valor
+
+    if erros:
+        raise ValidationError(erros)
+    if valores.get('data_nascimento') and valores['data_nascimento'] > datetime.date.today():
+        raise ValidationError({'data_nascimento': ["Data de nascimento no futuro."]})
+    return valores
+
+
+# --------------------------------------------------------------------------------------
+# GRAVAÇÃO
+# --------------------------------------------------------------------------------------
+def _gravar_lote(lote, relatorio):
+    try:
+        with transaction.atomic():
+            Paciente.objects.bulk_create([paciente for _, paciente in lote])
+        relatorio.importados += len(lote)
+    except IntegrityError:
+        # Corrida com um cadastro feito durante a importação: refaz linha a linha
+        for numero, paciente in lote:
+            paciente.pk = None
+            try:
+                with transaction.atomic():
+                    paciente.save(force_insert=True)
+                relatorio.importados += 1
+            except IntegrityError:
+                relatorio.erro(numero, paciente.nome_completo, ["Paciente já cadastrado."])
+
+
+def importar_pacientes(usuario, arquivo, nome_arquivo, simular=False):
+    """
+    Importa o arquivo para o usuário e devolve o RelatorioImportacao.
+    simular=True só valida (nada é gravado). ArquivoInvalido para problemas do arquivo todo.
+    """
+    config = _config()
+    relatorio = RelatorioImportacao(config['MAX_ERROS_RELATORIO'])
+
+    # Nomes já cadastrados: o unique é (usuario, nome_completo)
+    existentes = set(Paciente.objects.filter(usuario=usuario)
+                     .values_list('nome_completo', flat=True).iterator())
+    lote = []
+
+    for numero, dados in ler_linhas(arquivo, nome_arquivo):
+        relatorio.linhas += 1
+        try:
+            valores = validar_linha(dados)
+        except ValidationError as e:
+            mensagens = [f"{campo}: {' '.join(msgs)}" for campo, msgs in e.message_dict.items()]
+            relatorio.erro(numero, _texto(dados.get('nome_completo')), mensagens)
+            continue
+
+        nome = valores['nome_completo']
+        if nome in existentes:
+            relatorio.erro(numero, nome, ["Paciente já cadastrado (ou repetido no arquivo)."])
+            continue
+        existentes.add(nome)
+
+        # bulk_create não passa pelo save(): nome_busca preenchido aqui
+        lote.append((numero, Paciente(usuario=usuario, nome_busca=normalizar_nome(nome), **valores)))
+        if len(lote) >= config['TAMANHO_LOTE']:
+            if simular:
+                relatorio.importados += len(lote)
+            else:
+                _gravar_lote(lote, relatorio)
+            lote = []
+
+    if lote:
+        if simular:
+            relatorio.importados += len(lote)
+        else:
+            _gravar_lote(lote, relatorio)
+
+    if relatorio.importados and not simular:
+        # bulk_create não dispara os signals do Paciente
+        invalidar_diretorio(usuario.pk)
+
+    logger.info("Importação de pacientes (usuário %s, %s): %s linhas, %s importados, %s erros%s",
+                usuario.pk, nome_arquivo, relatorio.linhas, relatorio.importados,
+                relatorio.total_erros, " [simulação]" if simular else "")
+    return relatorio
@@ -0,0 +1,189 @@
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from psico_saas.compressao import comprimir, converter_tabela
+from psico_saas.models import DocumentacaoSessao, TarefaExercicios, ConteudoEducacional, Paciente
+
+# Colunas comprimidas (TextoComprimidoField) de cada tabela
+CAMPOS = {
+    DocumentacaoSessao: ['anotacoes_brutas', 'resumo_ia'],
+    TarefaExercicios: ['exercicio_ia'],
+    ConteudoEducacional: ['conteudo_gerado'],
+}
+
+# Frases no estilo das anotações e das saídas da IA, sorteadas para formar os textos
+FRASES = [
+    "Paciente relata aumento da ansiedade no trabalho e dificuldade para dormir.",
+    "Refere pensamentos automáticos de desvalorização diante de críticas da chefia.",
+    "Trabalhamos a identificação de distorções cognitivas com o registro de pensamentos.",
+    "Observa-se melhora no humor e maior adesão às tarefas combinadas na última sessão.",
+    "## Objetivo do exercício\nReconhecer os gatilhos da ansiedade e praticar a respiração diafragmática.",
+    "**Passo 1:** anote a situação, o pensamento automático e a emoção (0 a 100).",
+    "**Passo 2:** busque evidências a favor e contra o pensamento e escreva uma alternativa.",
+    "- Reserve 10 minutos por dia, sempre no mesmo horário, para a prática.",
+    "Conflitos familiares recorrentes, com sentimento de culpa após as discussões.",
+    "A ansiedade é uma resposta natural do corpo, mas em excesso prejudica a rotina.",
+    "Procure um psicólogo se os sintomas persistirem por mais de duas semanas.",
+    "Sono irregular, acorda várias vezes durante a noite e sente cansaço pela manhã.",
+]
+
+LOTE = 1000
+
+
+class _Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Cria registros sintéticos com textos longos e compara tamanho das tabelas, tempo de "
+            "cópia (backup lógico) e latência de leitura antes e depois da compressão dos textos. "
+            "Tudo é desfeito no final.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=5000,
+                            help="Registros por tabela.")
+        parser.add_argument('--repeticoes', type=int, default=300,
+                            help="Leituras para a mediana/p95.")
+        parser.add_argument('--manter', action='store_true',
+                            help="Mantém os dados sintéticos no banco (não desfaz).")
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        self.repeticoes = options['repeticoes']
+
+        try:
+            with transaction.atomic():
+                usuario = self._popular(options['linhas'])
+
+                self.stdout.write(self.style.MIGRATE_HEADING("\n=== TEXTO PURO ==="))
+                antes = self._medir(usuario)
+
+                self.stdout.write(self.style.MIGRATE_HEADING("\n=== COMPRIMIDO ==="))
+                inicio = time.monotonic()
+                for modelo, campos in CAMPOS.items():
+                    converter_tabela(modelo, campos, comprimir, filtro={'usuario': usuario})
+                self.stdout.write(f"Conversão (como na migração 0019): {time.monotonic() - inicio:.1f}s")
+                depois = self._medir(usuario)
+
+                self._comparar(antes, depois)
+                if not options['manter']:
+                    raise _Desfazer()
+        except _Desfazer:
+            self.stdout.write("\nDados sintéticos descartados (rollback).")
+
+    # ------------------------------------------------------------------
+    # DADOS SINTÉTICOS
+    # ------------------------------------------------------------------
+    def _texto(self, minimo, maximo):
+        frases = [random.choice(FRASES) for _ in range(random.randint(minimo, maximo))]
+        return '\n\n'.join(frases)
+
+    def _popular(self, linhas):
+        inicio = time.monotonic()
+        usuario = User.objects.create(username=f'benchmark_compressao_{random.randint(10 ** 5, 10 ** 6)}')
+        paciente = Paciente.objects.create(usuario=usuario, nome_completo='Paciente Sintético')
+        hoje = datetime.date.today()
+
+        # Gravados puros, como as linhas de antes da migração
+        with override_settings(COMPRESSAO_TEXTO={'HABILITADO': False}):
+            for modelo, fabrica in (
+                (DocumentacaoSessao, lambda: DocumentacaoSessao(
+                    usuario=usuario, paciente=paciente, data_sessao=hoje,
+                    anotacoes_brutas=self._texto(15, 60), resumo_ia=self._texto(5, 15))),
+                (TarefaExercicios, lambda: TarefaExercicios(
+                    usuario=usuario, paciente=paciente, abordagem_teorica='TCC',
+                    tema_principal='Ansiedade', exercicio_ia=self._texto(20, 50))),
+                (ConteudoEducacional, lambda: ConteudoEducacional(
+                    usuario=usuario, titulo='Conteúdo', tipo_conteudo='ARTIGO_BLOG',
+                    tema_principal='Ansiedade', conteudo_gerado=self._texto(30, 80))),
+            ):
+                modelo.objects.bulk_create([fabrica() for _ in range(linhas)], batch_size=LOTE)
+
+        self.stdout.write(f"{linhas} registros por tabela criados em {time.monotonic() - inicio:.1f}s.")
+        return usuario
+
+    # ------------------------------------------------------------------
+    # MEDIÇÕES
+    # ------------------------------------------------------------------
+    def _tamanho(self, modelo, campos, usuario):
+        """Bytes gravados nas colunas de texto (no PostgreSQL, já com a compressão do TOAST)."""
+        tabela = modelo._meta.db_table
+        if connection.vendor == 'postgresql':
+            expressao = ' + '.join(f'COALESCE(pg_column_size({campo}), 0)' for campo in campos)
+        else:
+            expressao = ' + '.join(f'COALESCE(LENGTH(CAST({campo} AS BLOB)), 0)' for campo in campos)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT SUM({expressao}) FROM {tabela} WHERE usuario_id = %s', [usuario.pk])
+            return cursor.fetchone()[0] or 0
+
+    def _copia(self, modelo, usuario):
+        """Backup lógico das linhas (como um dump): lê as colunas cruas e grava num arquivo."""
+        tabela = modelo._meta.db_table
+        inicio = time.perf_counter()
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as destino:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT * FROM {tabela} WHERE usuario_id = %s', [usuario.pk])
+                while linhas := cursor.fetchmany(LOTE):
+                    for linha in linhas:
+                        destino.write('\t'.join('' if valor is None else str(valor) for valor in linha))
+                        destino.write('\n')
+            destino.flush()
+            tamanho = os.fstat(destino.fileno()).st_size
+        return (time.perf_counter() - inicio) * 1000, tamanho
+
+    def _leitura(self, modelo, campos, ids):
+        """Detalhe: um registro por pk lendo os textos (mediana, p95 em ms)."""
+        tempos = []
+        for pk in random.sample(ids, min(self.repeticoes, len(ids))):
+            inicio = time.perf_counter()
+            objeto = modelo.objects.get(pk=pk)
+            for campo in campos:
+                getattr(objeto, campo)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        return statistics.median(tempos), tempos[int(0.95 * (len(tempos) - 1))]
+
+    def _pagina(self, modelo, usuario):
+        """Página de 50 objetos inteiros sem acessar os textos (a descompressão é preguiçosa)."""
+        tempos = []
+        for _ in range(30):
+            inicio = time.perf_counter()
+            list(modelo.objects.filter(usuario=usuario).order_by('-data_criacao', '-id')[:50])
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tempos)
+
+    def _medir(self, usuario):
+        resultados = {}
+        for modelo, campos in CAMPOS.items():
+            nome = modelo.__name__
+            ids = list(modelo.objects.filter(usuario=usuario).values_list('pk', flat=True))
+            tamanho = self._tamanho(modelo, campos, usuario)
+            copia, tamanho_copia = self._copia(modelo, usuario)
+            mediana, p95 = self._leitura(modelo, campos, ids)
+            pagina = self._pagina(modelo, usuario)
+            resultados[nome] = {'tamanho': tamanho, 'copia': copia, 'tamanho_copia': tamanho_copia,
+                                'leitura': mediana, 'pagina': pagina}
+            self.stdout.write(
+                f"  {nome}: textos {tamanho / 2 ** 20:.1f} MB | cópia {copia:.0f} ms "
+                f"({tamanho_copia / 2 ** 20:.1f} MB) | detalhe mediana {mediana:.2f} ms, p95 {p95:.2f} ms | "
+                f"página de 50 {pagina:.2f} ms")
+        return resultados
+
+    def _comparar(self, antes, depois):
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== RESUMO (puro -> comprimido) ==="))
+        for nome, medida in depois.items():
+            base = antes[nome]
+            self.stdout.write(
+                f"{nome:22} textos {base['tamanho'] / medida['tamanho']:4.1f}x menores | "
+                f"cópia {base['copia']:.0f} -> {medida['copia']:.0f} ms | "
+                f"detalhe {base['leitura']:.2f} -> {medida['leitura']:.2f} ms | "
+                f"página {base['pagina']:.2f} -> {medida['pagina']:.2f} ms")
@@ -0,0 +1,199 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from psico_saas.busca import consulta_pacientes
+from psico_saas.models import (PlanoTratamento, DocumentacaoSessao, TarefaExercicios,
+                               ConteudoEducacional, Paciente, normalizar_nome)
+
+# Índices compostos avaliados (ver Meta.indexes dos modelos)
+INDICES = {
+    PlanoTratamento: ['plano_usuario_criacao_idx', 'plano_paciente_criacao_idx'],
+    DocumentacaoSessao: ['doc_usuario_criacao_idx', 'doc_paciente_criacao_idx'],
+    TarefaExercicios: ['tarefa_usuario_criacao_idx', 'tarefa_paciente_criacao_idx'],
+    ConteudoEducacional: ['conteudo_usuario_criacao_idx'],
+    Paciente: ['paciente_nome_busca_idx'],
+}
+
+NOMES = ['Ana', 'João', 'Maria', 'José', 'Antônio', 'Francisca', 'Carlos', 'Luíza', 'Paulo', 'Márcia']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Conceição', 'Pereira', 'Lima', 'Gonçalves']
+
+LOTE = 2000
+
+
+class _Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Cria um psicólogo sintético com muitos registros e mede planos de execução e tempos "
+            "das consultas das listas (com e sem os índices compostos). Tudo é desfeito no final.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=20000,
+                            help="Registros por tabela do psicólogo sintético.")
+        parser.add_argument('--pacientes', type=int, default=400,
+                            help="Pacientes do psicólogo sintético.")
+        parser.add_argument('--outros-usuarios', type=int, default=10,
+                            help="Outros psicólogos (ruído), cada um com --linhas / 4 registros por tabela.")
+        parser.add_argument('--repeticoes', type=int, default=30,
+                            help="Execuções de cada consulta para a mediana/p95.")
+        parser.add_argument('--sem-comparar', action='store_true',
+                            help="Não repete as medições sem os índices.")
+        parser.add_argument('--manter', action='store_true',
+                            help="Mantém os dados sintéticos no banco (não desfaz).")
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        self.repeticoes = options['repeticoes']
+
+        try:
+            with transaction.atomic():
+                usuario, paciente = self._popular(options)
+                self._analisar()
+
+                self.stdout.write(self.style.MIGRATE_HEADING("\n=== COM ÍNDICES COMPOSTOS ==="))
+                com = self._medir(usuario, paciente, mostrar_planos=True)
+
+                if not options['sem_comparar']:
+                    sem = self._sem_indices(usuario, paciente)
+                    self._comparar(com, sem)
+
+                if not options['manter']:
+                    raise _Desfazer()
+        except _Desfazer:
+            self.stdout.write("\nDados sintéticos descartados (rollback).")
+
+    # ------------------------------------------------------------------
+    # DADOS SINTÉTICOS
+    # ------------------------------------------------------------------
+    def _popular(self, options):
+        inicio = time.monotonic()
+        sufixo = random.randint(10 ** 5, 10 ** 6)
+        alvo = None
+        paciente_alvo = None
+
+        donos = [(f'benchmark_{sufixo}', options['linhas'], options['pacientes'])]
+        donos += [(f'benchmark_{sufixo}_{i}', options['linhas'] // 4, max(1, options['pacientes'] // 4))
+                  for i in range(options['outros_usuarios'])]
+
+        for username, linhas, total_pacientes in donos:
+            usuario = User.objects.create(username=username)
+            pacientes = Paciente.objects.bulk_create(
+                [self._paciente(usuario, i) for i in range(total_pacientes)], batch_size=LOTE)
+            self._criar_registros(usuario, pacientes, linhas)
+            if alvo is None:
+                alvo, paciente_alvo = usuario, pacientes[0]
+
+        self.stdout.write(
+            f"{len(donos)} psicólogos sintéticos criados em {time.monotonic() - inicio:.1f}s "
+            f"(alvo: {options['linhas']} registros por tabela, {options['pacientes']} pacientes).")
+        return alvo, paciente_alvo
+
+    def _paciente(self, usuario, i):
+        # bulk_create não passa pelo save(): nome_busca preenchido aqui
+        nome = f'{random.choice(NOMES)} {random.choice(SOBRENOMES)} {i:05d}'
+        return Paciente(usuario=usuario, nome_completo=nome, nome_busca=normalizar_nome(nome),
+                        data_nascimento=datetime.date(1960 + i % 50, 1 + i % 12, 1 + i % 28))
+
+    def _criar_registros(self, usuario, pacientes, linhas):
+        hoje = datetime.date.today()
+        for modelo, fabrica in (
+            (PlanoTratamento, lambda p: PlanoTratamento(
+                usuario=usuario, paciente=p, titulo='Plano', diagnostico_base='F41.1',
+                metas_tratamento='Reduzir ansiedade', abordagem='TCC', frequencia_sessoes='Semanal',
+                data_inicio_prevista=hoje)),
+            (DocumentacaoSessao, lambda p: DocumentacaoSessao(
+                usuario=usuario, paciente=p, data_sessao=hoje, anotacoes_brutas='Anotações da sessão.')),
+            (TarefaExercicios, lambda p: TarefaExercicios(
+                usuario=usuario, paciente=p, abordagem_teorica='TCC', tema_principal='Ansiedade')),
+            (ConteudoEducacional, lambda p: ConteudoEducacional(
+                usuario=usuario, titulo='Conteúdo', tipo_conteudo='ARTIGO_BLOG', tema_principal='Ansiedade')),
+        ):
+            modelo.objects.bulk_create(
+                [fabrica(random.choice(pacientes)) for _ in range(linhas)], batch_size=LOTE)
+
+    def _analisar(self):
+        # Atualiza as estatísticas do planejador antes de medir
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                for modelo in INDICES:
+                    cursor.execute(f'ANALYZE {modelo._meta.db_table}')
+            elif connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+
+    # ------------------------------------------------------------------
+    # MEDIÇÕES
+    # ------------------------------------------------------------------
+    def _consultas(self, usuario, paciente):
+        # Mesmas consultas das views (primeira página de 50 nas listas)
+        return [
+            ("Lista de planos", PlanoTratamento.objects.filter(usuario=usuario)
+             .select_related('paciente').order_by('-data_criacao', '-id')[:50]),
+            ("Lista de documentações", DocumentacaoSessao.objects.filter(usuario=usuario)
+             .order_by('-data_criacao', '-id')[:50]),
+            ("Lista de tarefas", TarefaExercicios.objects.filter(usuario=usuario)
+             .order_by('-data_criacao', '-id')[:50]),
+            ("Lista de conteúdos", ConteudoEducacional.objects.filter(usuario=usuario)
+             .order_by('-data_criacao', '-id')[:50]),
+            ("Dashboard: últimos planos", PlanoTratamento.objects.filter(usuario=usuario)
+             .select_related('paciente').order_by('-data_criacao')[:3]),
+            ("Planos do paciente", PlanoTratamento.objects.filter(paciente=paciente)
+             .order_by('-data_criacao')),
+            ("Documentações do paciente", DocumentacaoSessao.objects.filter(paciente=paciente)
+             .order_by('-data_criacao')),
+            ("Tarefas do paciente", TarefaExercicios.objects.filter(paciente=paciente)
+             .order_by('-data_criacao')),
+            ("Seletor de pacientes", consulta_pacientes(usuario.pk, 'jo')),
+            ("Seletor de pacientes (sobrenome)", consulta_pacientes(usuario.pk, 'ma conc')),
+        ]
+
+    def _cronometrar(self, consulta):
+        tempos = []
+        for _ in range(self.repeticoes):
+            inicio = time.perf_counter()
+            list(consulta.all())
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        return statistics.median(tempos), tempos[int(0.95 * (len(tempos) - 1))]
+
+    def _medir(self, usuario, paciente, mostrar_planos=False):
+        resultados = {}
+        for nome, consulta in self._consultas(usuario, paciente):
+            if mostrar_planos:
+                self.stdout.write(self.style.HTTP_INFO(f"\n{nome}"))
+                self.stdout.write(consulta.explain())
+            mediana, p95 = self._cronometrar(consulta)
+            resultados[nome] = (mediana, p95)
+            self.stdout.write(f"  {nome}: mediana {mediana:.2f} ms | p95 {p95:.2f} ms")
+        return resultados
+
+    def _sem_indices(self, usuario, paciente):
+        # Remove os índices dentro de um savepoint, mede e desfaz
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== SEM ÍNDICES COMPOSTOS (só o índice da FK) ==="))
+        try:
+            with transaction.atomic():
+                # DROP INDEX direto: o schema editor do SQLite não roda dentro de transação
+                with connection.cursor() as cursor:
+                    for nomes in INDICES.values():
+                        for nome in nomes:
+                            cursor.execute(f'DROP INDEX {connection.ops.quote_name(nome)}')
+                self._analisar()
+                resultados = self._medir(usuario, paciente, mostrar_planos=True)
+                raise _Desfazer()
+        except _Desfazer:
+            pass
+        return resultados
+
+    def _comparar(self, com, sem):
+        self.stdout.write(self.style.MIGRATE_HEADING("\n=== RESUMO (mediana em ms) ==="))
+        self.stdout.write(f"{'Consulta':32} {'sem':>10} {'com':>10} {'ganho':>8}")
+        for nome, (mediana, _) in com.items():
+            antes = sem[nome][0]
+            ganho = antes / mediana if mediana else 0
+            self.stdout.write(f"{nome:32} {antes:10.2f} {mediana:10.2f} {ganho:7.1f}x")
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from psico_saas.exportacao import FORMATOS, SECOES_POR_NOME, exportar
+from psico_saas.models import Paciente
+
+
+class Command(BaseCommand):
+    help = ("Exporta o prontuário de um psicólogo (ou de um paciente) para um arquivo, "
+            "em streaming (atendimento de pedidos de titulares pela LGPD).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help="Username (ou id) do psicólogo.")
+        parser.add_argument('--paciente', type=int, help="Exporta só este paciente (id).")
+        parser.add_argument('--formato', choices=FORMATOS, default='zip')
+        parser.add_argument('--secao', choices=list(SECOES_POR_NOME), help="Seção (obrigatória no CSV).")
+        parser.add_argument('--saida', help="Arquivo de saída (padrão: nome sugerido na pasta atual).")
+
+    def handle(self, *args, **options):
+        filtro = {'pk': int(options['usuario'])} if options['usuario'].isdigit() else {'username': options['usuario']}
+        usuario = User.objects.filter(**filtro).first()
+        if usuario is None:
+            raise CommandError(f"Usuário não encontrado: {options['usuario']}")
+        if options['paciente'] and not Paciente.objects.filter(pk=options['paciente'], usuario=usuario).exists():
+            raise CommandError(f"Paciente {options['paciente']} não pertence a {usuario.username}.")
+
+        try:
+            conteudo, _, nome_arquivo = exportar(options['formato'], usuario.pk, options['paciente'], options['secao'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        caminho = options['saida'] or nome_arquivo
+        total = 0
+        with open(caminho, 'wb') as saida:
+            for parte in conteudo:
+                dados = parte.encode('utf-8') if isinstance(parte, str) else parte
+                saida.write(dados)
+                total += len(dados)
+        self.stdout.write(self.style.SUCCESS(f"{caminho}: {total / 1024:.0f} KB exportados."))
@@ -0,0 +1,61 @@
+import csv
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from psico_saas.importacao_pacientes import ArquivoInvalido, importar_pacientes
+
+
+class Command(BaseCommand):
+    help = ("Importa pacientes de um arquivo CSV ou XLSX para um psicólogo (cabeçalho com "
+            "nome_completo e, opcionalmente, data_nascimento, sexo, email, telefone e endereço).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do .csv ou .xlsx.")
+        parser.add_argument('--usuario', required=True,
+                            help="Username (ou id) do psicólogo dono dos pacientes.")
+        parser.add_argument('--simular', action='store_true',
+                            help="Só valida o arquivo; nada é gravado.")
+        parser.add_argument('--relatorio',
+                            help="Grava os erros por linha neste arquivo CSV.")
+
+    def handle(self, *args, **options):
+        usuario = self._usuario(options['usuario'])
+        inicio = time.monotonic()
+
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                relatorio = importar_pacientes(usuario, arquivo, options['arquivo'], simular=options['simular'])
+        except FileNotFoundError:
+            raise CommandError(f"Arquivo não encontrado: {options['arquivo']}")
+        except ArquivoInvalido as e:
+            raise CommandError(str(e))
+
+        for erro in relatorio.erros[:20]:
+            self.stdout.write(self.style.WARNING(
+                f"  linha {erro['linha']} ({erro['nome'] or '-'}): {'; '.join(erro['mensagens'])}"))
+        if relatorio.total_erros > 20:
+            self.stdout.write(f"  ... e mais {relatorio.total_erros - 20} erro(s).")
+
+        if options['relatorio']:
+            with open(options['relatorio'], 'w', newline='', encoding='utf-8') as saida:
+                escritor = csv.writer(saida, delimiter=';')
+                escritor.writerow(['linha', 'nome', 'erros'])
+                for erro in relatorio.erros:
+                    escritor.writerow([erro['linha'], erro['nome'], ' | '.join(erro['mensagens'])])
+            if relatorio.erros_omitidos:
+                self.stdout.write(f"Relatório com os primeiros {len(relatorio.erros)} erros "
+                                  f"(IMPORTACAO_PACIENTES['MAX_ERROS_RELATORIO']).")
+
+        verbo = "válidos (simulação)" if options['simular'] else "importados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{relatorio.linhas} linha(s) lidas: {relatorio.importados} {verbo}, "
+            f"{relatorio.total_erros} com erro, em {time.monotonic() - inicio:.1f}s."))
+
+    def _usuario(self, valor):
+        filtro = {'pk': int(valor)} if valor.isdigit() else {'username': valor}
+        try:
+            return User.objects.get(**filtro)
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário não encontrado: {valor}")
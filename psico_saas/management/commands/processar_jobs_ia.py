@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from psico_saas import ia_cache, idempotencia
+from psico_saas.ia_jobs import reservar_proximo_job, processar_job, liberar_jobs_travados
+
+# Intervalo mínimo entre limpezas do cache de completions e das chaves de idempotência expiradas
+INTERVALO_LIMPEZA_CACHE = 3600
+
+
+class Command(BaseCommand):
+    help = "Worker que processa a fila de jobs de IA (planos, documentações, tarefas e conteúdos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true',
+                            help="Processa os jobs pendentes e encerra.")
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help="Segundos de espera quando a fila está vazia.")
+        parser.add_argument('--max-jobs', type=int, default=0,
+                            help="Encerra após processar N jobs (0 = sem limite).")
+
+    def handle(self, *args, **options):
+        processados = 0
+        ultima_limpeza = None
+        self.stdout.write("Worker de IA iniciado.")
+
+        while True:
+            close_old_connections()
+            liberados = liberar_jobs_travados()
+            if liberados:
+                self.stdout.write(f"{liberados} job(s) travado(s) devolvido(s) à fila.")
+
+            job = reservar_proximo_job()
+
+            if job is None:
+                # Fila vazia: bom momento para limpar o cache e as chaves expirados
+                if ultima_limpeza is None or time.monotonic() - ultima_limpeza > INTERVALO_LIMPEZA_CACHE:
+                    ia_cache.limpar_expirados()
+                    idempotencia.limpar_expirados()
+                    ultima_limpeza = time.monotonic()
+
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            processar_job(job)
+            processados += 1
+            self.stdout.write(f"Job {job.pk} ({job.tipo}): {job.status}")
+
+            if options['max_jobs'] and processados >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"{processados} job(s) processado(s)."))
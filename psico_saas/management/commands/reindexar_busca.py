@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from psico_saas.busca import MODELOS_POR_TIPO, indexar_varios, limpar_indice
+from psico_saas.models import IndiceBusca
+
+LOTE = 500
+
+
+class Command(BaseCommand):
+    help = ("Reconstrói o índice de busca de texto completo a partir das documentações, planos e "
+            "exercícios (carga inicial ou correção depois de gravações sem signals). "
+            "Com --pendentes (release do Procfile), indexa só o que ainda não está no índice.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int,
+                            help="Reindexa só os registros deste usuário (id).")
+        parser.add_argument('--limpar', action='store_true',
+                            help="Apaga o índice (do usuário, se informado) antes de reconstruir.")
+        parser.add_argument('--pendentes', action='store_true',
+                            help="Indexa só os registros que ainda não têm entrada no índice.")
+
+    def handle(self, *args, **options):
+        filtro = {'usuario_id': options['usuario']} if options['usuario'] else {}
+
+        with transaction.atomic():
+            if options['limpar']:
+                apagados = limpar_indice(options['usuario'])
+                self.stdout.write(f"{apagados} entrada(s) removida(s) do índice.")
+
+            for tipo, modelo in MODELOS_POR_TIPO.items():
+                consulta = modelo.objects.filter(**filtro)
+                if options['pendentes']:
+                    consulta = consulta.exclude(pk__in=IndiceBusca.objects.filter(tipo=tipo).values('objeto_id'))
+                total = 0
+                lote = []
+                for objeto in consulta.order_by('pk').iterator(chunk_size=LOTE):
+                    lote.append(objeto)
+                    if len(lote) == LOTE:
+                        total += indexar_varios(lote, LOTE)
+                        lote = []
+                total += indexar_varios(lote, LOTE)
+                self.stdout.write(f"{modelo.__name__}: {total} indexado(s).")
+
+        self.stdout.write(self.style.SUCCESS("Índice de busca atualizado."))
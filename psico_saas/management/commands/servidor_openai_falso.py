@@ -0,0 +1,260 @@
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+# ------------------------------------------------------------------
+# SERVIDOR FALSO DA API DE CHAT COMPLETIONS
+# Para benchmarks e testes de carga sem custo e sem rede:
+#   python manage.py servidor_openai_falso --latencia-media 1200 --taxa-erro 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python manage.py processar_jobs_ia
+# Atende texto simples, response_format=json_object e stream=True, com as
+# mesmas chaves JSON que ia_service.py espera de cada prompt.
+# ------------------------------------------------------------------
+
+EXERCICIO = """1. Título: Diário dos Pensamentos Automáticos
+2. Objetivo: Identificar pensamentos automáticos ligados ao tema trabalhado na sessão.
+3. Instruções:
+   - Durante a semana, anote situações que geraram desconforto.
+   - Registre o pensamento, a emoção (0-100) e uma resposta alternativa.
+4. Perguntas de Reflexão:
+   - Que padrão você percebeu nos seus registros?
+   - Qual resposta alternativa foi mais útil?"""
+
+REVISAO_PLANO = ("O plano apresenta coerência entre diagnóstico e metas. Sugere-se tornar as metas "
+                 "mensuráveis, incluir psicoeducação nas primeiras sessões e avaliar a inclusão de "
+                 "técnicas de mindfulness para regulação emocional.")
+
+JSON_DOCUMENTACAO = {
+    'resumo_ia': "Paciente relata aumento da ansiedade no trabalho e dificuldade para dormir.",
+    'sugestao_diagnostico': "F41.1 - Transtorno de ansiedade generalizada (hipótese)",
+    'padroes_linguagem': "Generalizações ('sempre dá errado') e antecipação catastrófica.",
+}
+
+JSON_BLOCO = {
+    'resumo': "Trecho com relato de preocupação constante com o desempenho profissional.",
+    'indicios_diagnosticos': "Preocupação excessiva, tensão muscular, insônia inicial.",
+    'padroes_linguagem': "\"eu nunca consigo\", \"vai dar tudo errado\"",
+}
+
+JSON_CONTEUDO = {
+    'conteudo_principal': ("A ansiedade é uma resposta natural do corpo diante de situações de ameaça. "
+                           "Quando se torna intensa e frequente, pode atrapalhar a rotina. "
+                           "Respiração diafragmática, atividade física e psicoterapia são aliadas importantes."),
+    'sugestoes_titulos': ["Entendendo a ansiedade", "Ansiedade: quando procurar ajuda",
+                          "5 passos para lidar com a ansiedade"],
+    'hashtags': "#saudemental #ansiedade #psicologia #terapia #autocuidado",
+    'sugestoes_imagens': "1. Pessoa respirando ao ar livre\n2. Infográfico de sintomas\n3. Consultório acolhedor",
+}
+
+
+def resposta_enlatada(corpo):
+    """Escolhe a saída pelo formato pedido e pelas chaves citadas no prompt."""
+    texto = ' '.join(str(m.get('content', '')) for m in corpo.get('messages', []))
+    formato = (corpo.get('response_format') or {}).get('type')
+
+    if formato == 'json_object':
+        if 'indicios_diagnosticos' in texto:
+            saida = JSON_BLOCO
+        elif 'resumo_ia' in texto:
+            saida = JSON_DOCUMENTACAO
+        elif 'conteudo_principal' in texto:
+            saida = JSON_CONTEUDO
+        else:
+            saida = {}
+        return json.dumps(saida, ensure_ascii=False)
+
+    if 'Plano de Tratamento' in texto or 'revisão de planos' in texto:
+        return REVISAO_PLANO
+    return EXERCICIO
+
+
+class Simulador:
+    """Latência e erros sorteados com semente fixa (execuções comparáveis)."""
+
+    def __init__(self, distribuicao, media_ms, desvio_ms, taxa_erro, status_erro, semente):
+        self.distribuicao = distribuicao
+        self.media = media_ms / 1000
+        self.desvio = desvio_ms / 1000
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+
+    def sortear(self):
+        """Retorna (segundos de latência, status de erro ou None)."""
+        with self._lock:
+            if self.distribuicao == 'fixa':
+                latencia = self.media
+            elif self.distribuicao == 'normal':
+                latencia = self._aleatorio.gauss(self.media, self.desvio)
+            elif self.distribuicao == 'exponencial':
+                latencia = self._aleatorio.expovariate(1 / self.media) if self.media else 0
+            else:
+                # lognormal com a média e o desvio pedidos (cauda longa, como a API real)
+                if self.media <= 0:
+                    latencia = 0
+                else:
+                    sigma2 = math.log(1 + (self.desvio / self.media) ** 2)
+                    latencia = self._aleatorio.lognormvariate(
+                        math.log(self.media) - sigma2 / 2, math.sqrt(sigma2))
+            erro = self.status_erro if self._aleatorio.random() < self.taxa_erro else None
+        return max(0.0, latencia), erro
+
+
+class ManipuladorCompletions(BaseHTTPRequestHandler):
+    simulador = None
+    tokens_por_segundo = 50
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _enviar_json(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._enviar_json(200, {'object': 'list', 'data': [
+                {'id': 'gpt-3.5-turbo', 'object': 'model'},
+                {'id': 'gpt-3.5-turbo-1106', 'object': 'model'},
+            ]})
+        else:
+            self._enviar_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._enviar_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        try:
+            corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        except ValueError:
+            self._enviar_json(400, {'error': {'message': 'JSON inválido', 'type': 'invalid_request_error'}})
+            return
+
+        latencia, erro = self.simulador.sortear()
+        conteudo = resposta_enlatada(corpo)
+        modelo = corpo.get('model', 'gpt-3.5-turbo')
+
+        if erro:
+            time.sleep(latencia / 4)
+            self._enviar_json(erro, {'error': {
+                'message': f'Erro simulado ({erro})', 'type': 'server_error', 'code': None}})
+            return
+
+        # Contagem aproximada (palavras), suficiente para a telemetria local
+        uso = {'prompt_tokens': sum(len(str(m.get('content', '')).split()) for m in corpo.get('messages', [])),
+               'completion_tokens': len(conteudo.split())}
+        uso['total_tokens'] = uso['prompt_tokens'] + uso['completion_tokens']
+
+        if corpo.get('stream'):
+            incluir_uso = (corpo.get('stream_options') or {}).get('include_usage')
+            self._transmitir(modelo, conteudo, latencia, uso if incluir_uso else None)
+            return
+
+        time.sleep(latencia)
+        self._enviar_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': modelo,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': conteudo},
+                'finish_reason': 'stop',
+            }],
+            'usage': uso,
+        })
+
+    def _transmitir(self, modelo, conteudo, latencia, uso=None):
+        # A latência sorteada vira o tempo até o primeiro token
+        time.sleep(latencia)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        identificador = f'chatcmpl-{uuid.uuid4().hex}'
+        pedacos = [p + ' ' for p in conteudo.split(' ')]
+        intervalo = 1 / self.tokens_por_segundo if self.tokens_por_segundo else 0
+
+        def evento(delta, fim=None, usage=None):
+            dados = {
+                'id': identificador, 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': modelo,
+                'choices': [] if usage else [{'index': 0, 'delta': delta, 'finish_reason': fim}],
+            }
+            if usage:
+                dados['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(dados, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            evento({'role': 'assistant', 'content': ''})
+            for pedaco in pedacos:
+                evento({'content': pedaco})
+                if intervalo:
+                    time.sleep(intervalo)
+            evento({}, 'stop')
+            if uso:
+                evento(None, usage=uso)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class Command(BaseCommand):
+    help = "Servidor local que imita a API de Chat Completions da OpenAI (benchmarks e testes de carga)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--porta', type=int, default=8765)
+        parser.add_argument('--distribuicao', default='lognormal',
+                            choices=['fixa', 'normal', 'lognormal', 'exponencial'],
+                            help="Distribuição da latência de cada resposta.")
+        parser.add_argument('--latencia-media', type=float, default=800,
+                            help="Latência média em milissegundos.")
+        parser.add_argument('--latencia-desvio', type=float, default=400,
+                            help="Desvio padrão da latência em milissegundos.")
+        parser.add_argument('--taxa-erro', type=float, default=0.0,
+                            help="Fração das requisições que falham (0 a 1).")
+        parser.add_argument('--status-erro', type=int, default=500,
+                            help="Status HTTP das falhas simuladas (ex: 429, 500, 503).")
+        parser.add_argument('--tokens-por-segundo', type=float, default=50,
+                            help="Ritmo dos pedaços no modo stream (0 = sem pausa).")
+        parser.add_argument('--semente', type=int, default=42,
+                            help="Semente do sorteio de latências e erros.")
+
+    def handle(self, *args, **options):
+        ManipuladorCompletions.simulador = Simulador(
+            options['distribuicao'], options['latencia_media'], options['latencia_desvio'],
+            options['taxa_erro'], options['status_erro'], options['semente'])
+        ManipuladorCompletions.tokens_por_segundo = options['tokens_por_segundo']
+
+        servidor = ThreadingHTTPServer((options['host'], options['porta']), ManipuladorCompletions)
+        servidor.daemon_threads = True
+        url = f"http://{options['host']}:{options['porta']}/v1"
+        self.stdout.write(f"Servidor OpenAI falso em {url} (use OPENAI_BASE_URL={url})")
+
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write("Servidor encerrado.")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0007_paciente_bairro_paciente_cep_paciente_cidade_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('PLANO_REVISAO', 'Revisão do Plano de Tratamento'), ('DOCUMENTACAO', 'Documentação de Sessão'), ('TAREFA', 'Tarefa/Exercício'), ('CONTEUDO', 'Conteúdo Educacional')], max_length=30)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDO', 'Concluído'), ('ERRO', 'Erro')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Job de IA',
+                'verbose_name_plural': 'Jobs de IA',
+                'indexes': [models.Index(fields=['status', 'data_criacao'], name='psico_saas__status_4e53d9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0008_jobia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheCompletionIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64, unique=True)),
+                ('endpoint', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=50)),
+                ('resposta', models.TextField()),
+                ('acessos', models.PositiveIntegerField(default=0)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de Completion da IA',
+                'verbose_name_plural': 'Cache de Completions da IA',
+            },
+        ),
+    ]
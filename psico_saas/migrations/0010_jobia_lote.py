@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0009_cachecompletionia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobia',
+            name='progresso_concluido',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='jobia',
+            name='progresso_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='jobia',
+            name='resultado',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='jobia',
+            name='objeto_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='jobia',
+            name='tipo',
+            field=models.CharField(choices=[('PLANO_REVISAO', 'Revisão do Plano de Tratamento'), ('DOCUMENTACAO', 'Documentação de Sessão'), ('TAREFA', 'Tarefa/Exercício'), ('CONTEUDO', 'Conteúdo Educacional'), ('LOTE_TAREFAS', 'Tarefas em Lote')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0010_jobia_lote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentacaosessao',
+            name='taxa_compactacao',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentacaosessao',
+            name='tokens_anotacoes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentacaosessao',
+            name='tokens_prompt',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:35
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+CAMPOS_REVISAO = ['diagnostico_base', 'metas_tratamento', 'abordagem', 'frequencia_sessoes']
+
+
+def marcar_planos_revisados(apps, schema_editor):
+    # Planos que já têm feedback: o feedback vale para os campos atuais
+    PlanoTratamento = apps.get_model('psico_saas', 'PlanoTratamento')
+    planos = (PlanoTratamento.objects
+              .exclude(feedback_ia__isnull=True).exclude(feedback_ia='')
+              .exclude(feedback_ia__startswith='Erro'))
+    for plano in planos.iterator():
+        campos = {campo: (getattr(plano, campo) or '').strip() for campo in CAMPOS_REVISAO}
+        bruto = json.dumps(campos, sort_keys=True, ensure_ascii=False)
+        plano.hash_revisao = hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+        plano.snapshot_revisao = campos
+        plano.save(update_fields=['hash_revisao', 'snapshot_revisao'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0011_documentacao_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planotratamento',
+            name='hash_revisao',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='planotratamento',
+            name='snapshot_revisao',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(marcar_planos_revisados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0012_plano_revisao_incremental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('endpoint', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=50)),
+                ('chamadas', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('timeouts', models.PositiveIntegerField(default=0)),
+                ('limitadas', models.PositiveIntegerField(default=0)),
+                ('cache_hits', models.PositiveIntegerField(default=0)),
+                ('tokens_prompt', models.PositiveBigIntegerField(default=0)),
+                ('tokens_completion', models.PositiveBigIntegerField(default=0)),
+                ('latencia_total_ms', models.PositiveBigIntegerField(default=0)),
+                ('histograma_latencia', models.JSONField(blank=True, default=list)),
+                ('histograma_primeiro_token', models.JSONField(blank=True, default=list)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Métrica da IA',
+                'verbose_name_plural': 'Métricas da IA',
+                'ordering': ['-dia', 'endpoint'],
+                'constraints': [models.UniqueConstraint(fields=('dia', 'endpoint', 'modelo'), name='metrica_ia_unica')],
+            },
+        ),
+    ]
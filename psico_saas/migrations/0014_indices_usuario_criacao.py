@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0013_metricaia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conteudoeducacional',
+            index=models.Index(fields=['usuario', '-data_criacao'], name='conteudo_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentacaosessao',
+            index=models.Index(fields=['usuario', '-data_criacao'], name='doc_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentacaosessao',
+            index=models.Index(fields=['paciente', '-data_criacao'], name='doc_paciente_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planotratamento',
+            index=models.Index(fields=['usuario', '-data_criacao'], name='plano_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planotratamento',
+            index=models.Index(fields=['paciente', '-data_criacao'], name='plano_paciente_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefaexercicios',
+            index=models.Index(fields=['usuario', '-data_criacao'], name='tarefa_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefaexercicios',
+            index=models.Index(fields=['paciente', '-data_criacao'], name='tarefa_paciente_criacao_idx'),
+        ),
+    ]
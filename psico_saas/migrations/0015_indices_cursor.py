@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0014_indices_usuario_criacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='conteudoeducacional',
+            name='conteudo_usuario_criacao_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='documentacaosessao',
+            name='doc_usuario_criacao_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='planotratamento',
+            name='plano_usuario_criacao_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tarefaexercicios',
+            name='tarefa_usuario_criacao_idx',
+        ),
+        migrations.AddIndex(
+            model_name='conteudoeducacional',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='conteudo_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentacaosessao',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='doc_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planotratamento',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='plano_usuario_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefaexercicios',
+            index=models.Index(fields=['usuario', '-data_criacao', '-id'], name='tarefa_usuario_criacao_idx'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Índice de texto completo específico de cada banco (consultado por psico_saas/busca.py)
+POSTGRES_CRIAR = [
+    """
+    ALTER TABLE psico_saas_indicebusca ADD COLUMN vetor tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('portuguese', coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('portuguese', coalesce(conteudo, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX indice_busca_vetor_gin ON psico_saas_indicebusca USING GIN (vetor)",
+]
+POSTGRES_REMOVER = [
+    "DROP INDEX IF EXISTS indice_busca_vetor_gin",
+    "ALTER TABLE psico_saas_indicebusca DROP COLUMN IF EXISTS vetor",
+]
+
+# FTS5 com cópia do texto (snippet/highlight) e o dono como token ("u<id>"),
+# para o filtro por usuário ser resolvido dentro do próprio índice
+SQLITE_CRIAR = [
+    """
+    CREATE VIRTUAL TABLE psico_saas_busca_fts USING fts5(
+        dono, titulo, conteudo, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_ai AFTER INSERT ON psico_saas_indicebusca BEGIN
+        INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo)
+        VALUES (new.id, 'u' || new.usuario_id, new.titulo, new.conteudo);
+    END
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_ad AFTER DELETE ON psico_saas_indicebusca BEGIN
+        DELETE FROM psico_saas_busca_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_au AFTER UPDATE ON psico_saas_indicebusca BEGIN
+        DELETE FROM psico_saas_busca_fts WHERE rowid = old.id;
+        INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo)
+        VALUES (new.id, 'u' || new.usuario_id, new.titulo, new.conteudo);
+    END
+    """,
+]
+SQLITE_REMOVER = [
+    "DROP TRIGGER IF EXISTS psico_saas_busca_au",
+    "DROP TRIGGER IF EXISTS psico_saas_busca_ad",
+    "DROP TRIGGER IF EXISTS psico_saas_busca_ai",
+    "DROP TABLE IF EXISTS psico_saas_busca_fts",
+]
+
+
+def _executar(schema_editor, comandos):
+    for sql in comandos.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def criar_indice_texto(apps, schema_editor):
+    _executar(schema_editor, {'postgresql': POSTGRES_CRIAR, 'sqlite': SQLITE_CRIAR})
+
+
+def remover_indice_texto(apps, schema_editor):
+    _executar(schema_editor, {'postgresql': POSTGRES_REMOVER, 'sqlite': SQLITE_REMOVER})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0015_indices_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndiceBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('DOCUMENTACAO', 'Documentação de Sessão'), ('PLANO', 'Plano de Tratamento'), ('TAREFA', 'Exercício')], max_length=20)),
+                ('objeto_id', models.PositiveIntegerField()),
+                ('titulo', models.CharField(max_length=255)),
+                ('conteudo', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Índice de Busca',
+                'verbose_name_plural': 'Índice de Busca',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='indice_busca_objeto_unico')],
+            },
+        ),
+        migrations.RunPython(criar_indice_texto, remover_indice_texto),
+    ]
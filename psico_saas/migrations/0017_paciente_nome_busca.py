@@ -0,0 +1,67 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:53
+
+import logging
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _normalizar(nome):
+    # Cópia de models.normalizar_nome (a migração não depende do código atual do app)
+    decomposto = unicodedata.normalize('NFKD', nome or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
+
+
+def preencher_nome_busca(apps, schema_editor):
+    Paciente = apps.get_model('psico_saas', 'Paciente')
+    pacientes = list(Paciente.objects.only('id', 'nome_completo'))
+    for paciente in pacientes:
+        paciente.nome_busca = _normalizar(paciente.nome_completo)
+    Paciente.objects.bulk_update(pacientes, ['nome_busca'], batch_size=500)
+
+
+def criar_indice_trigrama(apps, schema_editor):
+    # PostgreSQL: com pg_trgm, o GIN atende tanto o prefixo ('ana%') quanto o
+    # início de sobrenome ('% silva%'). Sem permissão para criar a extensão,
+    # fica só o índice (usuario, nome_busca)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute(
+                "CREATE INDEX paciente_nome_busca_trgm ON psico_saas_paciente "
+                "USING GIN (nome_busca gin_trgm_ops)")
+    except Exception as e:
+        logger.warning("Índice trigrama de pacientes não criado (%s); a busca usa o índice (usuario, nome_busca).", e)
+
+
+def remover_indice_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS paciente_nome_busca_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0016_indice_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='nome_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['usuario', 'nome_busca'], name='paciente_nome_busca_idx', opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.RunPython(criar_indice_trigrama, remover_indice_trigrama),
+    ]
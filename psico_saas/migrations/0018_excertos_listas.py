@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:14
+
+import re
+
+from django.db import migrations, models
+
+# Cópia de models.gerar_excerto (a migração não depende do código atual do app)
+MARCACAO_MARKDOWN = re.compile(r'[#*`>|]+|^\s*[-+]\s+', re.MULTILINE)
+
+EXCERTOS = [
+    ('PlanoTratamento', 'abordagem_excerto', 'abordagem'),
+    ('DocumentacaoSessao', 'resumo_excerto', 'resumo_ia'),
+    ('TarefaExercicios', 'exercicio_excerto', 'exercicio_ia'),
+    ('ConteudoEducacional', 'conteudo_excerto', 'conteudo_gerado'),
+]
+
+
+def _excerto(texto, tamanho):
+    linha = ' '.join(MARCACAO_MARKDOWN.sub(' ', texto or '').split())
+    if len(linha) <= tamanho:
+        return linha
+    return linha[:tamanho - 1].rstrip() + '…'
+
+
+def preencher_excertos(apps, schema_editor):
+    # Em blocos: os textos de origem são longos, a tabela não vem inteira para a memória
+    for nome_modelo, excerto, origem in EXCERTOS:
+        modelo = apps.get_model('psico_saas', nome_modelo)
+        tamanho = modelo._meta.get_field(excerto).max_length
+        consulta = modelo.objects.exclude(**{f'{origem}__isnull': True}).only('id', origem)
+        bloco = []
+        for objeto in consulta.iterator(chunk_size=500):
+            setattr(objeto, excerto, _excerto(getattr(objeto, origem), tamanho))
+            bloco.append(objeto)
+            if len(bloco) >= 500:
+                modelo.objects.bulk_update(bloco, [excerto])
+                bloco = []
+        if bloco:
+            modelo.objects.bulk_update(bloco, [excerto])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0017_paciente_nome_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conteudoeducacional',
+            name='conteudo_excerto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='documentacaosessao',
+            name='resumo_excerto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=160),
+        ),
+        migrations.AddField(
+            model_name='planotratamento',
+            name='abordagem_excerto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='tarefaexercicios',
+            name='exercicio_excerto',
+            field=models.CharField(blank=True, default='', editable=False, max_length=160),
+        ),
+        migrations.RunPython(preencher_excertos, migrations.RunPython.noop),
+    ]
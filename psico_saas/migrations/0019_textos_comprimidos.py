@@ -0,0 +1,115 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:17
+
+import base64
+import zlib
+
+import psico_saas.compressao
+from django.conf import settings
+from django.db import migrations, transaction
+
+CAMPOS = [
+    ('DocumentacaoSessao', ['anotacoes_brutas', 'resumo_ia']),
+    ('TarefaExercicios', ['exercicio_ia']),
+    ('ConteudoEducacional', ['conteudo_gerado']),
+]
+
+# Cópia do formato de psico_saas.compressao (a migração não depende do código
+# atual do app): "\x1f" + algoritmo ("z" = zlib, "s" = zstd) + ":" + base64.
+# Aqui sempre se grava zlib, que o app lê qualquer que seja o ALGORITMO.
+MARCADOR = '\x1f'
+LOTE = 500
+
+
+def _config():
+    config = {'HABILITADO': True, 'NIVEL': 6, 'TAMANHO_MINIMO': 512}
+    config.update(getattr(settings, 'COMPRESSAO_TEXTO', {}))
+    return config
+
+
+def _e_comprimido(valor):
+    return isinstance(valor, str) and valor[:1] == MARCADOR and valor[2:3] == ':'
+
+
+def _comprimir(texto, config):
+    if (not config['HABILITADO'] or not isinstance(texto, str)
+            or len(texto) < config['TAMANHO_MINIMO'] or _e_comprimido(texto)):
+        return texto
+    bruto = texto.encode('utf-8')
+    gravado = f"{MARCADOR}z:{base64.b64encode(zlib.compress(bruto, config['NIVEL'])).decode('ascii')}"
+    return gravado if len(gravado) < len(bruto) else texto
+
+
+def _descomprimir(valor, config):
+    if not _e_comprimido(valor):
+        return valor
+    dados = base64.b64decode(valor[3:])
+    if valor[1] == 's':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(dados).decode('utf-8')
+    return zlib.decompress(dados).decode('utf-8')
+
+
+def _converter(apps, converter):
+    # Em lotes por pk, cada lote na sua transação: as tabelas não vêm inteiras para a memória
+    config = _config()
+    for nome_modelo, campos in CAMPOS:
+        modelo = apps.get_model('psico_saas', nome_modelo)
+        ultimo_pk = 0
+        while True:
+            linhas = list(modelo.objects.filter(pk__gt=ultimo_pk).order_by('pk')
+                          .values_list('pk', *campos)[:LOTE])
+            if not linhas:
+                break
+            ultimo_pk = linhas[-1][0]
+            objetos = []
+            for pk, *valores in linhas:
+                novos = [converter(valor, config) for valor in valores]
+                if novos != valores:
+                    objetos.append(modelo(pk=pk, **dict(zip(campos, novos))))
+            if objetos:
+                with transaction.atomic():
+                    modelo.objects.bulk_update(objetos, campos)
+
+
+# Roda com os campos ainda como TextField (antes dos AlterField, e depois deles
+# ao desfazer): os valores lidos/gravados aqui são exatamente os da coluna
+def comprimir_existentes(apps, schema_editor):
+    _converter(apps, _comprimir)
+
+
+def descomprimir_existentes(apps, schema_editor):
+    _converter(apps, _descomprimir)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0018_excertos_listas'),
+    ]
+
+    operations = [
+        migrations.RunPython(comprimir_existentes, descomprimir_existentes),
+        # A coluna continua TEXT: só o estado muda (no SQLite o AlterField recriaria as tabelas)
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='conteudoeducacional',
+                name='conteudo_gerado',
+                field=psico_saas.compressao.TextoComprimidoField(blank=True, null=True),
+            ),
+            migrations.AlterField(
+                model_name='documentacaosessao',
+                name='anotacoes_brutas',
+                field=psico_saas.compressao.TextoComprimidoField(),
+            ),
+            migrations.AlterField(
+                model_name='documentacaosessao',
+                name='resumo_ia',
+                field=psico_saas.compressao.TextoComprimidoField(blank=True, null=True),
+            ),
+            migrations.AlterField(
+                model_name='tarefaexercicios',
+                name='exercicio_ia',
+                field=psico_saas.compressao.TextoComprimidoField(blank=True, null=True),
+            ),
+        ]),
+    ]
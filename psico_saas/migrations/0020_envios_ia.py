@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0019_textos_comprimidos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=30)),
+                ('chave', models.CharField(max_length=64)),
+                ('objeto_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='psico_saas.jobia')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Envio de IA',
+                'verbose_name_plural': 'Envios de IA',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'endpoint', 'chave'), name='envio_ia_chave_unica')],
+            },
+        ),
+    ]
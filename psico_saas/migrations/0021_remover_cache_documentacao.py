@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def remover_cache_documentacao(apps, schema_editor):
+    # Resumos de blocos de anotações gravados antes de o endpoint sair do cache
+    CacheCompletionIA = apps.get_model('psico_saas', 'CacheCompletionIA')
+    CacheCompletionIA.objects.filter(endpoint__startswith='documentacao').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0020_envios_ia'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_cache_documentacao, migrations.RunPython.noop),
+    ]
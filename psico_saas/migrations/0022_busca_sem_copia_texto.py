@@ -0,0 +1,94 @@
+from django.db import migrations
+
+# O índice de busca deixa de guardar o texto (psico_saas/busca.py): só a
+# sombra pesquisável, preenchida pelo app a partir dos registros de origem.
+# PostgreSQL: o tsvector deixa de ser gerado a partir de "conteudo" (os valores
+# e o índice GIN ficam). SQLite: FTS5 sem conteúdo (content=''), recarregada
+# aqui com o texto que ainda está na tabela.
+POSTGRES_CRIAR = [
+    "ALTER TABLE psico_saas_indicebusca ALTER COLUMN vetor DROP EXPRESSION",
+]
+SQLITE_CRIAR = [
+    "DROP TRIGGER IF EXISTS psico_saas_busca_au",
+    "DROP TRIGGER IF EXISTS psico_saas_busca_ad",
+    "DROP TRIGGER IF EXISTS psico_saas_busca_ai",
+    "DROP TABLE IF EXISTS psico_saas_busca_fts",
+    """
+    CREATE VIRTUAL TABLE psico_saas_busca_fts USING fts5(
+        dono, titulo, conteudo, content = '',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo)
+    SELECT id, 'u' || usuario_id, titulo, conteudo FROM psico_saas_indicebusca
+    """,
+]
+
+# Volta à estrutura da 0016. O texto não existe mais: o índice volta vazio e
+# precisa de "manage.py reindexar_busca --limpar"
+POSTGRES_REMOVER = [
+    "DROP INDEX IF EXISTS indice_busca_vetor_gin",
+    "ALTER TABLE psico_saas_indicebusca DROP COLUMN IF EXISTS vetor",
+    """
+    ALTER TABLE psico_saas_indicebusca ADD COLUMN vetor tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('portuguese', coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('portuguese', coalesce(conteudo, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX indice_busca_vetor_gin ON psico_saas_indicebusca USING GIN (vetor)",
+]
+SQLITE_REMOVER = [
+    "DROP TABLE IF EXISTS psico_saas_busca_fts",
+    """
+    CREATE VIRTUAL TABLE psico_saas_busca_fts USING fts5(
+        dono, titulo, conteudo, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_ai AFTER INSERT ON psico_saas_indicebusca BEGIN
+        INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo)
+        VALUES (new.id, 'u' || new.usuario_id, new.titulo, new.conteudo);
+    END
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_ad AFTER DELETE ON psico_saas_indicebusca BEGIN
+        DELETE FROM psico_saas_busca_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER psico_saas_busca_au AFTER UPDATE ON psico_saas_indicebusca BEGIN
+        DELETE FROM psico_saas_busca_fts WHERE rowid = old.id;
+        INSERT INTO psico_saas_busca_fts (rowid, dono, titulo, conteudo)
+        VALUES (new.id, 'u' || new.usuario_id, new.titulo, new.conteudo);
+    END
+    """,
+]
+
+
+def _executar(schema_editor, comandos):
+    for sql in comandos.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def criar_sombra(apps, schema_editor):
+    _executar(schema_editor, {'postgresql': POSTGRES_CRIAR, 'sqlite': SQLITE_CRIAR})
+
+
+def restaurar_indice_texto(apps, schema_editor):
+    _executar(schema_editor, {'postgresql': POSTGRES_REMOVER, 'sqlite': SQLITE_REMOVER})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0021_remover_cache_documentacao'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_sombra, restaurar_indice_texto),
+        migrations.RemoveField(
+            model_name='indicebusca',
+            name='conteudo',
+        ),
+    ]
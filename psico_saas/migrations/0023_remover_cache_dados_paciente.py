@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def remover_cache_dados_paciente(apps, schema_editor):
+    # Exercícios e revisões de plano gravados antes de esses endpoints saírem do cache:
+    # os prompts têm dados do paciente (detalhes, idade, sexo, diagnóstico)
+    CacheCompletionIA = apps.get_model('psico_saas', 'CacheCompletionIA')
+    CacheCompletionIA.objects.filter(endpoint__in=['tarefa', 'plano_revisao']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0022_busca_sem_copia_texto'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_cache_dados_paciente, migrations.RunPython.noop),
+    ]
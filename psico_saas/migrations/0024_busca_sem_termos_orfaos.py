@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def limpar_sombra_sqlite(apps, schema_editor):
+    # Até aqui a FTS5 sem conteúdo acumulava os termos das versões anteriores
+    # (psico_saas/busca.py). Sem o texto não dá para apagá-los um a um: o índice
+    # do SQLite é esvaziado e refeito pelo "reindexar_busca --pendentes" (Procfile)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("INSERT INTO psico_saas_busca_fts (psico_saas_busca_fts) VALUES ('delete-all')")
+    apps.get_model('psico_saas', 'IndiceBusca').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('psico_saas', '0023_remover_cache_dados_paciente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='indicebusca',
+            name='objeto_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.RunPython(limpar_sombra_sqlite, migrations.RunPython.noop),
+    ]
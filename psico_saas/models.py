@@ -1,13 +1,83 @@
+import hashlib
+import json
+import re
+import unicodedata
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from datetime import date
 from django.utils import timezone
 
+from .compressao import TextoComprimidoField, e_comprimido
+
 
 User = get_user_model()
 
 
+def normalizar_nome(nome):
+    """Minúsculas, sem acentos e com espaços simples: forma usada na busca de pacientes."""
+    decomposto = unicodedata.normalize('NFKD', nome or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
+
+
+def calcular_idade(data_nascimento, hoje=None):
+    """Idade em anos completos em `hoje` (padrão: a data atual), ou "N/D" sem data de nascimento."""
+    if data_nascimento:
+        today = hoje or date.today()
+        # Calcula a diferença de anos e subtrai 1 se o aniversário ainda não ocorreu este ano
+        idade = today.year - data_nascimento.year - \
+            ((today.month, today.day) <
+             (data_nascimento.month, data_nascimento.day))
+        return idade
+    return "N/D"  # Não Disponível
+
+
+# Marcações de Markdown que a IA devolve e que não fazem sentido numa prévia de uma linha
+MARCACAO_MARKDOWN = re.compile(r'[#*`>|]+|^\s*[-+]\s+', re.MULTILINE)
+
+
+def gerar_excerto(texto, tamanho):
+    """Prévia de uma linha do texto, com no máximo `tamanho` caracteres ('…' quando cortado)."""
+    linha = ' '.join(MARCACAO_MARKDOWN.sub(' ', texto or '').split())
+    if len(linha) <= tamanho:
+        return linha
+    return linha[:tamanho - 1].rstrip() + '…'
+
+
+class ExcertosMixin:
+    """
+    Mantém colunas curtas de prévia (EXCERTOS = {campo do excerto: campo de origem})
+    a cada save(), para as listas usarem .only(*CAMPOS_LISTA) sem carregar os
+    textos longos. O tamanho é o max_length do campo do excerto.
+    bulk_create não passa pelo save(): quem grava assim chama preencher_excertos().
+    """
+    EXCERTOS = {}
+
+    def preencher_excertos(self, origens=None):
+        """Recalcula os excertos (só os das `origens`, se informadas); devolve os campos alterados."""
+        adiados = self.get_deferred_fields()
+        alterados = set()
+        for excerto, origem in self.EXCERTOS.items():
+            if origem in adiados or (origens is not None and origem not in origens):
+                continue
+            if e_comprimido(self.__dict__.get(origem)):
+                # Texto ainda como veio do banco (nem lido nem alterado): o excerto gravado vale
+                continue
+            tamanho = self._meta.get_field(excerto).max_length
+            setattr(self, excerto, gerar_excerto(getattr(self, origem), tamanho))
+            alterados.add(excerto)
+        return alterados
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        alterados = self.preencher_excertos(update_fields)
+        if update_fields is not None and alterados:
+            kwargs['update_fields'] = set(update_fields) | alterados
+        super().save(*args, **kwargs)
+
+
 class Paciente(models.Model):
     SEXO_CHOICES = [
         ('M', 'Masculino'),
@@ -41,24 +111,33 @@ class Paciente(models.Model):
 
     data_cadastro = models.DateTimeField(auto_now_add=True)
 
+    # nome_completo normalizado (normalizar_nome), para a busca do seletor de pacientes
+    nome_busca = models.CharField(max_length=255, blank=True, default='', editable=False)
+
     def __str__(self):
         return self.nome_completo
 
+    def save(self, *args, **kwargs):
+        self.nome_busca = normalizar_nome(self.nome_completo)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nome_completo' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'nome_busca'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Paciente'
         verbose_name_plural = 'Pacientes'
         unique_together = ('usuario', 'nome_completo')
+        indexes = [
+            # Prefixo do nome dentro dos pacientes do usuário (consulta_pacientes em busca.py).
+            # opclasses: LIKE 'x%' no PostgreSQL com collation de idioma (ignorado no SQLite)
+            models.Index(fields=['usuario', 'nome_busca'], name='paciente_nome_busca_idx',
+                         opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ]
 
     def get_idade(self):
         """Calcula a idade do paciente com base na data de nascimento."""
-        if self.data_nascimento:
-            today = date.today()
-            # Calcula a diferença de anos e subtrai 1 se o aniversário ainda não ocorreu este ano
-            idade = today.year - self.data_nascimento.year - \
-                ((today.month, today.day) <
-                 (self.data_nascimento.month, self.data_nascimento.day))
-            return idade
-        return "N/D"  # Não Disponível
+        return calcular_idade(self.data_nascimento)
 
     def endereco_completo(self):
         """Retorna o endereço completo formatado"""
@@ -81,7 +160,7 @@ class Paciente(models.Model):
         return ''.join(parts) if parts else "Endereço não informado"
 
 
-class PlanoTratamento(models.Model):
+class PlanoTratamento(ExcertosMixin, models.Model):
     # Campos obrigatórios para o contexto do plano
     usuario = models.ForeignKey(
         User,
@@ -129,38 +208,78 @@ class PlanoTratamento(models.Model):
         help_text="O resumo ou a revisão fornecida pela Inteligência Artificial."
     )
 
+    # Controle da revisão incremental: hash dos campos da última revisão pedida
+    # e os valores em que o feedback_ia atual se baseou (para mandar só o diff)
+    hash_revisao = models.CharField(max_length=64, blank=True, null=True)
+    snapshot_revisao = models.JSONField(default=dict, blank=True)
+
+    # Prévia da abordagem para a lista de planos (ExcertosMixin)
+    abordagem_excerto = models.CharField(max_length=100, blank=True, default='', editable=False)
+
+    # Campos que a revisão da IA leva em conta
+    CAMPOS_REVISAO = ['diagnostico_base', 'metas_tratamento', 'abordagem', 'frequencia_sessoes']
+
+    EXCERTOS = {'abordagem_excerto': 'abordagem'}
+    # Projeção da lista de planos (com select_related('paciente')): sem os textos longos
+    CAMPOS_LISTA = ['id', 'titulo', 'data_inicio_prevista', 'frequencia_sessoes', 'abordagem_excerto',
+                    'data_criacao', 'paciente__id', 'paciente__nome_completo', 'paciente__data_nascimento']
+
     def __str__(self):
         return f"Plano p/ {self.paciente.nome_completo} ({self.data_inicio_prevista.strftime('%d/%m/%Y')})"
 
+    def campos_revisao(self):
+        return {campo: (getattr(self, campo) or '').strip() for campo in self.CAMPOS_REVISAO}
+
+    def calcular_hash_revisao(self):
+        bruto = json.dumps(self.campos_revisao(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
     class Meta:
-        # Se você tinha uma classe Meta aqui, mantenha-a.
-        pass
+        # Listas por psicólogo e por paciente, mais recentes primeiro
+        indexes = [
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='plano_usuario_criacao_idx'),
+            models.Index(fields=['paciente', '-data_criacao'], name='plano_paciente_criacao_idx'),
+        ]
 
 
-class DocumentacaoSessao(models.Model):
+class DocumentacaoSessao(ExcertosMixin, models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     paciente = models.ForeignKey(
         Paciente, on_delete=models.CASCADE, related_name='documentacoes', blank=True, null=True)
     data_sessao = models.DateField()
-    anotacoes_brutas = models.TextField()  # Entrada do usuário (notas/transcrição)
+    anotacoes_brutas = TextoComprimidoField()  # Entrada do usuário (notas/transcrição)
 
     # Saídas da IA
-    resumo_ia = models.TextField(blank=True, null=True)
+    resumo_ia = TextoComprimidoField(blank=True, null=True)
     sugestao_diagnostico = models.CharField(
         max_length=255, blank=True, null=True)  # CID/DSM
     padroes_linguagem = models.TextField(blank=True, null=True)
+    # Prévia do resumo para o dashboard (ExcertosMixin)
+    resumo_excerto = models.CharField(max_length=160, blank=True, default='', editable=False)
+
+    # Métricas do prompt (preenchidas na geração: psico_saas/ia_compactacao.py)
+    tokens_anotacoes = models.PositiveIntegerField(blank=True, null=True)
+    tokens_prompt = models.PositiveIntegerField(blank=True, null=True)
+    # tokens das anotações compactadas / tokens originais (1.0 = sem ganho)
+    taxa_compactacao = models.FloatField(blank=True, null=True)
 
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    EXCERTOS = {'resumo_excerto': 'resumo_ia'}
+
     def __str__(self):
         return f"Sessão de {self.data_sessao} por {self.usuario.username}"
 
     class Meta:
         verbose_name = "Documentação da Sessão"
         verbose_name_plural = "Documentações das Sessões"
+        indexes = [
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='doc_usuario_criacao_idx'),
+            models.Index(fields=['paciente', '-data_criacao'], name='doc_paciente_criacao_idx'),
+        ]
 
 
-class TarefaExercicios(models.Model):
+class TarefaExercicios(ExcertosMixin, models.Model):
     ABORDAGENS = [
         ('TCC', 'Terapia Cognitivo-Comportamental (TCC)'),
         ('PSICANALISE', 'Psicanálise'),
@@ -179,19 +298,28 @@ class TarefaExercicios(models.Model):
     detalhes_personalizacao = models.TextField(blank=True, null=True)
 
     # Saída da IA
-    exercicio_ia = models.TextField(blank=True, null=True)
+    exercicio_ia = TextoComprimidoField(blank=True, null=True)
+    # Prévia do exercício para a lista (ExcertosMixin)
+    exercicio_excerto = models.CharField(max_length=160, blank=True, default='', editable=False)
 
     data_criacao = models.DateTimeField(auto_now_add=True)
 
+    EXCERTOS = {'exercicio_excerto': 'exercicio_ia'}
+    CAMPOS_LISTA = ['id', 'abordagem_teorica', 'tema_principal', 'exercicio_excerto', 'data_criacao']
+
     def __str__(self):
         return f"Exercício de {self.paciente.nome_completo} sobre '{self.tema_principal}' ({self.abordagem_teorica})"
 
     class Meta:
         verbose_name = "Tarefa/Exercício"
         verbose_name_plural = "Tarefas/Exercícios"
+        indexes = [
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='tarefa_usuario_criacao_idx'),
+            models.Index(fields=['paciente', '-data_criacao'], name='tarefa_paciente_criacao_idx'),
+        ]
 
 
-class ConteudoEducacional(models.Model):
+class ConteudoEducacional(ExcertosMixin, models.Model):
     TIPOS_CONTEUDO = [
         ('POST_REDES_SOCIAIS', 'Post para Redes Sociais'),
         ('TEXTO_CONSULTORIO', 'Texto para Consultório'),
@@ -209,13 +337,186 @@ class ConteudoEducacional(models.Model):
     palavras_chave = models.TextField(blank=True, null=True)
 
     # Saída da IA
-    conteudo_gerado = models.TextField(blank=True, null=True)
+    conteudo_gerado = TextoComprimidoField(blank=True, null=True)
     sugestoes_titulos = models.TextField(blank=True, null=True)
     hashtags = models.TextField(blank=True, null=True)
     sugestoes_imagens = models.TextField(blank=True, null=True)  # NOVO CAMPO
+    # Prévia do conteúdo para a lista (ExcertosMixin)
+    conteudo_excerto = models.CharField(max_length=200, blank=True, default='', editable=False)
 
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
 
+    EXCERTOS = {'conteudo_excerto': 'conteudo_gerado'}
+    CAMPOS_LISTA = ['id', 'titulo', 'tipo_conteudo', 'tema_principal', 'conteudo_excerto',
+                    'data_criacao', 'data_atualizacao']
+
     def __str__(self):
         return f"{self.titulo} ({self.get_tipo_conteudo_display()})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', '-data_criacao', '-id'], name='conteudo_usuario_criacao_idx'),
+        ]
+
+
+class JobIA(models.Model):
+    """Geração de IA executada fora da requisição HTTP pelo worker (processar_jobs_ia)."""
+    TIPOS = [
+        ('PLANO_REVISAO', 'Revisão do Plano de Tratamento'),
+        ('DOCUMENTACAO', 'Documentação de Sessão'),
+        ('TAREFA', 'Tarefa/Exercício'),
+        ('CONTEUDO', 'Conteúdo Educacional'),
+        ('LOTE_TAREFAS', 'Tarefas em Lote'),
+    ]
+
+    STATUS = [
+        ('PENDENTE', 'Pendente'),
+        ('PROCESSANDO', 'Processando'),
+        ('CONCLUIDO', 'Concluído'),
+        ('ERRO', 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=30, choices=TIPOS)
+    # ID do registro (plano, documentação, tarefa ou conteúdo) que será preenchido.
+    # Jobs em lote não têm um registro único: usam 'parametros' e 'resultado'.
+    objeto_id = models.PositiveBigIntegerField(blank=True, null=True)
+    parametros = models.JSONField(default=dict, blank=True)
+    resultado = models.JSONField(default=dict, blank=True)
+
+    # Progresso por item (jobs em lote)
+    progresso_total = models.PositiveIntegerField(default=0)
+    progresso_concluido = models.PositiveIntegerField(default=0)
+
+    status = models.CharField(
+        max_length=20, choices=STATUS, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    erro = models.TextField(blank=True, null=True)
+
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(blank=True, null=True)
+    data_conclusao = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.objeto_id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Job de IA"
+        verbose_name_plural = "Jobs de IA"
+        indexes = [
+            models.Index(fields=['status', 'data_criacao']),
+        ]
+
+
+class EnvioIA(models.Model):
+    """
+    Envio de formulário/API que gera conteúdo com IA, pela chave de idempotência
+    do cliente (ver psico_saas/idempotencia.py). Um envio repetido com a mesma
+    chave reaproveita o registro e o job daqui em vez de chamar a IA de novo.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    endpoint = models.CharField(max_length=30)
+    chave = models.CharField(max_length=64)
+    # Preenchidos pelo envio original assim que existem (registro criado, job enfileirado)
+    objeto_id = models.PositiveBigIntegerField(blank=True, null=True)
+    job = models.ForeignKey(JobIA, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    data_criacao = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.endpoint} ({self.chave[:12]})"
+
+    class Meta:
+        verbose_name = "Envio de IA"
+        verbose_name_plural = "Envios de IA"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'endpoint', 'chave'], name='envio_ia_chave_unica'),
+        ]
+
+
+class CacheCompletionIA(models.Model):
+    """Camada persistente do cache de completions (ver psico_saas/ia_cache.py)."""
+    # SHA-256 de modelo + mensagens + parâmetros de amostragem
+    chave = models.CharField(max_length=64, unique=True)
+    endpoint = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=50)
+    resposta = models.TextField()
+    acessos = models.PositiveIntegerField(default=0)
+
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.endpoint} ({self.chave[:12]})"
+
+    class Meta:
+        verbose_name = "Cache de Completion da IA"
+        verbose_name_plural = "Cache de Completions da IA"
+
+
+class MetricaIA(models.Model):
+    """
+    Telemetria agregada das chamadas à IA por dia/endpoint/modelo
+    (gravada em lotes por psico_saas/ia_metricas.py).
+    Os histogramas guardam contagens por faixa de latência (ia_metricas.FAIXAS_MS).
+    """
+    dia = models.DateField()
+    endpoint = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=50)
+
+    chamadas = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    timeouts = models.PositiveIntegerField(default=0)
+    # Recusadas por falta de vaga (ia_limites) e respondidas pelo cache
+    limitadas = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(default=0)
+
+    tokens_prompt = models.PositiveBigIntegerField(default=0)
+    tokens_completion = models.PositiveBigIntegerField(default=0)
+    latencia_total_ms = models.PositiveBigIntegerField(default=0)
+    histograma_latencia = models.JSONField(default=list, blank=True)
+    histograma_primeiro_token = models.JSONField(default=list, blank=True)
+
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.dia} {self.endpoint} ({self.modelo})"
+
+    class Meta:
+        verbose_name = "Métrica da IA"
+        verbose_name_plural = "Métricas da IA"
+        ordering = ['-dia', 'endpoint']
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'endpoint', 'modelo'], name='metrica_ia_unica'),
+        ]
+
+
+class IndiceBusca(models.Model):
+    """
+    Entrada do índice de busca de documentações, planos e exercícios (ver psico_saas/busca.py).
+    Mantida pelos signals. O texto não é copiado para cá: só a sombra pesquisável, que
+    depende do banco: coluna tsvector + GIN no PostgreSQL, FTS5 sem conteúdo no SQLite
+    (migrações 0016, 0022 e 0024).
+    """
+    TIPOS = [
+        ('DOCUMENTACAO', 'Documentação de Sessão'),
+        ('PLANO', 'Plano de Tratamento'),
+        ('TAREFA', 'Exercício'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    objeto_id = models.PositiveBigIntegerField()
+    titulo = models.CharField(max_length=255)
+    data_criacao = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.objeto_id}"
+
+    class Meta:
+        verbose_name = "Índice de Busca"
+        verbose_name_plural = "Índice de Busca"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='indice_busca_objeto_unico'),
+        ]
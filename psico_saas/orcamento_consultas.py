@@ -0,0 +1,126 @@
+# psico_saas/orcamento_consultas.py
+
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------
+# ORÇAMENTO DE CONSULTAS POR REQUISIÇÃO
+# Cada view pode declarar quantas consultas SQL pode fazer
+# (@orcamento_consultas(n)); o middleware conta as consultas da requisição
+# (view + renderização do template) e, acima do orçamento:
+# - registra um aviso no log (padrão em DEBUG);
+# - com ESTRITO=True (CI), levanta OrcamentoConsultasExcedido, o que faz a
+#   requisição falhar com 500 e o teste quebrar.
+# O orçamento deve ser constante: não pode depender do número de linhas.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': False,
+    'ESTRITO': False,
+    # Orçamento das views que não declararam o seu (None = sem limite)
+    'PADRAO': None,
+}
+
+
+class OrcamentoConsultasExcedido(Exception):
+    pass
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'ORCAMENTO_CONSULTAS', {}))
+    return config
+
+
+def orcamento_consultas(maximo):
+    """Declara o número máximo de consultas SQL da view (sessão e usuário incluídos)."""
+    def decorador(view):
+        # login_required & cia. copiam o __dict__ da view, então a ordem não importa
+        view.orcamento_consultas = maximo
+        return view
+    return decorador
+
+
+# Controle de transação (savepoints de atomic() aninhado, como nos testes), não consulta
+CONTROLE_TRANSACAO = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class _Contador:
+    def __init__(self):
+        self.total = 0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(CONTROLE_TRANSACAO):
+            return execute(sql, params, many, context)
+        self.total += 1
+        if len(self.sql) < 50:
+            self.sql.append(sql)
+        return execute(sql, params, many, context)
+
+
+class OrcamentoConsultasMiddleware:
+    """
+    Conta as consultas de cada requisição e compara com o orçamento da view.
+    Funciona nas duas pilhas: no ASGI é assíncrono, e desligado só repassa a
+    requisição (sem troca de thread nem para as views de streaming).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        config = _config()
+        if not config['HABILITADO']:
+            return self.get_response(request)
+
+        contador = _Contador()
+        with connection.execute_wrapper(contador):
+            response = self.get_response(request)
+        return self._conferir(request, response, contador, config)
+
+    async def __acall__(self, request):
+        config = _config()
+        if not config['HABILITADO']:
+            return await self.get_response(request)
+
+        # A conexão é a da requisição (a mesma na thread das views síncronas)
+        contador = _Contador()
+        with connection.execute_wrapper(contador):
+            response = await self.get_response(request)
+        return self._conferir(request, response, contador, config)
+
+    def _conferir(self, request, response, contador, config):
+        orcamento = getattr(request, '_orcamento_consultas', config['PADRAO'])
+        if getattr(request, '_orcamento_ignorar', False):
+            return response
+
+        response['X-Consultas-SQL'] = str(contador.total)
+        if orcamento is not None and contador.total > orcamento:
+            mensagem = (f"{request.method} {request.path}: {contador.total} consultas SQL "
+                        f"(orçamento {orcamento})")
+            if config['ESTRITO']:
+                raise OrcamentoConsultasExcedido(mensagem + "\n" + "\n".join(contador.sql))
+            logger.warning(mensagem)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Views assíncronas consultam o banco em outras threads: não dá para contar aqui
+        if iscoroutinefunction(view_func):
+            request._orcamento_ignorar = True
+            return None
+        orcamento = getattr(view_func, 'orcamento_consultas', None)
+        if orcamento is not None:
+            request._orcamento_consultas = orcamento
+        return None
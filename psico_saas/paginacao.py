@@ -0,0 +1,223 @@
+# psico_saas/paginacao.py
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# ------------------------------------------------------------------
+# PAGINAÇÃO POR CURSOR (KEYSET)
+# Em vez de OFFSET, cada página começa logo depois da última linha da
+# anterior: WHERE (data_criacao, id) < (d, i) ORDER BY data_criacao DESC, id DESC
+# LIMIT n. Com os índices compostos o custo da página é constante, não importa
+# quantos registros o usuário tenha. A ordenação sempre termina no id para
+# ser estável (empates em data_criacao/nome não pulam nem repetem linhas).
+# O cursor é opaco para o cliente: base64 dos valores da linha-limite.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'TAMANHO_PAGINA': 50,
+    'MAX_TAMANHO_PAGINA': 200,
+}
+
+# Ordenações usadas nas listas
+RECENTES_PRIMEIRO = ('-data_criacao', '-id')
+POR_NOME = ('nome_completo', 'id')
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'PAGINACAO', {}))
+    return config
+
+
+def tamanho_pagina(valor=None):
+    """Tamanho pedido (?tamanho=), limitado ao máximo configurado."""
+    config = _config()
+    try:
+        tamanho = int(valor)
+    except (TypeError, ValueError):
+        return config['TAMANHO_PAGINA']
+    return max(1, min(tamanho, config['MAX_TAMANHO_PAGINA']))
+
+
+def _codificar(valores, voltar=False):
+    valores = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in valores]
+    bruto = json.dumps({'v': valores, 'r': int(voltar)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar(cursor, ordenacao, modelo):
+    """
+    Valores da linha-limite, já convertidos pelos campos do modelo: o cursor vem
+    do cliente, e qualquer valor adulterado vira CursorInvalido (nunca um 500).
+    """
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        dados = json.loads(bruto)
+        valores, voltar = list(dados['v']), bool(dados['r'])
+        if len(valores) != len(ordenacao):
+            raise ValueError
+
+        for i, campo in enumerate(ordenacao):
+            nome = campo.lstrip('-')
+            if nome == 'data_criacao':
+                if not isinstance(valores[i], str):
+                    raise ValueError
+                valores[i] = parse_datetime(valores[i])
+                if valores[i] is None:
+                    raise ValueError
+            else:
+                valores[i] = modelo._meta.get_field('id' if nome == 'pk' else nome).to_python(valores[i])
+                if valores[i] is None:
+                    raise ValueError
+    except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+        raise CursorInvalido("Cursor de paginação inválido.")
+    return valores, voltar
+
+
+def _depois_de(ordenacao, valores):
+    """Q para 'linhas depois de valores' na ordenação dada (comparação de tupla)."""
+    condicao = Q(pk__in=[])
+    iguais = Q()
+    for campo, valor in zip(ordenacao, valores):
+        nome = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= iguais & Q(**{f'{nome}__{operador}': valor})
+        iguais &= Q(**{nome: valor})
+    return condicao
+
+
+def _inverter(ordenacao):
+    return tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in ordenacao)
+
+
+class PaginaCursor:
+    def __init__(self, itens, proximo=None, anterior=None):
+        self.itens = itens
+        self.proximo = proximo
+        self.anterior = anterior
+        # Preenchidos por paginar_request (querystring com o cursor)
+        self.link_proximo = None
+        self.link_anterior = None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def tem_outras(self):
+        return bool(self.proximo or self.anterior)
+
+
+def paginar_por_cursor(queryset, cursor=None, ordenacao=RECENTES_PRIMEIRO, tamanho=None):
+    """
+    Uma página do queryset a partir do cursor (None = primeira página).
+    Busca tamanho + 1 linhas para saber se há página seguinte sem COUNT.
+    """
+    tamanho = tamanho or tamanho_pagina()
+    campos = [campo.lstrip('-') for campo in ordenacao]
+    voltar = False
+
+    if cursor:
+        valores, voltar = _decodificar(cursor, ordenacao, queryset.model)
+        sentido = _inverter(ordenacao) if voltar else ordenacao
+        queryset = queryset.filter(_depois_de(sentido, valores)).order_by(*sentido)
+    else:
+        queryset = queryset.order_by(*ordenacao)
+
+    itens = list(queryset[:tamanho + 1])
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if voltar:
+        itens.reverse()
+
+    if not itens:
+        return PaginaCursor([])
+
+    def valores_de(objeto):
+        return [getattr(objeto, campo) for campo in campos]
+
+    # Indo para a frente, "mais" é a próxima página; voltando, é a anterior
+    tem_proxima = ha_mais if not voltar else True
+    tem_anterior = bool(cursor) if not voltar else ha_mais
+    return PaginaCursor(
+        itens,
+        proximo=_codificar(valores_de(itens[-1])) if tem_proxima else None,
+        anterior=_codificar(valores_de(itens[0]), voltar=True) if tem_anterior else None,
+    )
+
+
+def paginar_request(request, queryset, ordenacao=RECENTES_PRIMEIRO):
+    """Versão para as views HTML: lê ?cursor= e ?tamanho= (cursor inválido volta ao início)."""
+    tamanho = tamanho_pagina(request.GET.get('tamanho'))
+    try:
+        pagina = paginar_por_cursor(queryset, request.GET.get('cursor'), ordenacao, tamanho)
+    except CursorInvalido:
+        pagina = paginar_por_cursor(queryset, None, ordenacao, tamanho)
+
+    parametros = request.GET.copy()
+    for atributo in ('proximo', 'anterior'):
+        cursor = getattr(pagina, atributo)
+        if cursor:
+            parametros['cursor'] = cursor
+            setattr(pagina, f'link_{atributo}', '?' + parametros.urlencode())
+    return pagina
+
+
+# --------------------------------------------------------------------------------------
+# DRF
+# --------------------------------------------------------------------------------------
+class PaginacaoCursor(BasePagination):
+    """Mesma paginação por cursor para a API (resposta com next/previous/results)."""
+    ordenacao = RECENTES_PRIMEIRO
+    parametro_cursor = 'cursor'
+    parametro_tamanho = 'tamanho'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordenacao = getattr(view, 'ordenacao_cursor', self.ordenacao)
+        try:
+            self.pagina = paginar_por_cursor(
+                queryset, request.query_params.get(self.parametro_cursor), ordenacao,
+                tamanho_pagina(request.query_params.get(self.parametro_tamanho)))
+        except CursorInvalido as e:
+            raise NotFound(str(e))
+        return self.pagina.itens
+
+    def _link(self, cursor):
+        if not cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.parametro_cursor, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.pagina.proximo),
+            'previous': self._link(self.pagina.anterior),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,92 @@
+# psico_saas/painel.py
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import PlanoTratamento, DocumentacaoSessao, TarefaExercicios, ConteudoEducacional
+
+# ------------------------------------------------------------------
+# RESUMO DO DASHBOARD EM CACHE
+# O dashboard é a página inicial: totais + "últimos 3" de planos, sessões e
+# exercícios. O resumo é montado com 1 consulta de totais (subconsultas
+# agregadas) + 3 consultas curtas e fica no cache por usuário; no caso comum
+# a página é uma única leitura do cache.
+# Invalidação: signals de save/delete dos modelos (signals.py) apagam a chave
+# depois do commit; quem grava com bulk_create chama invalidar_resumo().
+# O TTL cobre a corrida rara de uma leitura anterior ao commit regravar o
+# resumo antigo.
+# ------------------------------------------------------------------
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'ALIAS_CACHE': 'default',
+    'TTL_SEGUNDOS': 300,
+}
+
+MODELOS_RESUMO = (PlanoTratamento, DocumentacaoSessao, TarefaExercicios, ConteudoEducacional)
+
+
+def _config():
+    config = dict(CONFIG_PADRAO)
+    config.update(getattr(settings, 'PAINEL', {}))
+    return config
+
+
+def _chave(usuario_id):
+    return f"painel:resumo:{usuario_id}"
+
+
+def _total(modelo):
+    contagem = (modelo.objects.filter(usuario=OuterRef('pk'))
+                .order_by().values('usuario').annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(contagem, output_field=IntegerField()), Value(0))
+
+
+def montar_resumo(usuario_id):
+    """Consulta o banco: totais numa só consulta + os três 'últimos'."""
+    totais = User.objects.filter(pk=usuario_id).values(
+        total_planos=_total(PlanoTratamento),
+        total_documentacao=_total(DocumentacaoSessao),
+        total_tarefas=_total(TarefaExercicios),
+    ).first() or {'total_planos': 0, 'total_documentacao': 0, 'total_tarefas': 0}
+
+    resumo = dict(totais)
+    resumo['ultimos_planos'] = list(
+        PlanoTratamento.objects.filter(usuario_id=usuario_id)
+        .select_related('paciente')
+        .only('id', 'titulo', 'data_criacao', 'paciente__nome_completo')
+        .order_by('-data_criacao', '-id')[:3])
+    resumo['ultimas_documentacoes'] = list(
+        DocumentacaoSessao.objects.filter(usuario_id=usuario_id)
+        .select_related('paciente')
+        .only('id', 'data_sessao', 'resumo_excerto', 'data_criacao', 'paciente__nome_completo')
+        .order_by('-data_criacao', '-id')[:3])
+    resumo['ultimas_tarefas'] = list(
+        TarefaExercicios.objects.filter(usuario_id=usuario_id)
+        .only('id', 'tema_principal', 'abordagem_teorica', 'data_criacao')
+        .order_by('-data_criacao', '-id')[:3])
+    return resumo
+
+
+def resumo_dashboard(usuario_id):
+    config = _config()
+    if not config['HABILITADO']:
+        return montar_resumo(usuario_id)
+
+    cache = caches[config['ALIAS_CACHE']]
+    resumo = cache.get(_chave(usuario_id))
+    if resumo is None:
+        resumo = montar_resumo(usuario_id)
+        cache.set(_chave(usuario_id), resumo, timeout=config['TTL_SEGUNDOS'])
+    return resumo
+
+
+def invalidar_resumo(usuario_id):
+    """Apaga o resumo do usuário quando a transação atual terminar."""
+    if usuario_id is None:
+        return
+    alias = _config()['ALIAS_CACHE']
+    transaction.on_commit(lambda: caches[alias].delete(_chave(usuario_id)))
@@ -0,0 +1,63 @@
+# psico_saas/signals.py
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import busca, ia_similaridade
+from .diretorio_pacientes import invalidar_diretorio
+from .models import TarefaExercicios, Paciente
+from .painel import MODELOS_RESUMO, invalidar_resumo
+
+
+# Campos que entram no vetor de similaridade
+CAMPOS_INDEXADOS = {'abordagem_teorica', 'tema_principal', 'detalhes_personalizacao'}
+
+
+@receiver(post_save, sender=TarefaExercicios)
+def indexar_tarefa(sender, instance, update_fields=None, **kwargs):
+    # Ex: o worker gravando só exercicio_ia não muda o vetor
+    if update_fields and not CAMPOS_INDEXADOS & set(update_fields):
+        return
+    ia_similaridade.registrar_tarefa(instance)
+
+
+@receiver(post_delete, sender=TarefaExercicios)
+def desindexar_tarefa(sender, instance, **kwargs):
+    ia_similaridade.remover_tarefa(instance)
+
+
+# Resumo do dashboard (painel.py): qualquer gravação nos modelos exibidos
+# (ou no paciente, cujo nome aparece nos "últimos") invalida o cache do dono
+def invalidar_painel(sender, instance, **kwargs):
+    invalidar_resumo(instance.usuario_id)
+
+
+for _modelo in MODELOS_RESUMO + (Paciente,):
+    post_save.connect(invalidar_painel, sender=_modelo, dispatch_uid=f'painel_{_modelo.__name__}_save')
+    post_delete.connect(invalidar_painel, sender=_modelo, dispatch_uid=f'painel_{_modelo.__name__}_delete')
+
+
+# Diretório de pacientes dos formulários (diretorio_pacientes.py)
+@receiver(post_save, sender=Paciente, dispatch_uid='diretorio_pacientes_save')
+@receiver(post_delete, sender=Paciente, dispatch_uid='diretorio_pacientes_delete')
+def invalidar_diretorio_pacientes(sender, instance, **kwargs):
+    invalidar_diretorio(instance.usuario_id)
+
+
+# Índice de busca de texto completo (busca.py)
+def lembrar_indice_busca(sender, instance, **kwargs):
+    busca.lembrar_conteudo_indexado(instance)
+
+
+def atualizar_indice_busca(sender, instance, **kwargs):
+    busca.indexar(instance)
+
+
+def remover_indice_busca(sender, instance, **kwargs):
+    busca.desindexar(instance)
+
+
+for _modelo in busca.MODELOS_INDEXADOS:
+    pre_save.connect(lembrar_indice_busca, sender=_modelo, dispatch_uid=f'busca_{_modelo.__name__}_pre_save')
+    post_save.connect(atualizar_indice_busca, sender=_modelo, dispatch_uid=f'busca_{_modelo.__name__}_save')
+    post_delete.connect(remover_indice_busca, sender=_modelo, dispatch_uid=f'busca_{_modelo.__name__}_delete')
@@ -0,0 +1,119 @@
+// jobs_ia.js - Acompanhamento dos jobs de IA processados pelo worker
+
+const JobsIA = {
+    // Consulta o status do job até CONCLUIDO ou ERRO
+    aguardar: function(statusUrl, callbacks, intervalo = 1500) {
+        const consultar = () => {
+            fetch(statusUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Erro HTTP: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(job => {
+                    if (job.status === 'CONCLUIDO') {
+                        callbacks.onConcluido && callbacks.onConcluido(job);
+                    } else if (job.status === 'ERRO') {
+                        callbacks.onErro && callbacks.onErro(job.erro || 'Erro ao gerar conteúdo com a IA.');
+                    } else {
+                        callbacks.onPendente && callbacks.onPendente(job);
+                        setTimeout(consultar, intervalo);
+                    }
+                })
+                .catch(error => {
+                    callbacks.onErro && callbacks.onErro('Erro de conexão: ' + error.message);
+                });
+        };
+
+        consultar();
+    },
+
+    // Envia o formulário para um endpoint SSE e repassa os eventos (inicio, token, fim, erro)
+    transmitir: function(url, formData, callbacks) {
+        return fetch(url, {
+            method: 'POST',
+            body: formData,
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        }).then(response => {
+            const tipo = response.headers.get('Content-Type') || '';
+            if (!tipo.includes('text/event-stream')) {
+                // Erro de validação ou limite: o servidor responde JSON
+                return response.json().then(data => {
+                    callbacks.onErro && callbacks.onErro(data.error || `Erro HTTP: ${response.status}`);
+                });
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            const despachar = (bloco) => {
+                let evento = 'message';
+                let dados = '';
+                bloco.split('\n').forEach(linha => {
+                    if (linha.startsWith('event:')) evento = linha.slice(6).trim();
+                    else if (linha.startsWith('data:')) dados += linha.slice(5).trim();
+                });
+                if (!dados) return;
+
+                const payload = JSON.parse(dados);
+                const nome = 'on' + evento.charAt(0).toUpperCase() + evento.slice(1);
+                if (evento === 'erro') {
+                    callbacks.onErro && callbacks.onErro(payload.erro, payload);
+                } else if (callbacks[nome]) {
+                    callbacks[nome](payload);
+                }
+            };
+
+            const ler = () => reader.read().then(({ done, value }) => {
+                if (done) return;
+                buffer += decoder.decode(value, { stream: true });
+
+                let fim = buffer.indexOf('\n\n');
+                while (fim !== -1) {
+                    despachar(buffer.slice(0, fim));
+                    buffer = buffer.slice(fim + 2);
+                    fim = buffer.indexOf('\n\n');
+                }
+                return ler();
+            });
+
+            return ler();
+        }).catch(error => {
+            callbacks.onErro && callbacks.onErro('Erro de conexão: ' + error.message);
+        });
+    },
+
+    // Troca a chave de idempotência do formulário depois que uma geração termina:
+    // reenvios da mesma geração reaproveitam o resultado, um pedido novo gera de novo
+    renovarChave: function(form) {
+        const campo = form.querySelector('input[name="chave_idempotencia"]');
+        if (!campo) return;
+        campo.value = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID().replace(/-/g, '')
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    },
+
+    // Extrai o valor (ainda incompleto) de uma chave string de um JSON em streaming
+    extrairCampoParcial: function(jsonParcial, chave) {
+        const match = new RegExp('"' + chave + '"\\s*:\\s*"').exec(jsonParcial);
+        if (!match) return '';
+
+        let valor = '';
+        for (let i = match.index + match[0].length; i < jsonParcial.length; i++) {
+            const c = jsonParcial[i];
+            if (c === '"') break;
+            if (c === '\\') {
+                const prox = jsonParcial[++i];
+                if (prox === undefined) break;
+                valor += prox === 'n' ? '\n' : prox === 't' ? '\t' : prox;
+                continue;
+            }
+            valor += c;
+        }
+        return valor;
+    }
+};
+
+window.JobsIA = JobsIA;
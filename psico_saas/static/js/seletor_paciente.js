@@ -0,0 +1,140 @@
+// seletor_paciente.js - Busca de paciente nos formulários (includes/seletor_paciente.html)
+
+const SeletorPaciente = {
+    atraso: 150,
+
+    iniciar: function(raiz) {
+        const campoId = raiz.querySelector('input[type="hidden"]');
+        const campoTexto = raiz.querySelector('input[type="text"]');
+        const lista = raiz.querySelector('ul');
+        const url = raiz.dataset.url;
+        const respostas = {};
+        let temporizador = null;
+        let controlador = null;
+        let opcoes = [];
+        let ativo = -1;
+
+        const fechar = () => {
+            lista.hidden = true;
+            campoTexto.setAttribute('aria-expanded', 'false');
+            ativo = -1;
+        };
+
+        const escolher = (paciente) => {
+            campoId.value = paciente.id;
+            campoTexto.value = paciente.nome;
+            campoTexto.setCustomValidity('');
+            campoTexto.classList.remove('is-invalid');
+            fechar();
+            campoId.dispatchEvent(new Event('change', { bubbles: true }));
+        };
+
+        const destacar = (indice) => {
+            const itens = lista.querySelectorAll('li[role="option"]');
+            itens.forEach((item, i) => item.classList.toggle('ativo', i === indice));
+            ativo = indice;
+            if (itens[indice]) itens[indice].scrollIntoView({ block: 'nearest' });
+        };
+
+        const mostrar = (resultados) => {
+            opcoes = resultados;
+            lista.innerHTML = '';
+            if (!resultados.length) {
+                const vazio = document.createElement('li');
+                vazio.className = 'vazio';
+                vazio.textContent = 'Nenhum paciente encontrado.';
+                lista.appendChild(vazio);
+            }
+            resultados.forEach((paciente, i) => {
+                const item = document.createElement('li');
+                item.setAttribute('role', 'option');
+                item.textContent = paciente.nome;
+                const idade = document.createElement('small');
+                idade.textContent = paciente.idade === 'N/D' ? '' : `${paciente.idade} anos`;
+                item.appendChild(idade);
+                // mousedown: escolhe antes do blur do campo fechar a lista
+                item.addEventListener('mousedown', (e) => {
+                    e.preventDefault();
+                    escolher(resultados[i]);
+                });
+                lista.appendChild(item);
+            });
+            lista.hidden = false;
+            campoTexto.setAttribute('aria-expanded', 'true');
+            destacar(resultados.length ? 0 : -1);
+        };
+
+        const consultar = (texto) => {
+            if (respostas[texto]) {
+                mostrar(respostas[texto]);
+                return;
+            }
+            // Só a última digitação importa
+            if (controlador) controlador.abort();
+            controlador = new AbortController();
+            fetch(`${url}?q=${encodeURIComponent(texto)}`, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' },
+                signal: controlador.signal
+            })
+                .then(response => {
+                    if (!response.ok) throw new Error(`Erro HTTP: ${response.status}`);
+                    return response.json();
+                })
+                .then(data => {
+                    respostas[texto] = data.resultados;
+                    if (campoTexto.value.trim() === texto) mostrar(data.resultados);
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') console.error('Busca de pacientes:', error);
+                });
+        };
+
+        campoTexto.addEventListener('input', () => {
+            // Texto editado: a escolha anterior deixa de valer até escolher de novo
+            campoId.value = '';
+            clearTimeout(temporizador);
+            const texto = campoTexto.value.trim();
+            if (!texto) {
+                fechar();
+                return;
+            }
+            temporizador = setTimeout(() => consultar(texto), SeletorPaciente.atraso);
+        });
+
+        campoTexto.addEventListener('keydown', (e) => {
+            if (lista.hidden) return;
+            if (e.key === 'ArrowDown') {
+                e.preventDefault();
+                destacar(Math.min(ativo + 1, opcoes.length - 1));
+            } else if (e.key === 'ArrowUp') {
+                e.preventDefault();
+                destacar(Math.max(ativo - 1, 0));
+            } else if (e.key === 'Enter' && opcoes[ativo]) {
+                e.preventDefault();
+                escolher(opcoes[ativo]);
+            } else if (e.key === 'Escape') {
+                fechar();
+            }
+        });
+
+        campoTexto.addEventListener('blur', fechar);
+
+        // Sem paciente escolhido da lista, o formulário não é enviado
+        const form = raiz.closest('form');
+        if (form) {
+            form.addEventListener('submit', (e) => {
+                if (!campoId.value) {
+                    e.preventDefault();
+                    campoTexto.setCustomValidity('Selecione um paciente da lista.');
+                    campoTexto.classList.add('is-invalid');
+                    campoTexto.reportValidity();
+                }
+            });
+            campoTexto.addEventListener('input', () => campoTexto.setCustomValidity(''));
+        }
+    }
+};
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-seletor-paciente]').forEach(raiz => SeletorPaciente.iniciar(raiz));
+});
@@ -1,3 +1,1451 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (busca, ia_cache, ia_client, ia_compactacao, ia_jobs, ia_latencia, ia_lote, ia_metricas,
+               ia_service, ia_similaridade, painel, views)
+from rest_framework.exceptions import Throttled
+
+from .compressao import comprimir, descomprimir, e_comprimido
+from .diretorio_pacientes import diretorio_pacientes, invalidar_diretorio
+from .exportacao import em_partes_assincronas, exportar, gerar_jsonl
+from .ia_compactacao import compactar_anotacoes, dividir_em_blocos, normalizar_anotacoes
+from .ia_service import ErroIA
+from .ia_streaming import transmitir_chat
+from .management.commands import servidor_openai_falso
+from .importacao_pacientes import ArquivoInvalido, importar_pacientes, validar_linha
+from .orcamento_consultas import OrcamentoConsultasMiddleware
+from .paginacao import POR_NOME, CursorInvalido, _codificar, paginar_por_cursor, tamanho_pagina
+from .idempotencia import reservar_envio
+from .serializers import PlanoTratamentoSerializer
+from .models import (Paciente, PlanoTratamento, DocumentacaoSessao, TarefaExercicios, ConteudoEducacional, JobIA,
+                     EnvioIA, MetricaIA, gerar_excerto)
+from .ia_limites import (LimiteIAExcedido, adquirir_vagas, contexto_atual, contexto_usuario,
+                         liberar_vagas, submeter_no_contexto)
+
+
+# ------------------------------------------------------------------
+# CACHE DE COMPLETIONS DA IA
+# ------------------------------------------------------------------
+class CacheHabilitadoTests(SimpleTestCase):
+
+    def test_texto_clinico_nunca_usa_o_cache(self):
+        with override_settings(IA_CACHE={'HABILITADO': True, 'ENDPOINTS_DESATIVADOS': []}):
+            self.assertFalse(ia_cache.cache_habilitado('documentacao'))
+            self.assertFalse(ia_cache.cache_habilitado('documentacao_bloco'))
+            self.assertFalse(ia_cache.cache_habilitado('tarefa'))
+            self.assertFalse(ia_cache.cache_habilitado('plano_revisao'))
+            # Conteúdo educacional não tem dados de paciente
+            self.assertTrue(ia_cache.cache_habilitado('conteudo'))
+
+    def test_endpoint_desativado_na_configuracao(self):
+        with override_settings(IA_CACHE={'HABILITADO': True, 'ENDPOINTS_DESATIVADOS': ['conteudo']}):
+            self.assertFalse(ia_cache.cache_habilitado('conteudo'))
+
+
+# ------------------------------------------------------------------
+# CLIENTE OPENAI COMPARTILHADO
+# ------------------------------------------------------------------
+@override_settings(IA_CLIENTE={'MAX_CONEXOES': 7, 'MAX_CONEXOES_KEEPALIVE': 3})
+class ClienteIATests(SimpleTestCase):
+
+    def setUp(self):
+        for nome, valor in (('_cliente', None), ('_pid', None)):
+            patcher = mock.patch.object(ia_client, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_um_cliente_por_processo_com_pool_configurado(self):
+        with mock.patch.object(ia_client, '_parametros_http', wraps=ia_client._parametros_http) as pool:
+            cliente = ia_client.obter_cliente()
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                outros = list(executor.map(lambda _: ia_client.obter_cliente(), range(8)))
+
+        self.assertTrue(all(outro is cliente for outro in outros))
+        pool.assert_called_once()
+        self.assertEqual(ia_client._parametros_http(pool.call_args.args[0])['limits'],
+                         httpx.Limits(max_connections=7, max_keepalive_connections=3, keepalive_expiry=30))
+        # Repetições ficam com ia_latencia.py, não com o SDK
+        self.assertEqual(cliente.max_retries, 0)
+
+    def test_processo_filho_cria_o_proprio_cliente(self):
+        cliente = ia_client.obter_cliente()
+        with mock.patch.object(ia_client.os, 'getpid', return_value=ia_client._pid + 1):
+            self.assertIsNot(ia_client.obter_cliente(), cliente)
+
+    def test_cliente_assincrono_por_event_loop(self):
+        async def dois():
+            return ia_client.obter_cliente_async(), ia_client.obter_cliente_async()
+
+        primeiro, mesmo = asyncio.run(dois())
+        segundo, _ = asyncio.run(dois())
+        self.assertIs(primeiro, mesmo)
+        self.assertIsNot(primeiro, segundo)
+
+
+# ------------------------------------------------------------------
+# SERVIDOR FALSO DA OPENAI
+# Os geradores de ia_service.py rodam contra o servidor local: as respostas
+# enlatadas têm de trazer as chaves que cada prompt pede.
+# ------------------------------------------------------------------
+@override_settings(IA_CACHE={'HABILITADO': False}, IA_METRICAS={'HABILITADO': False},
+                   IA_LATENCIA={'TENTATIVAS': 1}, IA_LIMITES={'HABILITADO': False})
+class ServidorOpenAIFalsoTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.manipulador = type('Manipulador', (servidor_openai_falso.ManipuladorCompletions,), {
+            'simulador': servidor_openai_falso.Simulador('fixa', 0, 0, 0, 500, 42),
+            'tokens_por_segundo': 0,
+        })
+        cls.servidor = servidor_openai_falso.ThreadingHTTPServer(('127.0.0.1', 0), cls.manipulador)
+        cls.servidor.daemon_threads = True
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.servidor.server_address[1]}/v1'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('servidor', password='x')
+        self.paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        for alvo, nome, valor in ((ia_client, '_cliente', None), (ia_client, '_pid', None),
+                                  (ia_compactacao, '_codificador', mock.Mock(return_value=None))):
+            patcher = mock.patch.object(alvo, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        configuracao = override_settings(OPENAI_BASE_URL=self.url)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_documentacao_recebe_as_chaves_do_json(self):
+        documentacao = DocumentacaoSessao.objects.create(
+            usuario=self.usuario, paciente=self.paciente, data_sessao=datetime.date.today(),
+            anotacoes_brutas='Paciente relata ansiedade no trabalho.')
+        ia_service.gerar_documentacao_sessao(documentacao)
+        documentacao.refresh_from_db()
+        esperado = servidor_openai_falso.JSON_DOCUMENTACAO
+        self.assertEqual((documentacao.resumo_ia, documentacao.sugestao_diagnostico, documentacao.padroes_linguagem),
+                         (esperado['resumo_ia'], esperado['sugestao_diagnostico'], esperado['padroes_linguagem']))
+
+    def test_conteudo_e_revisao_do_plano(self):
+        conteudo = ConteudoEducacional.objects.create(
+            usuario=self.usuario, titulo='Ansiedade', tipo_conteudo='ARTIGO_BLOG', tema_principal='Ansiedade')
+        ia_service.gerar_conteudo_educacional(conteudo)
+        self.assertEqual(conteudo.conteudo_gerado, servidor_openai_falso.JSON_CONTEUDO['conteudo_principal'])
+        self.assertEqual(conteudo.sugestoes_titulos,
+                         ', '.join(servidor_openai_falso.JSON_CONTEUDO['sugestoes_titulos']))
+
+        plano = PlanoTratamento.objects.create(
+            usuario=self.usuario, paciente=self.paciente, titulo='Plano', diagnostico_base='F41.1',
+            metas_tratamento='Reduzir a ansiedade', abordagem='TCC', frequencia_sessoes='Semanal')
+        ia_service.gerar_feedback_plano(plano)
+        self.assertEqual(plano.feedback_ia, servidor_openai_falso.REVISAO_PLANO)
+
+    def test_stream_com_uso_de_tokens(self):
+        async def transmitir():
+            mensagens = ia_service.montar_mensagens_exercicio('TCC', 'Ansiedade')
+            return [delta async for delta in transmitir_chat('tarefa', 'gpt-3.5-turbo', mensagens)]
+
+        with mock.patch('psico_saas.ia_streaming.registrar_chamada') as registrar:
+            deltas = async_to_sync(transmitir)()
+
+        self.assertGreater(len(deltas), 10)
+        self.assertEqual(''.join(deltas).strip(), servidor_openai_falso.EXERCICIO)
+        resultado, = [c for c in registrar.call_args_list if c.args[2] == 'ok']
+        self.assertGreater(resultado.kwargs['tokens_completion'], 0)
+
+    def test_erro_simulado_vira_erro_ia(self):
+        with mock.patch.object(self.manipulador, 'simulador',
+                               servidor_openai_falso.Simulador('fixa', 0, 0, 1, 503, 42)):
+            with self.assertRaisesRegex(ErroIA, '503'):
+                ia_service._completar_chat('tarefa', 'gpt-3.5-turbo', [{'role': 'user', 'content': 'Oi'}])
+
+
+# ------------------------------------------------------------------
+# TELEMETRIA DA IA
+# Sem a thread de gravação: os testes chamam gravar_pendentes() direto.
+# ------------------------------------------------------------------
+@override_settings(IA_METRICAS={'HABILITADO': True})
+class MetricasIATests(TestCase):
+
+    def setUp(self):
+        for nome, valor in (('_pendentes', {}), ('_iniciar_thread', mock.Mock())):
+            patcher = mock.patch.object(ia_metricas, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _registrar(self, modelo='gpt-3.5-turbo'):
+        for latencia in (0.4, 0.45, 0.42):
+            ia_metricas.registrar_chamada('tarefa', modelo, 'ok', latencia=latencia, primeiro_token=0.1,
+                                          tokens_prompt=100, tokens_completion=50)
+        ia_metricas.registrar_chamada('tarefa', modelo, 'erro', latencia=2.5)
+        ia_metricas.registrar_chamada('tarefa', modelo, 'cache')
+        ia_metricas.registrar_chamada('tarefa', modelo, 'limite')
+
+    def test_gravacao_em_lote_soma_ao_que_ja_foi_gravado(self):
+        self._registrar()
+        self.assertEqual(ia_metricas.gravar_pendentes(), 1)
+        self._registrar()
+        self.assertEqual(ia_metricas.gravar_pendentes(), 1)
+        self.assertEqual(ia_metricas.gravar_pendentes(), 0)
+
+        metrica = MetricaIA.objects.get()
+        self.assertEqual((metrica.chamadas, metrica.erros, metrica.cache_hits, metrica.limitadas),
+                         (8, 2, 2, 2))
+        self.assertEqual((metrica.tokens_prompt, metrica.tokens_completion), (600, 300))
+        self.assertEqual(metrica.latencia_total_ms, 2 * (400 + 450 + 420 + 2500))
+        self.assertEqual(sum(metrica.histograma_latencia), 8)
+        self.assertEqual(metrica.histograma_primeiro_token[ia_metricas._faixa(100)], 6)
+
+    def test_percentis_interpolados_na_faixa(self):
+        histograma = ia_metricas._histograma_vazio()
+        histograma[ia_metricas._faixa(400)] = 10  # faixa 350-500 ms
+        self.assertEqual(ia_metricas.percentil(histograma, 50), 425)
+        self.assertEqual(ia_metricas.percentil(histograma, 100), 500)
+        histograma[-1] = 1  # acima da última faixa
+        self.assertEqual(ia_metricas.percentil(histograma, 99), ia_metricas.FAIXAS_MS[-1])
+        self.assertIsNone(ia_metricas.percentil(ia_metricas._histograma_vazio(), 95))
+
+    def test_resumo_soma_os_modelos_do_endpoint(self):
+        self._registrar('gpt-3.5-turbo')
+        self._registrar('gpt-3.5-turbo-1106')
+        ia_metricas.gravar_pendentes()
+
+        linha, = ia_metricas.resumo_por_dia()
+        self.assertEqual(sorted(linha['modelos']), ['gpt-3.5-turbo', 'gpt-3.5-turbo-1106'])
+        self.assertEqual((linha['chamadas'], linha['taxa_erro']), (8, 25.0))
+        # 6 de 8 chamadas na faixa 350-500 ms e 2 na de 2000-3000 ms
+        self.assertTrue(350 <= linha['p50_ms'] <= 500)
+        self.assertTrue(2000 <= linha['p95_ms'] <= 3000)
+        self.assertEqual(linha['latencia_media_ms'], (400 + 450 + 420 + 2500) // 4)
+
+
+# ------------------------------------------------------------------
+# ORÇAMENTO DE LATÊNCIA (HEDGE E REPETIÇÕES)
+# Cada teste usa um endpoint próprio: as amostras do p95 ficam no processo.
+# ------------------------------------------------------------------
+@override_settings(IA_LATENCIA={
+    'PRAZOS_SEGUNDOS': {'teste_prazo': 0.2}, 'HEDGE_INICIAL_SEGUNDOS': 0.05, 'HEDGE_MINIMO_SEGUNDOS': 0.01,
+    'BACKOFF_BASE_SEGUNDOS': 0.01, 'BACKOFF_MAX_SEGUNDOS': 0.02,
+})
+class OrcamentoLatenciaTests(SimpleTestCase):
+
+    def setUp(self):
+        self.liberar = threading.Event()
+        self.addCleanup(self.liberar.set)
+
+    def test_hedge_responde_quando_a_primeira_demora(self):
+        chamadas = []
+
+        def chamada(timeout):
+            chamadas.append(timeout)
+            if len(chamadas) == 1:
+                self.liberar.wait(5)
+                return 'lenta'
+            return 'hedge'
+
+        self.assertEqual(ia_latencia.executar_com_orcamento('teste_hedge', chamada), 'hedge')
+        self.assertEqual(len(chamadas), 2)
+        # O hedge recebe só o que sobra do prazo
+        self.assertLess(chamadas[1], chamadas[0])
+
+    def test_falha_transitoria_e_repetida(self):
+        chamadas = []
+
+        def chamada(timeout):
+            chamadas.append(timeout)
+            if len(chamadas) < 3:
+                raise openai.APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com'))
+            return 'ok'
+
+        self.assertEqual(ia_latencia.executar_com_orcamento('teste_repeticao', chamada), 'ok')
+        self.assertEqual(len(chamadas), 3)
+
+    def test_erro_definitivo_nao_e_repetido(self):
+        chamada = mock.Mock(side_effect=ValueError("pedido inválido"))
+        with self.assertRaises(ValueError):
+            ia_latencia.executar_com_orcamento('teste_definitivo', chamada)
+        chamada.assert_called_once()
+
+    def test_prazo_esgotado_nao_espera_a_resposta(self):
+        inicio = time.monotonic()
+        with self.assertRaises(ia_latencia.PrazoIAEsgotado):
+            ia_latencia.executar_com_orcamento('teste_prazo', lambda timeout: self.liberar.wait(5))
+        self.assertLess(time.monotonic() - inicio, 1)
+
+
+# ------------------------------------------------------------------
+# LIMITES DE USO DA IA
+# ------------------------------------------------------------------
+LIMITES_TESTE = {
+    'HABILITADO': True,
+    'ALIAS_CACHE': 'ia_limites',
+    'PADRAO': {'POR_USUARIO_SIMULTANEAS': 2, 'GLOBAL_SIMULTANEAS': 16,
+               'POR_USUARIO_POR_MINUTO': 10, 'RAJADA': 4},
+}
+
+
+@override_settings(IA_LIMITES=LIMITES_TESTE)
+class LimitesIATests(TestCase):
+
+    def tearDown(self):
+        caches['ia_limites'].clear()
+
+    def test_threads_do_pool_herdam_o_usuario(self):
+        with contexto_usuario(7), ThreadPoolExecutor(max_workers=2) as executor:
+            com_contexto = submeter_no_contexto(executor, contexto_atual).result()
+            sem_contexto = executor.submit(contexto_atual).result()
+        self.assertEqual(com_contexto['usuario_id'], 7)
+        self.assertIsNone(sem_contexto['usuario_id'])
+
+    def test_vagas_simultaneas_por_usuario(self):
+        primeira = adquirir_vagas('tarefa', 7)
+        segunda = adquirir_vagas('tarefa', 7)
+        with self.assertRaises(LimiteIAExcedido):
+            adquirir_vagas('tarefa', 7)
+        # Outro usuário tem as próprias vagas
+        liberar_vagas(adquirir_vagas('tarefa', 8))
+
+        liberar_vagas(primeira)
+        liberar_vagas(adquirir_vagas('tarefa', 7))
+        liberar_vagas(segunda)
+
+
+# ------------------------------------------------------------------
+# ORÇAMENTO DE CONSULTAS DAS LISTAS E DETALHES
+# Com ESTRITO, a view que passar do orçamento levanta
+# OrcamentoConsultasExcedido e o teste quebra. Cada view é testada com 1 e
+# com várias linhas: o orçamento não pode depender do número de linhas.
+# ------------------------------------------------------------------
+@override_settings(ORCAMENTO_CONSULTAS={'HABILITADO': True, 'ESTRITO': True})
+class OrcamentoConsultasTests(TestCase):
+    LINHAS = (1, 8)
+
+    def _popular(self, linhas):
+        usuario = User.objects.create_user(f'orcamento{linhas}', password='x')
+        hoje = datetime.date.today()
+        for i in range(linhas):
+            paciente = Paciente.objects.create(
+                usuario=usuario, nome_completo=f'Paciente {i}', data_nascimento=datetime.date(1990, 1, 1))
+            PlanoTratamento.objects.create(
+                usuario=usuario, paciente=paciente, titulo=f'Plano {i}', diagnostico_base='F41.1',
+                metas_tratamento='Reduzir a ansiedade', abordagem='TCC', frequencia_sessoes='Semanal')
+            DocumentacaoSessao.objects.create(
+                usuario=usuario, paciente=paciente, data_sessao=hoje,
+                anotacoes_brutas='Paciente relata ansiedade no trabalho.', resumo_ia='Ansiedade no trabalho.')
+            TarefaExercicios.objects.create(
+                usuario=usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal='Ansiedade',
+                exercicio_ia='Registro de pensamentos.')
+            ConteudoEducacional.objects.create(
+                usuario=usuario, titulo=f'Conteúdo {i}', tipo_conteudo='ARTIGO_BLOG',
+                tema_principal='Sono', conteudo_gerado='Higiene do sono.')
+        self.client.force_login(usuario)
+        return usuario
+
+    def _urls(self, usuario):
+        # listar_conteudos_educacionais e ver_conteudo_educacional ficam de fora:
+        # os templates (conteudo_educacional_lista.html, ver_conteudo_educacional.html)
+        # ainda não existem no projeto
+        paciente = Paciente.objects.filter(usuario=usuario).first()
+        return [
+            reverse('dashboard'),
+            reverse('listar_planos'),
+            reverse('ver_plano', args=[PlanoTratamento.objects.filter(usuario=usuario).first().pk]),
+            reverse('listar_tarefas'),
+            reverse('tarefas_detail', args=[TarefaExercicios.objects.filter(usuario=usuario).first().pk]),
+            reverse('listar_pacientes'),
+            reverse('ver_paciente', args=[paciente.pk]),
+            reverse('buscar_pacientes') + '?q=pac',
+            reverse('busca') + '?q=ansiedade',
+        ]
+
+    def test_views_dentro_do_orcamento(self):
+        for linhas in self.LINHAS:
+            usuario = self._popular(linhas)
+            for url in self._urls(usuario):
+                # Duas vezes: cache frio (painel, diretório) e quente
+                for _ in range(2):
+                    with self.subTest(url=url, linhas=linhas):
+                        response = self.client.get(url)
+                        self.assertEqual(response.status_code, 200)
+                        self.assertIn('X-Consultas-SQL', response)
+
+
+    def test_no_asgi_conta_as_consultas_das_views_sincronas(self):
+        usuario = self._popular(1)
+        self.client.get(reverse('listar_planos'))
+        sincrono = self.client.get(reverse('listar_planos'))['X-Consultas-SQL']
+
+        async def listar():
+            cliente = AsyncClient()
+            await cliente.aforce_login(usuario)
+            await cliente.get(reverse('listar_planos'))
+            return await cliente.get(reverse('listar_planos'))
+
+        response = async_to_sync(listar)()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Consultas-SQL'], sincrono)
+
+
+@override_settings(ORCAMENTO_CONSULTAS={'HABILITADO': False})
+class OrcamentoConsultasAsgiTests(SimpleTestCase):
+
+    def test_desligado_nao_troca_de_thread(self):
+        chamadas = []
+
+        async def proxima(request):
+            chamadas.append(request)
+            return 'resposta'
+
+        middleware = OrcamentoConsultasMiddleware(proxima)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with mock.patch('psico_saas.orcamento_consultas.connection') as conexao:
+            self.assertEqual(async_to_sync(middleware)('requisicao'), 'resposta')
+        self.assertEqual(chamadas, ['requisicao'])
+        conexao.execute_wrapper.assert_not_called()
+
+
+# ------------------------------------------------------------------
+# FILA DE JOBS DE IA
+# O gerador é trocado por um dublê: os testes cobrem a máquina de estados
+# da fila (tentativas, volta para a fila, ERRO), não a chamada à OpenAI.
+# ------------------------------------------------------------------
+@override_settings(IA_JOBS_SINCRONOS=False, IA_JOBS_MAX_TENTATIVAS=3, IA_JOBS_TIMEOUT_SEGUNDOS=300)
+class FilaJobsIATests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('fila', password='x')
+        paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        self.tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal='Ansiedade')
+
+    def _processar(self, gerador):
+        modelo, _, campos = ia_jobs.GERADORES['TAREFA']
+        with mock.patch.dict(ia_jobs.GERADORES, {'TAREFA': (modelo, gerador, campos)}):
+            job = ia_jobs.reservar_proximo_job()
+            return ia_jobs.processar_job(job)
+
+    def _falhar(self, objeto):
+        raise ErroIA("OpenAI indisponível")
+
+    def test_sucesso_conclui_o_job(self):
+        ia_jobs.enfileirar_job_ia(self.usuario, 'TAREFA', self.tarefa)
+
+        def gerar(tarefa):
+            tarefa.exercicio_ia = 'Exercício'
+            tarefa.save(update_fields=['exercicio_ia'])
+
+        job = self._processar(gerar)
+        self.assertEqual(job.status, 'CONCLUIDO')
+        self.assertEqual(ia_jobs.status_job(job)['exercicio_ia'], 'Exercício')
+
+    def test_falha_volta_para_a_fila_ate_esgotar_as_tentativas(self):
+        ia_jobs.enfileirar_job_ia(self.usuario, 'TAREFA', self.tarefa)
+
+        for tentativa in (1, 2):
+            job = self._processar(self._falhar)
+            self.assertEqual((job.status, job.tentativas), ('PENDENTE', tentativa))
+            self.assertEqual(job.erro, "OpenAI indisponível")
+
+        job = self._processar(self._falhar)
+        self.assertEqual((job.status, job.tentativas), ('ERRO', 3))
+        self.assertIsNone(ia_jobs.reservar_proximo_job())
+
+    def test_sem_vaga_volta_para_a_fila_sem_gastar_tentativa(self):
+        ia_jobs.enfileirar_job_ia(self.usuario, 'TAREFA', self.tarefa)
+
+        def sem_vaga(objeto):
+            raise LimiteIAExcedido("Sem vaga", 2)
+
+        job = self._processar(sem_vaga)
+        self.assertEqual((job.status, job.tentativas), ('PENDENTE', 0))
+
+    def test_registro_excluido_vira_erro(self):
+        ia_jobs.enfileirar_job_ia(self.usuario, 'TAREFA', self.tarefa)
+        self.tarefa.delete()
+        job = self._processar(self._falhar)
+        self.assertEqual(job.status, 'ERRO')
+
+    def test_travados_voltam_para_a_fila_so_com_tentativas_restantes(self):
+        antigo = timezone.now() - timedelta(seconds=600)
+        com_tentativas = JobIA.objects.create(
+            usuario=self.usuario, tipo='TAREFA', objeto_id=self.tarefa.pk,
+            status='PROCESSANDO', tentativas=1, data_inicio=antigo)
+        esgotado = JobIA.objects.create(
+            usuario=self.usuario, tipo='TAREFA', objeto_id=self.tarefa.pk,
+            status='PROCESSANDO', tentativas=3, data_inicio=antigo)
+        recente = JobIA.objects.create(
+            usuario=self.usuario, tipo='TAREFA', objeto_id=self.tarefa.pk,
+            status='PROCESSANDO', tentativas=3, data_inicio=timezone.now())
+
+        self.assertEqual(ia_jobs.liberar_jobs_travados(), 1)
+        for job in (com_tentativas, esgotado, recente):
+            job.refresh_from_db()
+        self.assertEqual(com_tentativas.status, 'PENDENTE')
+        self.assertEqual(esgotado.status, 'ERRO')
+        self.assertIsNotNone(esgotado.data_conclusao)
+        self.assertEqual(recente.status, 'PROCESSANDO')
+
+
+# ------------------------------------------------------------------
+# GERAÇÃO DE TAREFAS EM LOTE
+# O lote ocupa uma vaga do usuário; as chamadas dentro dele só vagas globais
+# (o paralelismo é IA_LOTE_MAX_PARALELO, não POR_USUARIO_SIMULTANEAS).
+# Vagas em LocMemCache: as threads do lote não enxergam a transação do teste.
+# ------------------------------------------------------------------
+class ClienteLento:
+    """Cliente OpenAI falso que conta quantas chamadas rodam ao mesmo tempo."""
+
+    def __init__(self, duracao=0.2):
+        self.duracao = duracao
+        self.em_andamento = 0
+        self.maximo = 0
+        self._lock = threading.Lock()
+        self.chat = mock.Mock()
+        self.chat.completions.create = self._criar
+
+    def _criar(self, **params):
+        with self._lock:
+            self.em_andamento += 1
+            self.maximo = max(self.maximo, self.em_andamento)
+        time.sleep(self.duracao)
+        with self._lock:
+            self.em_andamento -= 1
+        mensagem = mock.Mock(content='Exercício do lote')
+        return mock.Mock(choices=[mock.Mock(message=mensagem)], usage=None)
+
+
+@override_settings(
+    IA_JOBS_SINCRONOS=False, IA_LOTE_MAX_PARALELO=4,
+    IA_LIMITES={**LIMITES_TESTE, 'ESPERA_SEGUNDOS': 0},
+    IA_METRICAS={'HABILITADO': False},
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lote'},
+        'ia_limites': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lote_limites'},
+    },
+)
+class LoteTarefasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lote', password='x')
+        self.pacientes = [
+            Paciente.objects.create(usuario=self.usuario, nome_completo=f'Paciente {i}') for i in range(6)]
+
+    def tearDown(self):
+        caches['ia_limites'].clear()
+
+    def _processar(self, cliente):
+        ia_jobs.enfileirar_job_ia(self.usuario, 'LOTE_TAREFAS', parametros={
+            'pacientes': [paciente.pk for paciente in self.pacientes],
+            'abordagem_teorica': 'TCC',
+            'tema_principal': 'Ansiedade',
+        })
+        with mock.patch.object(ia_service, 'obter_cliente', return_value=cliente), \
+                mock.patch.object(ia_lote, 'exercicio_reaproveitavel', return_value=None):
+            return ia_jobs.processar_job(ia_jobs.reservar_proximo_job())
+
+    def test_paralelismo_do_lote_nao_fica_preso_as_vagas_do_usuario(self):
+        cliente = ClienteLento()
+        job = self._processar(cliente)
+
+        self.assertEqual(job.status, 'CONCLUIDO')
+        self.assertEqual(len(job.resultado['tarefas']), 6)
+        self.assertEqual(job.resultado['erros'], [])
+        # POR_USUARIO_SIMULTANEAS é 2; o lote roda com IA_LOTE_MAX_PARALELO
+        self.assertEqual(cliente.maximo, 4)
+
+    def test_lote_ocupa_uma_unica_vaga_do_usuario(self):
+        livres = []
+        cliente = ClienteLento(duracao=0)
+        criar = cliente.chat.completions.create
+
+        def criar_conferindo_vagas(**params):
+            # Durante o lote sobra uma das duas vagas para outra geração do usuário
+            vagas = adquirir_vagas('tarefa', self.usuario.pk, incluir_global=False)
+            try:
+                with self.assertRaises(LimiteIAExcedido):
+                    adquirir_vagas('tarefa', self.usuario.pk, incluir_global=False)
+            finally:
+                liberar_vagas(vagas)
+            livres.append(True)
+            return criar(**params)
+
+        cliente.chat.completions.create = criar_conferindo_vagas
+        with override_settings(IA_LOTE_MAX_PARALELO=1):
+            job = self._processar(cliente)
+
+        self.assertEqual(job.status, 'CONCLUIDO')
+        self.assertEqual(len(livres), 6)
+        # Terminado o lote, a vaga volta para o usuário
+        liberar_vagas(adquirir_vagas('tarefa', self.usuario.pk) + adquirir_vagas('tarefa', self.usuario.pk))
+
+    def test_sem_vaga_do_usuario_o_lote_volta_para_a_fila(self):
+        ocupadas = adquirir_vagas('tarefa', self.usuario.pk) + adquirir_vagas('tarefa', self.usuario.pk)
+        try:
+            cliente = ClienteLento()
+            job = self._processar(cliente)
+        finally:
+            liberar_vagas(ocupadas)
+
+        self.assertEqual((job.status, job.tentativas), ('PENDENTE', 0))
+        self.assertEqual(cliente.maximo, 0)
+
+
+# ------------------------------------------------------------------
+# STREAMS DE GERAÇÃO (SSE)
+# A OpenAI é trocada por um gerador assíncrono; a view roda no AsyncClient.
+# ------------------------------------------------------------------
+@override_settings(IA_JOBS_SINCRONOS=False, IA_LIMITES=LIMITES_TESTE)
+class StreamTarefaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('stream', password='x')
+        self.paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+
+    def tearDown(self):
+        caches['ia_limites'].clear()
+
+    def _eventos(self, transmitir):
+        async def gerar():
+            cliente = AsyncClient()
+            await cliente.aforce_login(self.usuario)
+            response = await cliente.post(reverse('tarefas_stream'), {
+                'paciente': self.paciente.pk, 'abordagem_teorica': 'TCC', 'tema_principal': 'Ansiedade'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return ''.join([parte.decode() async for parte in response.streaming_content])
+
+        with mock.patch.object(views, 'transmitir_chat', transmitir), \
+                mock.patch.object(views, 'exercicio_reaproveitavel', return_value=None):
+            corpo = async_to_sync(gerar)()
+        eventos = []
+        for bloco in corpo.strip().split('\n\n'):
+            evento, dados = bloco.split('\n')
+            eventos.append((evento.removeprefix('event: '), json.loads(dados.removeprefix('data: '))))
+        return eventos
+
+    def test_tokens_chegam_em_eventos_e_a_tarefa_e_gravada(self):
+        async def transmitir(endpoint, model, messages, **params):
+            for delta in ('Registro ', 'de ', 'pensamentos.'):
+                yield delta
+
+        eventos = self._eventos(transmitir)
+
+        self.assertEqual([evento for evento, _ in eventos], ['inicio', 'token', 'token', 'token', 'fim'])
+        tarefa = TarefaExercicios.objects.get(pk=eventos[0][1]['id'])
+        self.assertEqual(tarefa.exercicio_ia, 'Registro de pensamentos.')
+        self.assertEqual(eventos[-1][1]['exercicio_ia'], 'Registro de pensamentos.')
+        # A vaga do stream é devolvida no fim
+        liberar_vagas(adquirir_vagas('tarefa', self.usuario.pk) + adquirir_vagas('tarefa', self.usuario.pk))
+
+    def test_falha_no_meio_do_stream_vai_para_a_fila_de_jobs(self):
+        async def transmitir(endpoint, model, messages, **params):
+            yield 'Registro '
+            raise ErroIA("OpenAI indisponível")
+
+        eventos = self._eventos(transmitir)
+
+        self.assertEqual([evento for evento, _ in eventos], ['inicio', 'token', 'erro'])
+        job = JobIA.objects.get(usuario=self.usuario)
+        self.assertEqual((job.tipo, job.objeto_id, job.status), ('TAREFA', eventos[0][1]['id'], 'PENDENTE'))
+        self.assertEqual(eventos[-1][1], {'erro': "OpenAI indisponível",
+                                          'status_url': reverse('status_job_ia', args=[job.pk])})
+
+
+# ------------------------------------------------------------------
+# REVISÃO DO PLANO NA EDIÇÃO
+# ------------------------------------------------------------------
+@override_settings(IA_JOBS_SINCRONOS=False, IA_LIMITES={
+    'HABILITADO': True, 'ALIAS_CACHE': 'ia_limites',
+    'ENDPOINTS': {'plano_revisao': {'POR_USUARIO_POR_MINUTO': 1, 'RAJADA': 1}},
+})
+class EdicaoPlanoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('plano', password='x')
+        paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        self.dados = {'paciente': paciente.pk, 'titulo': 'Plano', 'diagnostico_base': 'F41.1',
+                      'metas_tratamento': 'Reduzir a ansiedade', 'abordagem': 'TCC',
+                      'frequencia_sessoes': 'Semanal', 'data_inicio_prevista': '2026-01-10'}
+        serializer = PlanoTratamentoSerializer(data=self.dados)
+        serializer.is_valid(raise_exception=True)
+        # A criação consome a única ficha do balde
+        self.plano = serializer.save(usuario=self.usuario)
+
+    def tearDown(self):
+        caches['ia_limites'].clear()
+
+    def test_sem_cota_a_edicao_nao_e_salva(self):
+        hash_revisado = self.plano.hash_revisao
+        serializer = PlanoTratamentoSerializer(
+            PlanoTratamento.objects.get(pk=self.plano.pk), data={**self.dados, 'metas_tratamento': 'Dormir melhor'})
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(Throttled):
+            serializer.save(usuario=self.usuario)
+
+        self.plano.refresh_from_db()
+        self.assertEqual(self.plano.metas_tratamento, 'Reduzir a ansiedade')
+        self.assertEqual(self.plano.hash_revisao, hash_revisado)
+        self.assertEqual(self.plano.hash_revisao, self.plano.calcular_hash_revisao())
+        self.assertEqual(JobIA.objects.filter(tipo='PLANO_REVISAO').count(), 1)
+
+    def test_edicao_fora_dos_campos_revisados_nao_consome_cota(self):
+        serializer = PlanoTratamentoSerializer(
+            PlanoTratamento.objects.get(pk=self.plano.pk), data={**self.dados, 'titulo': 'Plano novo'})
+        serializer.is_valid(raise_exception=True)
+        plano = serializer.save(usuario=self.usuario)
+
+        self.assertIsNone(plano.job_ia)
+        self.plano.refresh_from_db()
+        self.assertEqual(self.plano.titulo, 'Plano novo')
+
+
+# ------------------------------------------------------------------
+# RESUMO DO DASHBOARD EM CACHE
+# A invalidação só vale depois do commit: os callbacks são capturados.
+# ------------------------------------------------------------------
+@override_settings(PAINEL={'HABILITADO': True, 'ALIAS_CACHE': 'default'})
+class ResumoPainelTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('painel', password='x')
+        self.paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+
+    def _resumo(self):
+        with mock.patch.object(painel, 'montar_resumo', wraps=painel.montar_resumo) as montar:
+            resumo = painel.resumo_dashboard(self.usuario.pk)
+        return resumo, montar.called
+
+    def _criar_tarefa(self, tema):
+        return TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal=tema)
+
+    def test_segunda_leitura_vem_do_cache(self):
+        resumo, montou = self._resumo()
+        self.assertTrue(montou)
+        self.assertEqual(resumo['total_tarefas'], 0)
+        self.assertEqual(self._resumo(), (resumo, False))
+
+    def test_gravacao_invalida_depois_do_commit(self):
+        self._resumo()
+        with self.captureOnCommitCallbacks() as callbacks:
+            tarefa = self._criar_tarefa('Sono')
+            # Antes do commit o resumo em cache continua valendo
+            self.assertEqual(self._resumo()[0]['total_tarefas'], 0)
+        for callback in callbacks:
+            callback()
+
+        resumo, montou = self._resumo()
+        self.assertTrue(montou)
+        self.assertEqual(resumo['total_tarefas'], 1)
+        self.assertEqual([t.pk for t in resumo['ultimas_tarefas']], [tarefa.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tarefa.delete()
+        self.assertEqual(self._resumo()[0]['total_tarefas'], 0)
+
+    def test_nome_do_paciente_e_bulk_create_invalidam(self):
+        PlanoTratamento.objects.create(
+            usuario=self.usuario, paciente=self.paciente, titulo='Plano', diagnostico_base='F41.1',
+            metas_tratamento='Reduzir a ansiedade', abordagem='TCC', frequencia_sessoes='Semanal')
+        self.assertEqual(self._resumo()[0]['ultimos_planos'][0].paciente.nome_completo, 'Paciente')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paciente.nome_completo = 'Paciente Renomeado'
+            self.paciente.save()
+        self.assertEqual(self._resumo()[0]['ultimos_planos'][0].paciente.nome_completo, 'Paciente Renomeado')
+
+        # bulk_create não dispara signals: quem grava assim chama invalidar_resumo()
+        TarefaExercicios.objects.bulk_create([TarefaExercicios(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Sono')])
+        self.assertEqual(self._resumo()[0]['total_tarefas'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            painel.invalidar_resumo(self.usuario.pk)
+        self.assertEqual(self._resumo()[0]['total_tarefas'], 1)
+
+
+# ------------------------------------------------------------------
+# DIRETÓRIO DE PACIENTES EM CACHE
+# Cache em memória para as contagens de consultas não incluírem a tabela
+# do DatabaseCache.
+# ------------------------------------------------------------------
+@override_settings(
+    DIRETORIO_PACIENTES={'HABILITADO': True, 'ALIAS_CACHE': 'default'},
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'diretorio'},
+        'ia_limites': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'diretorio_limites'},
+    },
+)
+class DiretorioPacientesTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('diretorio', password='x')
+        self.bruno = Paciente.objects.create(
+            usuario=self.usuario, nome_completo='Bruno Lima', data_nascimento=datetime.date(1990, 6, 15))
+        self.ana = Paciente.objects.create(usuario=self.usuario, nome_completo='Ana Souza')
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def _request(self):
+        request = RequestFactory().get('/')
+        request.user = self.usuario
+        return request
+
+    def test_memorizado_na_requisicao_e_no_cache(self):
+        request = self._request()
+        with self.assertNumQueries(1):
+            diretorio = diretorio_pacientes(request)
+            self.assertIs(diretorio_pacientes(request), diretorio)
+        with self.assertNumQueries(0):
+            diretorio = diretorio_pacientes(self._request())
+
+        self.assertEqual([item.nome_completo for item in diretorio], ['Ana Souza', 'Bruno Lima'])
+        self.assertEqual(diretorio.get(self.ana.pk).idade, 'N/D')
+        self.assertIn(self.bruno.pk, diretorio)
+        self.assertNotIn(0, diretorio)
+
+    def test_gravacao_do_paciente_invalida_depois_do_commit(self):
+        diretorio_pacientes(self._request())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ana.nome_completo = 'Ana Souza Lima'
+            self.ana.save()
+            Paciente.objects.create(usuario=self.usuario, nome_completo='Carla Dias')
+        self.assertEqual([item.nome_completo for item in diretorio_pacientes(self._request())],
+                         ['Ana Souza Lima', 'Bruno Lima', 'Carla Dias'])
+
+        # bulk_create não dispara signals: quem grava assim chama invalidar_diretorio()
+        Paciente.objects.bulk_create([Paciente(usuario=self.usuario, nome_completo='Davi Rocha')])
+        self.assertEqual(len(diretorio_pacientes(self._request())), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar_diretorio(self.usuario.pk)
+        self.assertEqual(len(diretorio_pacientes(self._request())), 4)
+
+    def test_idade_vira_no_dia_do_aniversario(self):
+        with mock.patch.object(timezone, 'localdate', return_value=datetime.date(2026, 6, 14)):
+            self.assertEqual(diretorio_pacientes(self._request()).get(self.bruno.pk).idade, 35)
+        with mock.patch.object(timezone, 'localdate', return_value=datetime.date(2026, 6, 15)):
+            self.assertEqual(diretorio_pacientes(self._request()).get(self.bruno.pk).idade, 36)
+
+
+# ------------------------------------------------------------------
+# BUSCA DE TEXTO COMPLETO
+# ------------------------------------------------------------------
+class BuscaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('busca', password='x')
+        self.paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        self.tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Sono',
+            exercicio_ia='Registro diário de pensamentos sobre a insônia antes de dormir.')
+
+    def test_resultado_com_trecho_destacado(self):
+        resultados, ha_proxima = busca.buscar(self.usuario.pk, 'insonia')
+        self.assertFalse(ha_proxima)
+        self.assertEqual([(r.tipo, r.objeto_id) for r in resultados], [('TAREFA', self.tarefa.pk)])
+        self.assertIn('<mark>insônia</mark>', resultados[0].trecho)
+        # Só do próprio usuário
+        outro = User.objects.create_user('outro', password='x')
+        self.assertEqual(busca.buscar(outro.pk, 'insonia'), ([], False))
+
+    def test_indice_nao_guarda_o_texto(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT titulo, conteudo FROM psico_saas_busca_fts")
+            self.assertTrue(all(valor is None for linha in cursor.fetchall() for valor in linha))
+
+    def test_edicao_e_exclusao_atualizam_o_indice(self):
+        self.tarefa.exercicio_ia = 'Respiração diafragmática.'
+        self.tarefa.save()
+        self.assertEqual(busca.buscar(self.usuario.pk, 'insonia'), ([], False))
+        self.assertEqual(len(busca.buscar(self.usuario.pk, 'respiracao')[0]), 1)
+
+        self.tarefa.delete()
+        self.assertEqual(busca.buscar(self.usuario.pk, 'respiracao'), ([], False))
+
+    def _termos_na_sombra(self, termo):
+        # Direto na FTS5, sem o JOIN com o índice que esconderia termos órfãos
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM psico_saas_busca_fts WHERE psico_saas_busca_fts MATCH %s", [termo])
+            return len(cursor.fetchall())
+
+    def test_edicao_nao_deixa_termos_orfaos(self):
+        self.assertEqual(self._termos_na_sombra('insonia'), 1)
+        self.tarefa.exercicio_ia = 'Respiração diafragmática.'
+        self.tarefa.save()
+        self.assertEqual(self._termos_na_sombra('insonia'), 0)
+        self.assertEqual(self._termos_na_sombra('respiracao'), 1)
+
+        busca.indexar_varios([self.tarefa])
+        self.assertEqual(self._termos_na_sombra('respiracao'), 1)
+
+        self.tarefa.delete()
+        self.assertEqual(self._termos_na_sombra('respiracao'), 0)
+
+    def test_limpar_indice_do_usuario_apaga_a_sombra(self):
+        outro = User.objects.create_user('outro', password='x')
+        TarefaExercicios.objects.create(
+            usuario=outro, paciente=Paciente.objects.create(usuario=outro, nome_completo='Outro'),
+            abordagem_teorica='TCC', tema_principal='Sono', exercicio_ia='Diário da insônia.')
+
+        self.assertEqual(busca.limpar_indice(self.usuario.pk), 1)
+        self.assertEqual(self._termos_na_sombra('insonia'), 1)
+        self.assertEqual(len(busca.buscar(outro.pk, 'insonia')[0]), 1)
+
+    def test_reindexar_pendentes_indexa_registros_existentes(self):
+        # bulk_create não dispara signals: como as linhas anteriores ao índice
+        existente, = TarefaExercicios.objects.bulk_create([TarefaExercicios(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Estresse',
+            exercicio_ia='Relaxamento muscular progressivo.')])
+        self.assertEqual(busca.buscar(self.usuario.pk, 'relaxamento'), ([], False))
+
+        saida = io.StringIO()
+        call_command('reindexar_busca', '--pendentes', stdout=saida)
+        self.assertIn('TarefaExercicios: 1 indexado(s).', saida.getvalue())
+        resultados, _ = busca.buscar(self.usuario.pk, 'relaxamento')
+        self.assertEqual([r.objeto_id for r in resultados], [existente.pk])
+
+        saida = io.StringIO()
+        call_command('reindexar_busca', '--pendentes', stdout=saida)
+        self.assertIn('TarefaExercicios: 0 indexado(s).', saida.getvalue())
+
+    def test_sem_indice_de_texto_busca_nos_excertos(self):
+        with mock.patch.object(connection, 'vendor', 'outro'):
+            resultados, _ = busca.buscar(self.usuario.pk, 'sono')
+            self.assertEqual([r.objeto_id for r in resultados], [self.tarefa.pk])
+            self.assertEqual(busca.buscar(self.usuario.pk, 'respiracao'), ([], False))
+
+
+# ------------------------------------------------------------------
+# CHAVES DE IDEMPOTÊNCIA
+# ------------------------------------------------------------------
+class ReservaEnvioTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('envio', password='x')
+        paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        self.tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal='Ansiedade')
+
+    def test_repeticao_reaproveita_o_original(self):
+        original = reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa')
+        self.assertFalse(original.repetido)
+
+        # Original ainda sem registro: a repetição volta na hora, sem objeto nem job
+        em_andamento = reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa')
+        self.assertTrue(em_andamento.repetido)
+        self.assertIsNone(em_andamento.objeto_id)
+        self.assertIsNone(em_andamento.job)
+
+        original.concluir(self.tarefa)
+        repetido = reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa')
+        self.assertTrue(repetido.repetido)
+        self.assertEqual(repetido.objeto_id, self.tarefa.pk)
+        # A repetição não conclui nem libera o registro do original
+        repetido.liberar()
+        self.assertEqual(EnvioIA.objects.count(), 1)
+
+    def test_chave_vale_por_usuario_e_endpoint(self):
+        reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa')
+        outro = User.objects.create_user('outro', password='x')
+        self.assertFalse(reservar_envio(outro.pk, 'chave-12345', 'tarefa').repetido)
+        self.assertFalse(reservar_envio(self.usuario.pk, 'chave-12345', 'documentacao').repetido)
+
+    def test_reserva_liberada_pode_ser_reenviada(self):
+        reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa').liberar()
+        self.assertFalse(EnvioIA.objects.exists())
+        self.assertFalse(reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa').repetido)
+
+    @override_settings(IDEMPOTENCIA={'VALIDADE_SEGUNDOS': 60})
+    def test_reserva_vencida_vale_como_envio_novo(self):
+        reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa').concluir(self.tarefa)
+        EnvioIA.objects.update(data_criacao=timezone.now() - timedelta(minutes=2))
+
+        novo = reservar_envio(self.usuario.pk, 'chave-12345', 'tarefa')
+        self.assertFalse(novo.repetido)
+        self.assertIsNone(novo.objeto_id)
+
+    def test_sem_chave_nao_reserva(self):
+        envio = reservar_envio(self.usuario.pk, None, 'tarefa')
+        self.assertIsNone(envio.registro)
+        envio.concluir(self.tarefa)
+        self.assertFalse(EnvioIA.objects.exists())
+
+
+# ------------------------------------------------------------------
+# ÍNDICE DE SIMILARIDADE DOS EXERCÍCIOS
+# ------------------------------------------------------------------
+@override_settings(IA_SIMILARIDADE={'MAX_INDICES': 2, 'TTL_INDICE_SEGUNDOS': 3600})
+class IndiceSimilaridadeTests(TestCase):
+
+    def setUp(self):
+        # Cache novo a cada teste, criado com a configuração acima
+        patcher = mock.patch.object(ia_similaridade, '_indices', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_indices_em_memoria_sao_limitados(self):
+        usuarios = [User.objects.create_user(f'similar{i}', password='x') for i in range(3)]
+        for usuario in usuarios:
+            ia_similaridade.obter_indice(usuario.pk)
+
+        indices = ia_similaridade._indices
+        self.assertEqual(len(indices), 2)
+        self.assertNotIn(usuarios[0].pk, indices)
+
+    def test_signals_atualizam_o_indice_carregado(self):
+        usuario = User.objects.create_user('similar', password='x')
+        paciente = Paciente.objects.create(usuario=usuario, nome_completo='Paciente')
+        indice = ia_similaridade.obter_indice(usuario.pk)
+        tarefa = TarefaExercicios.objects.create(
+            usuario=usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal='Ansiedade social')
+
+        vetor = ia_similaridade.vetorizar('Ansiedade social', None)
+        self.assertEqual([pk for pk, _ in indice.buscar('TCC', vetor, 1)], [tarefa.pk])
+        tarefa.delete()
+        self.assertEqual(indice.buscar('TCC', vetor, 1), [])
+
+
+# ------------------------------------------------------------------
+# COMPACTAÇÃO DAS ANOTAÇÕES
+# A limpeza não pode mudar o sentido clínico da transcrição.
+# ------------------------------------------------------------------
+class CompactacaoAnotacoesTests(SimpleTestCase):
+
+    def test_gagueira_de_tres_ou_mais_repeticoes_vira_uma_palavra(self):
+        self.assertEqual(normalizar_anotacoes('Eu eu eu acho que sim'), 'Eu acho que sim')
+        self.assertEqual(normalizar_anotacoes('não, não, não, não quero'), 'não quero')
+
+    def test_repeticao_dupla_e_numeros_sao_mantidos(self):
+        for texto in ('Não, não foi isso.', 'Estou muito muito cansada.',
+                      'Nota 10 10 10 na escala.', 'Dormi mal mal-humorado'):
+            self.assertEqual(normalizar_anotacoes(texto), texto)
+
+    def test_vicios_de_fala_e_linhas_repetidas_saem(self):
+        texto = 'Paciente: hum, eu dormi mal.\nPaciente: hum, eu dormi mal.\n\n\n\nT: Entendo.'
+        self.assertEqual(normalizar_anotacoes(texto), 'Paciente: eu dormi mal.\n\nT: Entendo.')
+
+
+# Sem tiktoken (estimativa por caracteres) para o tamanho dos blocos não depender da rede
+@override_settings(IA_COMPACTACAO={'ORCAMENTO_PADRAO': 80, 'TOKENS_POR_BLOCO': 40, 'MAX_PARALELO': 4})
+class MapReduceAnotacoesTests(SimpleTestCase):
+    MODELO = 'modelo-teste'
+    TRANSCRICAO = '\n'.join(
+        f"{'Paciente' if i % 2 else 'Terapeuta'}: fala número {i} sobre o sono, o trabalho e a família."
+        for i in range(12))
+
+    def setUp(self):
+        patcher = mock.patch.object(ia_compactacao, '_codificador', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _analisar(self, endpoint, model, messages, **params):
+        indice, total = map(int, re.search(r'Trecho (\d+) de (\d+)', messages[1]['content']).groups())
+        # As últimas partes terminam primeiro: a ordem do resultado não pode depender disso
+        time.sleep((total - indice) * 0.01)
+        return json.dumps({'resumo': f'parte {indice}'}, indent=2)
+
+    def test_blocos_mantem_as_falas_inteiras(self):
+        blocos = dividir_em_blocos(self.TRANSCRICAO, self.MODELO, 40)
+        self.assertGreater(len(blocos), 1)
+        falas = [fala for bloco in blocos for fala in bloco.split('\n\n')]
+        self.assertEqual(falas, self.TRANSCRICAO.split('\n'))
+
+    def test_analises_parciais_juntadas_em_ordem(self):
+        blocos = dividir_em_blocos(normalizar_anotacoes(self.TRANSCRICAO), self.MODELO, 40)
+        with mock.patch.object(ia_service, '_completar_chat', side_effect=self._analisar) as chamada:
+            resultado = compactar_anotacoes(self.TRANSCRICAO, self.MODELO)
+
+        self.assertTrue(resultado['resumido'])
+        self.assertEqual(chamada.call_count, len(blocos))
+        self.assertEqual({c.args[0] for c in chamada.call_args_list}, {'documentacao_bloco'})
+        # JSON compacto (sem indentação), uma parte por bloco, na ordem da sessão
+        self.assertEqual(resultado['texto'], '\n\n'.join(
+            f'[Parte {i}] {{"resumo":"parte {i}"}}' for i in range(1, len(blocos) + 1)))
+        self.assertLess(resultado['tokens_compactados'], resultado['tokens_originais'])
+
+    def test_dentro_do_orcamento_nao_chama_a_ia(self):
+        with mock.patch.object(ia_service, '_completar_chat') as chamada:
+            resultado = compactar_anotacoes('Paciente: dormi mal.', self.MODELO)
+        chamada.assert_not_called()
+        self.assertEqual((resultado['texto'], resultado['resumido']), ('Paciente: dormi mal.', False))
+
+
+# ------------------------------------------------------------------
+# EXCERTOS DAS LISTAS
+# ------------------------------------------------------------------
+class ExcertosListasTests(TestCase):
+    EXERCICIO = '## Diário do sono\n\n- **Anote** a hora de deitar.\n- Anote a hora de acordar. ' + 'Detalhe. ' * 80
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('excertos', password='x')
+        self.paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+
+    def test_save_preenche_o_excerto_de_uma_linha(self):
+        tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Sono')
+        tarefa.exercicio_ia = self.EXERCICIO
+        tarefa.save(update_fields=['exercicio_ia'])
+
+        excerto = TarefaExercicios.objects.values_list('exercicio_excerto', flat=True).get(pk=tarefa.pk)
+        self.assertTrue(excerto.startswith('Diário do sono Anote a hora de deitar. Anote'))
+        self.assertEqual(len(excerto), 160)
+        self.assertTrue(excerto.endswith('…'))
+
+    def test_save_sem_ler_o_texto_comprimido_mantem_o_excerto(self):
+        tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Sono',
+            exercicio_ia=self.EXERCICIO)
+        tarefa = TarefaExercicios.objects.get(pk=tarefa.pk)
+        tarefa.tema_principal = 'Insônia'
+        self.assertEqual(tarefa.preencher_excertos(), set())
+        tarefa.save()
+        self.assertEqual(TarefaExercicios.objects.get(pk=tarefa.pk).exercicio_excerto,
+                         gerar_excerto(self.EXERCICIO, 160))
+
+    def test_migracao_preenche_os_excertos_das_linhas_existentes(self):
+        # bulk_create não passa pelo save(): como as linhas anteriores à coluna
+        tarefa, = TarefaExercicios.objects.bulk_create([TarefaExercicios(
+            usuario=self.usuario, paciente=self.paciente, abordagem_teorica='TCC', tema_principal='Sono',
+            exercicio_ia=self.EXERCICIO)])
+        plano, = PlanoTratamento.objects.bulk_create([PlanoTratamento(
+            usuario=self.usuario, paciente=self.paciente, titulo='Plano', diagnostico_base='F41.1',
+            metas_tratamento='Reduzir a ansiedade', abordagem='> TCC com **exposição gradual**',
+            frequencia_sessoes='Semanal')])
+        self.assertEqual(TarefaExercicios.objects.get(pk=tarefa.pk).exercicio_excerto, '')
+
+        migracao = importlib.import_module('psico_saas.migrations.0018_excertos_listas')
+        migracao.preencher_excertos(apps, None)
+
+        self.assertEqual(TarefaExercicios.objects.get(pk=tarefa.pk).exercicio_excerto,
+                         gerar_excerto(self.EXERCICIO, 160))
+        self.assertEqual(PlanoTratamento.objects.get(pk=plano.pk).abordagem_excerto, 'TCC com exposição gradual')
+        # A cópia da migração continua igual à função do modelo
+        self.assertEqual(migracao._excerto(self.EXERCICIO, 50), gerar_excerto(self.EXERCICIO, 50))
+
+
+# ------------------------------------------------------------------
+# COMPRESSÃO DOS TEXTOS LONGOS
+# ------------------------------------------------------------------
+class CompressaoTests(TestCase):
+    TEXTO = 'Paciente relata ansiedade antes das reuniões de trabalho. ' * 40
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('compressao', password='x')
+        paciente = Paciente.objects.create(usuario=self.usuario, nome_completo='Paciente')
+        self.tarefa = TarefaExercicios.objects.create(
+            usuario=self.usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal='Ansiedade',
+            exercicio_ia=self.TEXTO)
+
+    def test_ida_e_volta(self):
+        gravado = comprimir(self.TEXTO)
+        self.assertTrue(e_comprimido(gravado))
+        self.assertLess(len(gravado), len(self.TEXTO))
+        self.assertEqual(descomprimir(gravado), self.TEXTO)
+        # Não comprime de novo o que já está comprimido
+        self.assertEqual(comprimir(gravado), gravado)
+
+    def test_texto_curto_fica_como_esta(self):
+        self.assertEqual(comprimir('Registro de pensamentos.'), 'Registro de pensamentos.')
+        self.assertEqual(descomprimir('Registro de pensamentos.'), 'Registro de pensamentos.')
+        self.assertIsNone(comprimir(None))
+        self.assertIsNone(descomprimir(None))
+
+    def test_campo_grava_comprimido_e_le_o_texto(self):
+        gravado = TarefaExercicios.objects.values_list('exercicio_ia', flat=True).get(pk=self.tarefa.pk)
+        self.assertTrue(e_comprimido(gravado))
+        # .values() devolve o valor gravado: passa por descomprimir()
+        self.assertEqual(descomprimir(gravado), self.TEXTO)
+        self.assertEqual(TarefaExercicios.objects.get(pk=self.tarefa.pk).exercicio_ia, self.TEXTO)
+
+    def test_save_sem_ler_o_campo_nao_recomprime(self):
+        tarefa = TarefaExercicios.objects.get(pk=self.tarefa.pk)
+        gravado = tarefa.__dict__['exercicio_ia']
+        tarefa.tema_principal = 'Sono'
+        tarefa.save()
+        self.assertEqual(TarefaExercicios.objects.values_list('exercicio_ia', flat=True).get(pk=tarefa.pk), gravado)
+
+    def test_linha_antiga_em_texto_puro_continua_legivel(self):
+        TarefaExercicios.objects.filter(pk=self.tarefa.pk).update(exercicio_ia=self.TEXTO)
+        self.assertEqual(TarefaExercicios.objects.get(pk=self.tarefa.pk).exercicio_ia, self.TEXTO)
+
+    def test_copia_da_migracao_usa_o_mesmo_formato(self):
+        migracao = importlib.import_module('psico_saas.migrations.0019_textos_comprimidos')
+        config = migracao._config()
+        gravado = migracao._comprimir(self.TEXTO, config)
+        self.assertEqual(descomprimir(gravado), self.TEXTO)
+        self.assertEqual(migracao._descomprimir(comprimir(self.TEXTO), config), self.TEXTO)
+
+
+# ------------------------------------------------------------------
+# PAGINAÇÃO POR CURSOR
+# ------------------------------------------------------------------
+@override_settings(PAGINACAO={'TAMANHO_PAGINA': 3, 'MAX_TAMANHO_PAGINA': 5})
+class PaginacaoCursorTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('paginacao', password='x')
+        paciente = Paciente.objects.create(usuario=usuario, nome_completo='Paciente')
+        for i in range(7):
+            TarefaExercicios.objects.create(
+                usuario=usuario, paciente=paciente, abordagem_teorica='TCC', tema_principal=f'Tema {i}')
+        # Empates em data_criacao: o id desempata
+        agora = timezone.now()
+        TarefaExercicios.objects.filter(pk__in=TarefaExercicios.objects.order_by('pk').values('pk')[:4]) \
+            .update(data_criacao=agora)
+        TarefaExercicios.objects.exclude(data_criacao=agora).update(data_criacao=agora - timedelta(days=1))
+        self.consulta = TarefaExercicios.objects.all()
+        self.esperado = list(self.consulta.order_by('-data_criacao', '-id').values_list('pk', flat=True))
+
+    def _ids(self, pagina):
+        return [tarefa.pk for tarefa in pagina]
+
+    def test_percorre_para_frente_e_para_tras(self):
+        paginas = [paginar_por_cursor(self.consulta)]
+        self.assertIsNone(paginas[0].anterior)
+        while paginas[-1].proximo:
+            paginas.append(paginar_por_cursor(self.consulta, paginas[-1].proximo))
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertEqual([pk for p in paginas for pk in self._ids(p)], self.esperado)
+
+        # Voltando da última página pelos cursores "anterior"
+        voltando = [paginas[-1]]
+        while voltando[-1].anterior:
+            voltando.append(paginar_por_cursor(self.consulta, voltando[-1].anterior))
+        self.assertEqual([self._ids(p) for p in reversed(voltando)], [self._ids(p) for p in paginas])
+        self.assertIsNone(voltando[-1].anterior)
+        self.assertIsNotNone(voltando[-1].proximo)
+
+    def test_ultima_pagina_completa_nao_tem_proxima(self):
+        primeira = paginar_por_cursor(self.consulta, tamanho=7)
+        self.assertEqual(len(primeira), 7)
+        self.assertIsNone(primeira.proximo)
+        self.assertFalse(primeira.tem_outras)
+
+    def test_lista_vazia(self):
+        pagina = paginar_por_cursor(TarefaExercicios.objects.none())
+        self.assertEqual(len(pagina), 0)
+        self.assertFalse(pagina.tem_outras)
+
+    def test_ordenacao_por_nome(self):
+        usuario = User.objects.get(username='paginacao')
+        for nome in ('Carla', 'Ana Souza', 'Bruno', 'Ana Lima'):
+            Paciente.objects.create(usuario=usuario, nome_completo=nome)
+        consulta = Paciente.objects.filter(usuario=usuario)
+        primeira = paginar_por_cursor(consulta, ordenacao=POR_NOME, tamanho=2)
+        segunda = paginar_por_cursor(consulta, primeira.proximo, ordenacao=POR_NOME, tamanho=2)
+        nomes = [p.nome_completo for p in list(primeira) + list(segunda)]
+        self.assertEqual(nomes, ['Ana Lima', 'Ana Souza', 'Bruno', 'Carla'])
+
+    def test_cursor_invalido(self):
+        for cursor in ('não-é-base64!', _codificar([1]), _codificar(['ontem', 1]),
+                       # Adulterados: tipo errado na data e id que não é número
+                       _codificar([123, 1]), _codificar(['2024-01-01T00:00:00Z', 'abc']),
+                       _codificar(['2024-01-01T00:00:00Z', None])):
+            with self.subTest(cursor=cursor), self.assertRaises(CursorInvalido):
+                paginar_por_cursor(self.consulta, cursor)
+
+    def test_cursor_adulterado_volta_ao_inicio_na_view(self):
+        self.client.force_login(User.objects.get(username='paginacao'))
+        for cursor in (_codificar([123, 1]), _codificar(['2024-01-01T00:00:00Z', 'abc'])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('listar_tarefas'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+
+    def test_tamanho_da_pagina(self):
+        self.assertEqual(tamanho_pagina(), 3)
+        self.assertEqual(tamanho_pagina('abc'), 3)
+        self.assertEqual(tamanho_pagina('0'), 1)
+        self.assertEqual(tamanho_pagina('50'), 5)
+
+
+# ------------------------------------------------------------------
+# IMPORTAÇÃO DE PACIENTES
+# ------------------------------------------------------------------
+class ImportacaoPacientesTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('importacao', password='x')
+        Paciente.objects.create(usuario=self.usuario, nome_completo='Já Cadastrada')
+
+    def _importar(self, texto, **kwargs):
+        return importar_pacientes(self.usuario, io.BytesIO(texto.encode('utf-8')), 'pacientes.csv', **kwargs)
+
+    def test_linha_valida_e_normalizada(self):
+        valores = validar_linha({'nome_completo': ' Maria Silva ', 'data_nascimento': '05/03/1990',
+                                 'sexo': 'feminino', 'cep': 1310100, 'email': 'maria@exemplo.com'})
+        self.assertEqual(valores['nome_completo'], 'Maria Silva')
+        self.assertEqual(valores['data_nascimento'], datetime.date(1990, 3, 5))
+        self.assertEqual(valores['sexo'], 'F')
+        # CEP lido como número perde o zero à esquerda
+        self.assertEqual(valores['cep'], '01310-100')
+        self.assertIsNone(valores['telefone'])
+
+    def test_erros_por_campo(self):
+        with self.assertRaises(ValidationError) as erro:
+            validar_linha({'data_nascimento': '31/02/1990', 'email': 'sem-arroba', 'sexo': 'X',
+                           'cep': '123', 'numero': '12345678901'})
+        self.assertEqual(set(erro.exception.message_dict),
+                         {'nome_completo', 'data_nascimento', 'email', 'sexo', 'cep', 'numero'})
+
+        futuro = (datetime.date.today() + timedelta(days=1)).isoformat()
+        with self.assertRaises(ValidationError) as erro:
+            validar_linha({'nome_completo': 'Maria', 'data_nascimento': futuro})
+        self.assertEqual(list(erro.exception.message_dict), ['data_nascimento'])
+
+    def test_importa_validas_e_relata_as_demais(self):
+        relatorio = self._importar(
+            "Nome;Data de Nascimento;E-mail\n"
+            "Ana Lima;1990-01-10;ana@exemplo.com\n"
+            ";;\n"
+            "Bruno;10/13/1985;\n"
+            "Já Cadastrada;;\n"
+            "Ana Lima;;\n"
+            "Carla Souza;;\n")
+
+        self.assertEqual((relatorio.linhas, relatorio.importados, relatorio.total_erros), (5, 2, 3))
+        self.assertEqual([erro['linha'] for erro in relatorio.erros], [4, 5, 6])
+        ana = Paciente.objects.get(usuario=self.usuario, nome_completo='Ana Lima')
+        self.assertEqual(ana.nome_busca, 'ana lima')
+        self.assertEqual(ana.data_nascimento, datetime.date(1990, 1, 10))
+
+    def test_simulacao_nao_grava(self):
+        relatorio = self._importar("nome\nAna Lima\nBruno\n", simular=True)
+        self.assertEqual(relatorio.importados, 2)
+        self.assertEqual(Paciente.objects.filter(usuario=self.usuario).count(), 1)
+
+    @override_settings(IMPORTACAO_PACIENTES={'MAX_ERROS_RELATORIO': 1, 'TAMANHO_LOTE': 1})
+    def test_relatorio_limita_os_erros_guardados(self):
+        relatorio = self._importar("nome,email\nA,x\nB,y\nC,c@exemplo.com\n")
+        self.assertEqual((relatorio.importados, relatorio.total_erros), (1, 2))
+        self.assertEqual(len(relatorio.erros), 1)
+        self.assertEqual(relatorio.erros_omitidos, 1)
+
+    def test_arquivo_invalido(self):
+        with self.assertRaises(ArquivoInvalido):
+            self._importar("telefone;cidade\n9999;Curitiba\n")
+        with self.assertRaises(ArquivoInvalido):
+            importar_pacientes(self.usuario, io.BytesIO(b'nome'), 'pacientes.pdf')
+
+
+# ------------------------------------------------------------------
+# EXPORTAÇÃO DOS DADOS (LGPD)
+# ------------------------------------------------------------------
+@override_settings(EXPORTACAO={'TAMANHO_BLOCO': 2, 'TAMANHO_ENVIO': 64})
+class ExportacaoTests(TestCase):
+    ANOTACOES = 'Paciente relata insônia e ansiedade no trabalho. ' * 30
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('exportacao', password='x')
+        self.pacientes = [Paciente.objects.create(usuario=self.usuario, nome_completo=f'Paciente {i}')
+                          for i in range(3)]
+        for paciente in self.pacientes:
+            DocumentacaoSessao.objects.create(
+                usuario=self.usuario, paciente=paciente, data_sessao=datetime.date(2026, 1, 10),
+                anotacoes_brutas=self.ANOTACOES)
+        ConteudoEducacional.objects.create(usuario=self.usuario, titulo='Sono', tipo_conteudo='ARTIGO_BLOG',
+                                           tema_principal='Sono')
+        outro = User.objects.create_user('outro', password='x')
+        Paciente.objects.create(usuario=outro, nome_completo='De outro psicólogo')
+
+    def _registros(self, paciente_id=None):
+        return [json.loads(linha) for linha in gerar_jsonl(self.usuario.pk, paciente_id)]
+
+    def test_jsonl_do_usuario(self):
+        registros = self._registros()
+        self.assertEqual(registros[0]['tipo'], 'manifesto')
+        por_tipo = {}
+        for registro in registros[1:]:
+            por_tipo.setdefault(registro['tipo'], []).append(registro)
+        # Blocos de 2 por pk: as 3 linhas de cada seção saem, sem repetir
+        self.assertEqual(sorted(p['nome_completo'] for p in por_tipo['pacientes']),
+                         ['Paciente 0', 'Paciente 1', 'Paciente 2'])
+        self.assertEqual(len(por_tipo['documentacoes']), 3)
+        self.assertEqual(len(por_tipo['conteudos']), 1)
+        # Texto descomprimido e sem os campos internos
+        self.assertEqual(por_tipo['documentacoes'][0]['anotacoes_brutas'], self.ANOTACOES)
+        self.assertNotIn('resumo_excerto', por_tipo['documentacoes'][0])
+        self.assertNotIn('nome_busca', por_tipo['pacientes'][0])
+
+    def test_jsonl_de_um_paciente(self):
+        paciente = self.pacientes[1]
+        registros = self._registros(paciente.pk)
+        self.assertNotIn('conteudos', registros[0]['secoes'])
+        self.assertEqual([(r['tipo'], r.get('paciente_id', r['id'])) for r in registros[1:]],
+                         [('pacientes', paciente.pk), ('documentacoes', paciente.pk)])
+
+    def test_csv_e_zip(self):
+        conteudo, content_type, nome = exportar('csv', self.usuario.pk, secao='pacientes')
+        linhas = ''.join(conteudo).splitlines()
+        self.assertTrue(linhas[0].startswith('\ufeffid;'))
+        self.assertEqual(len(linhas), 4)
+        self.assertTrue(nome.endswith('_pacientes_%s.csv' % timezone.localdate().isoformat()))
+
+        conteudo, content_type, _ = exportar('zip', self.usuario.pk)
+        self.assertEqual(content_type, 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(conteudo))) as pacote:
+            self.assertEqual(sorted(pacote.namelist()),
+                             ['conteudos.csv', 'dados.jsonl', 'documentacoes.csv', 'manifesto.json',
+                              'pacientes.csv', 'planos.csv', 'tarefas.csv'])
+            self.assertIn(self.ANOTACOES.strip(), pacote.read('documentacoes.csv').decode('utf-8'))
+
+        with self.assertRaises(ValueError):
+            exportar('csv', self.usuario.pk)
+
+    def test_pedaco_sai_antes_de_o_gerador_terminar(self):
+        consumidos = []
+
+        def partes():
+            for i in range(3):
+                consumidos.append(i)
+                yield f'parte {i}'
+
+        async def primeira():
+            iterador = em_partes_assincronas(partes())
+            parte = await anext(iterador)
+            await iterador.aclose()
+            return parte
+
+        self.assertEqual(async_to_sync(primeira)(), 'parte 0')
+        self.assertEqual(consumidos, [0])
+
+    def test_view_no_asgi_envia_em_partes(self):
+        async def exportar_pela_view():
+            cliente = AsyncClient()
+            await cliente.aforce_login(self.usuario)
+            response = await cliente.get(reverse('exportar_dados') + '?formato=jsonl')
+            self.assertTrue(response.is_async)
+            partes = [parte async for parte in response.streaming_content]
+            return response, partes
+
+        response, partes = async_to_sync(exportar_pela_view)()
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        # Manifesto sozinho no primeiro pedaço; os registros vêm em vários outros
+        self.assertEqual(json.loads(partes[0])['tipo'], 'manifesto')
+        self.assertGreater(len(partes), 3)
@@ -18,21 +18,39 @@ urlpatterns = [
     # Tarefas/Exercícios
     path('tarefas/', views.listar_tarefas_view, name='listar_tarefas'),
     path('tarefas/nova/', views.tarefas_form_view, name='tarefas_form'),
+    path('tarefas/nova/stream/', views.tarefas_stream_view, name='tarefas_stream'),
+    path('tarefas/lote/', views.tarefas_lote_view, name='tarefas_lote'),
+    path('tarefas/similares/', views.tarefas_similares_view, name='tarefas_similares'),
     path('tarefas/<int:pk>/', views.tarefas_detail_view, name='tarefas_detail'),
     
     # Conteúdo Educacional
     path('conteudos-educacionais/', views.listar_conteudos_educacionais_view, name='listar_conteudos_educacionais'),
     path('conteudos-educacionais/novo/', views.conteudo_educacional_form_view, name='conteudo_educacional_form'),
+    path('conteudos-educacionais/novo/stream/', views.conteudo_educacional_stream_view, name='conteudo_educacional_stream'),
     path('conteudos-educacionais/ver/<int:pk>/', views.ver_conteudo_educacional_view, name='ver_conteudo_educacional'),
     path('conteudos-educacionais/salvar/<int:pk>/', views.salvar_conteudo_educacional_view, name='salvar_conteudo_educacional'),
     
     # URLs PARA PACIENTES 
     path('pacientes/', views.listar_pacientes_view, name='listar_pacientes'),
+    path('pacientes/buscar/', views.buscar_pacientes_view, name='buscar_pacientes'),
+    path('pacientes/importar/', views.importar_pacientes_view, name='importar_pacientes'),
     path('pacientes/novo/', views.paciente_form_view, name='paciente_form'),
     path('pacientes/editar/<int:pk>/', views.paciente_form_view, name='editar_paciente'),
     path('pacientes/ver/<int:pk>/', views.ver_paciente_view, name='ver_paciente'),
+    path('pacientes/exportar/<int:pk>/', views.exportar_dados_view, name='exportar_paciente'),
     path('pacientes/excluir/<int:pk>/', views.excluir_paciente_view, name='excluir_paciente'),
     
+    # Exportação dos dados (LGPD)
+    path('exportar/', views.exportar_dados_view, name='exportar_dados'),
+    
+    # Busca de texto completo
+    path('busca/', views.busca_view, name='busca'),
+    
+    # Jobs de IA (polling do status da geração)
+    path('jobs-ia/<int:pk>/status/', views.status_job_ia_view, name='status_job_ia'),
+    path('ia/cache/estatisticas/', views.estatisticas_cache_ia_view, name='estatisticas_cache_ia'),
+    path('ia/metricas/', views.metricas_ia_view, name='metricas_ia'),
+    
     # API
     path('api/planos/', views.PlanoTratamentoViewSet.as_view({'get': 'list', 'post': 'create'}), name='api_planos'),
 ]
\ No newline at end of file
@@ -1,25 +1,65 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
-from .models import PlanoTratamento, DocumentacaoSessao, TarefaExercicios, Paciente, ConteudoEducacional
+from .models import PlanoTratamento, DocumentacaoSessao, TarefaExercicios, Paciente, ConteudoEducacional, JobIA, IndiceBusca, EnvioIA
 from .serializers import PlanoTratamentoSerializer, DocumentacaoSessaoSerializer, TarefaExerciciosSerializer, ConteudoEducacionalSerializer
 from django.db.models import Count
-from .ia_service import generate_task_exercise
+from .ia_jobs import status_job, enfileirar_job_ia
+from .ia_service import (ErroIA, montar_mensagens_exercicio, PARAMETROS_EXERCICIO,
+                         montar_mensagens_conteudo, aplicar_saida_conteudo)
+from .ia_streaming import transmitir_chat, evento_sse
+from .ia_similaridade import buscar_similares, exercicio_reaproveitavel, exercicio_para_reuso
+from .ia_limites import consumir_cota, adquirir_vagas, liberar_vagas, LimiteIAExcedido
+from rest_framework.exceptions import Throttled
+from . import ia_cache
+from .ia_metricas import resumo_por_dia
+from .orcamento_consultas import orcamento_consultas
+from .paginacao import PaginacaoCursor, paginar_request, POR_NOME
+from .painel import resumo_dashboard
+from .busca import buscar, buscar_pacientes
+from .diretorio_pacientes import diretorio_pacientes
+from .exportacao import em_partes_assincronas, exportar
+from .importacao_pacientes import ArquivoInvalido, importar_pacientes, tamanho_maximo_mb
+from .idempotencia import envio_unico, nova_chave, reservar_envio, chave_da_requisicao, espera_stream
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+import asyncio
+import json
+import logging
 import re  # Importação necessária para verificar se a string é um número
+import time
+
+logger = logging.getLogger(__name__)
+
+# Repetição de um envio cujo original ainda não gravou o registro/job (idempotencia.py)
+ENVIO_EM_ANDAMENTO = "Este envio já está sendo processado. Aguarde alguns segundos e confira a lista."
+# Nas respostas JSON (409): quando o cliente deve repetir a requisição
+REPETIR_APOS = {'Retry-After': '2'}
 
 
 # ------------------------------------------------------------------
 # FUNÇÃO AUXILIAR PARA PEGAR PACIENTES
 # ------------------------------------------------------------------
 
-def get_user_pacientes(user):
-    """Retorna todos os pacientes associados ao usuário logado."""
-    return Paciente.objects.filter(usuario=user).order_by('nome_completo')
+# Os formulários usam o diretório em cache (id, nome e idade: diretorio_pacientes.py),
+# memorizado na requisição: nenhuma consulta de pacientes no caso comum.
+def paciente_selecionado(request, padrao=None):
+    """
+    Paciente já escolhido no seletor (POST reexibido após erro ou edição),
+    para o formulário não precisar carregar a lista inteira.
+    """
+    pk = str(request.POST.get('paciente', ''))
+    if pk.isdigit():
+        return diretorio_pacientes(request).get(int(pk))
+    return padrao
 
 
 # ------------------------------------------------------------------
@@ -33,12 +73,35 @@ class PlanoTratamentoViewSet(viewsets.ModelViewSet):
 
     permission_classes = [IsAuthenticated]
 
+    # Página por cursor em (data_criacao, id): ?cursor=...&tamanho=...
+    pagination_class = PaginacaoCursor
+
     def get_queryset(self):
         # Método opcional para customizações
-        return PlanoTratamento.objects.filter(usuario=self.request.user).order_by('-data_criacao')
+        return PlanoTratamento.objects.filter(usuario=self.request.user).order_by('-data_criacao', '-id')
 
     serializer_class = PlanoTratamentoSerializer
 
+    def create(self, request, *args, **kwargs):
+        # Cabeçalho Idempotency-Key: a repetição devolve o plano já criado (200), sem gerar de novo
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with envio_unico(request, 'api_plano') as envio:
+            if envio.repetido:
+                plano = self.get_queryset().filter(pk=envio.objeto_id).first() if envio.objeto_id else None
+                if plano is None:
+                    return Response({'detail': ENVIO_EM_ANDAMENTO}, status=status.HTTP_409_CONFLICT,
+                                    headers=REPETIR_APOS)
+                return Response(self.get_serializer(plano).data, status=status.HTTP_200_OK)
+
+            self.perform_create(serializer)
+            envio.concluir(serializer.instance, serializer.instance.job_ia)
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=self.get_success_headers(serializer.data))
+
+    def perform_create(self, serializer):
+        serializer.save(usuario=self.request.user)
+
 
 # ------------------------------------------------------------------
 # 2. VIEW DO FORMULÁRIO (FRONTEND)
@@ -55,7 +118,7 @@ def plano_form_view(request, pk=None):
     # 1. Carregar Plano Existente (Edição)
     if pk:
         plano_instance = get_object_or_404(
-            PlanoTratamento, pk=pk, usuario=request.user)
+            PlanoTratamento.objects.select_related('paciente'), pk=pk, usuario=request.user)
         is_editing = True
 
     # 2. Lógica POST (Submissão do Formulário)
@@ -86,30 +149,36 @@ def plano_form_view(request, pk=None):
         )
 
         if serializer.is_valid():
-            try:
-                # Associa o usuário antes de salvar
-                plano_salvo = serializer.save(usuario=request.user)
-                return redirect('listar_planos')
-
-            except Exception as e:
-                error_message = f"Erro ao salvar no banco de dados: {str(e)}"
-                # Log mais detalhado para debugging
-                print(f"Erro detalhado: {e}")
+            with envio_unico(request, 'plano') as envio:
+                if envio.repetido:
+                    # Reenvio do mesmo formulário: o plano já foi (ou está sendo) salvo
+                    return redirect('listar_planos')
+                try:
+                    # Associa o usuário antes de salvar
+                    plano_salvo = serializer.save(usuario=request.user)
+                    envio.concluir(plano_salvo, plano_salvo.job_ia)
+                    return redirect('listar_planos')
+
+                except Throttled as e:
+                    error_message = str(e.detail)
+                except Exception as e:
+                    error_message = f"Erro ao salvar no banco de dados: {str(e)}"
+                    logger.exception("Erro ao salvar plano de tratamento")
         else:
             form_errors = serializer.errors
             error_message = "Erro de validação. Por favor, verifique os campos em vermelho."
 
     # 3. Contexto para Renderização do Template
-    pacientes = Paciente.objects.filter(usuario=request.user)
-
     context = {
         'plano': plano_instance,
-        'pacientes': pacientes,
+        'paciente_selecionado': paciente_selecionado(
+            request, plano_instance.paciente if plano_instance else None),
         'is_editing': is_editing,
         'error_message': error_message,
         'form_errors': form_errors,
         'feedback_ia': feedback_ia,
         'request_post': request_post_data,  # ⬅️ Agora sempre será um dict
+        'chave_idempotencia': nova_chave(),
     }
 
     return render(request, 'psico_saas/plano_form.html', context)
@@ -119,16 +188,21 @@ def plano_form_view(request, pk=None):
 # 3. VIEW DA LISTA DE PLANOS (FRONTEND)
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(3)
 def listar_planos_view(request):
     """
     Busca e exibe todos os planos criados pelo usuário logado.
     """
     # Filtra todos os planos associados ao usuário que está a fazer a requisição
-    planos = PlanoTratamento.objects.filter(
-        usuario=request.user).order_by('-data_criacao')
+    # O template mostra nome e idade do paciente em cada linha: um JOIN em vez de N consultas.
+    # Só as colunas da lista: metas, diagnóstico e feedback da IA ficam para o detalhe
+    planos = (PlanoTratamento.objects.filter(usuario=request.user)
+              .select_related('paciente').only(*PlanoTratamento.CAMPOS_LISTA))
+    pagina = paginar_request(request, planos)
 
     context = {
-        'planos': planos
+        'planos': pagina.itens,
+        'pagina': pagina,
     }
 
     return render(request, 'psico_saas/plano_lista.html', context)
@@ -138,11 +212,13 @@ def listar_planos_view(request):
 # VIEW PARA VER DETALHES DO PLANO
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(3)
 def ver_plano_view(request, pk):
     """
     Exibe os detalhes completos de um plano de tratamento.
     """
-    plano = get_object_or_404(PlanoTratamento, pk=pk, usuario=request.user)
+    plano = get_object_or_404(
+        PlanoTratamento.objects.select_related('paciente'), pk=pk, usuario=request.user)
 
     context = {
         'plano': plano,
@@ -167,31 +243,12 @@ def excluir_plano(request, pk):
 # 5. VIEW DO DASHBOARD
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(11)
 def dashboard_view(request):
-    user = request.user
-
-    # 1. Métricas Totais
-    total_planos = PlanoTratamento.objects.filter(usuario=user).count()
-    total_documentacao = DocumentacaoSessao.objects.filter(
-        usuario=user).count()
-    total_tarefas = TarefaExercicios.objects.filter(usuario=user).count()
-
-    # 2. Itens Recentes
-    ultimos_planos = PlanoTratamento.objects.filter(
-        usuario=user).order_by('-data_criacao')[:3]
-    ultimas_documentacoes = DocumentacaoSessao.objects.filter(
-        usuario=user).order_by('-data_criacao')[:3]
-    ultimas_tarefas = TarefaExercicios.objects.filter(
-        usuario=user).order_by('-data_criacao')[:3]
-
-    context = {
-        'total_planos': total_planos,
-        'total_documentacao': total_documentacao,
-        'total_tarefas': total_tarefas,
-        'ultimos_planos': ultimos_planos,
-        'ultimas_documentacoes': ultimas_documentacoes,
-        'ultimas_tarefas': ultimas_tarefas,
-    }
+    # Totais e itens recentes vêm do cache por usuário (painel.py). Cache hit:
+    # sessão + usuário + leitura do cache. Miss: + 4 consultas (totais agregados
+    # e os três "últimos 3") + a gravação no DatabaseCache
+    context = resumo_dashboard(request.user.pk)
 
     return render(request, 'psico_saas/dashboard.html', context)
 
@@ -202,12 +259,11 @@ def dashboard_view(request):
 @login_required
 def documentacao_form_view(request):
     """
-    Lida com o formulário de entrada para documentação de sessão e processa a IA.
+    Lida com o formulário de entrada para documentação de sessão.
+    A IA roda no worker; a página acompanha o job via polling.
     """
-    resumo_ia = None
-    sugestao_diagnostico = None
-    padroes_linguagem = None
     error_message = None
+    job = None
 
     if request.method == 'POST':
         data = request.POST.copy()
@@ -220,29 +276,36 @@ def documentacao_form_view(request):
         )
 
         if serializer.is_valid():
-            try:
-                doc_salva = serializer.save(usuario=request.user)
-
-                # Armazena os resultados para exibição
-                resumo_ia = doc_salva.resumo_ia
-                sugestao_diagnostico = doc_salva.sugestao_diagnostico
-                padroes_linguagem = doc_salva.padroes_linguagem
+            with envio_unico(request, 'documentacao') as envio:
+                if envio.repetido:
+                    # Mesmo envio (duplo clique/reenvio): acompanha o job do original
+                    if envio.job:
+                        return redirect(f"{reverse('documentacao_form')}?job={envio.job.pk}")
+                    error_message = ENVIO_EM_ANDAMENTO
+                else:
+                    try:
+                        doc_salva = serializer.save(usuario=request.user)
+                        envio.concluir(doc_salva, doc_salva.job_ia)
 
-                # Redireciona para evitar reenvio do formulário
-                return redirect('documentacao_form', pk=doc_salva.pk)
+                        # Redireciona para evitar reenvio do formulário
+                        return redirect(f"{reverse('documentacao_form')}?job={doc_salva.job_ia.pk}")
 
-            except Exception as e:
-                # O Serializer levanta um ValidationError se a IA falhar
-                error_message = str(e)
+                    except Throttled as e:
+                        error_message = str(e.detail)
+                    except Exception as e:
+                        error_message = str(e)
         else:
             error_message = f"Erro de validação: {serializer.errors}"
 
+    elif request.GET.get('job', '').isdigit():
+        job = get_object_or_404(
+            JobIA, pk=request.GET['job'], usuario=request.user, tipo='DOCUMENTACAO')
+
     context = {
-        'resumo_ia': resumo_ia,
-        'sugestao_diagnostico': sugestao_diagnostico,
-        'padroes_linguagem': padroes_linguagem,
+        'job': status_job(job) if job else None,
         'error_message': error_message,
-        'pacientes': get_user_pacientes(request.user)
+        'paciente_selecionado': paciente_selecionado(request),
+        'chave_idempotencia': nova_chave(),
     }
 
     return render(request, 'psico_saas/documentacao_form.html', context)
@@ -254,10 +317,11 @@ def documentacao_form_view(request):
 @login_required
 def tarefas_form_view(request):
     """
-    Lida com o formulário de entrada para gerar exercícios e processa a IA.
+    Lida com o formulário de entrada para gerar exercícios.
+    O exercício é gerado pelo worker; a página acompanha o job via polling.
     """
-    exercicio_ia = None
     error_message = None
+    job = None
     # Adicionamos 'data_form' para repopular os campos após um erro de validação
     data_form = request.POST.copy() if request.method == 'POST' else None
 
@@ -270,40 +334,35 @@ def tarefas_form_view(request):
             context={'request': request}
         )
 
-        if serializer.is_valid():
-            try:
-                # 2. EXTRAI OS DADOS NECESSÁRIOS PARA A IA
-                dados_ia = serializer.validated_data
-
-                abordagem_teorica = dados_ia.get('abordagem_teorica')
-                tema_principal = dados_ia.get('tema_principal')
-                detalhes_personalizacao = dados_ia.get(
-                    'detalhes_personalizacao')
-
-                # 3. CHAMA O SERVIÇO DE IA CORRIGIDO
-                exercicio_ia_content = generate_task_exercise(
-                    abordagem_teorica,
-                    tema_principal,
-                    detalhes_personalizacao
-                )
-
-                # 4. TRATAMENTO DO RETORNO DA IA
-                if exercicio_ia_content.startswith("Erro na API:"):
-                    error_message = exercicio_ia_content
+        reutilizar_de = request.POST.get('reutilizar_de', '')
+        exercicio_escolhido = (exercicio_para_reuso(request.user.pk, int(reutilizar_de))
+                               if reutilizar_de.isdigit() else None)
+
+        if serializer.is_valid() and exercicio_escolhido:
+            # Sugestão aceita: copia o exercício existente, sem chamar a IA
+            tarefa_salva = TarefaExercicios.objects.create(
+                usuario=request.user, exercicio_ia=exercicio_escolhido, **serializer.validated_data)
+            return redirect('tarefas_detail', pk=tarefa_salva.pk)
+
+        elif serializer.is_valid():
+            with envio_unico(request, 'tarefa') as envio:
+                if envio.repetido:
+                    # Mesmo envio (duplo clique/reenvio): acompanha o job do original
+                    if envio.job:
+                        return redirect(f"{reverse('tarefas_form')}?job={envio.job.pk}")
+                    error_message = ENVIO_EM_ANDAMENTO
                 else:
-                    # 5. ATUALIZA OS DADOS VALIDADOS COM O CONTEÚDO DA IA
-                    dados_ia['exercicio_ia'] = exercicio_ia_content
-
-                    # 6. SALVA NO BANCO (com o conteúdo da IA e o usuário correto)
-                    tarefa_salva = serializer.save(usuario=request.user)
-                    exercicio_ia = tarefa_salva.exercicio_ia
-
-                    # Opcional: Redirecionar para a página de detalhes/listagem após o sucesso
-                    # return redirect('tarefas_detail', pk=tarefa_salva.pk)
-
-            except Exception as e:
-                # Captura erros inesperados (não API)
-                error_message = f"Erro de processamento: {e}"
+                    try:
+                        # 2. SALVA NO BANCO E ENFILEIRA A GERAÇÃO DO EXERCÍCIO
+                        tarefa_salva = serializer.save(usuario=request.user)
+                        envio.concluir(tarefa_salva, tarefa_salva.job_ia)
+                        return redirect(f"{reverse('tarefas_form')}?job={tarefa_salva.job_ia.pk}")
+
+                    except Throttled as e:
+                        error_message = str(e.detail)
+                    except Exception as e:
+                        # Captura erros inesperados (não API)
+                        error_message = f"Erro de processamento: {e}"
 
         else:
             # Lógica de formatação de erros (mantida e melhorada)
@@ -314,31 +373,131 @@ def tarefas_form_view(request):
                 formatted_errors.append(
                     f"**{field_name}**: {', '.join(error_list)}")
 
-            error_message = f"**Erro de validação:** Por favor, corrija os seguintes campos:\n- {'\n- '.join(formatted_errors)}"
+            separador = '\n- '
+            error_message = f"**Erro de validação:** Por favor, corrija os seguintes campos:\n- {separador.join(formatted_errors)}"
+
+    elif request.GET.get('job', '').isdigit():
+        job = get_object_or_404(
+            JobIA, pk=request.GET['job'], usuario=request.user, tipo='TAREFA')
 
     context = {
-        'exercicio_ia': exercicio_ia,
+        'job': status_job(job) if job else None,
         'error_message': error_message,
         'abordagens': TarefaExercicios.ABORDAGENS,
-        'pacientes': get_user_pacientes(request.user),
+        'paciente_selecionado': paciente_selecionado(request),
         # Passa os dados do POST de volta para o template repopular
         'data_form': data_form,
+        'chave_idempotencia': nova_chave(),
     }
 
     return render(request, 'psico_saas/tarefas_form.html', context)
 
 
+@login_required
+def tarefas_similares_view(request):
+    """Sugestões instantâneas: exercícios já gerados parecidos com o pedido."""
+    similares = buscar_similares(
+        request.user.pk,
+        request.GET.get('abordagem_teorica', ''),
+        request.GET.get('tema_principal', '').strip(),
+        request.GET.get('detalhes_personalizacao', '').strip() or None,
+    )
+
+    return JsonResponse({'similares': [
+        {
+            'id': item['tarefa'].pk,
+            'tema_principal': item['tarefa'].tema_principal,
+            'similaridade': item['similaridade'],
+            'trecho': item['tarefa'].exercicio_ia[:240],
+            # Exercícios de outros psicólogos (modo global) não têm página de detalhe
+            'detalhe_url': (reverse('tarefas_detail', args=[item['tarefa'].pk])
+                            if item['tarefa'].usuario_id == request.user.pk else None),
+        }
+        for item in similares
+    ]})
+
+
+# ------------------------------------------------------------------
+# 8.1 VIEW DE EXERCÍCIOS EM LOTE (VÁRIOS PACIENTES)
+# ------------------------------------------------------------------
+@login_required
+def tarefas_lote_view(request):
+    """
+    Mesmo tema e abordagem para vários pacientes de uma vez. O worker gera os
+    exercícios em paralelo (ia_lote.py) e a página acompanha o progresso.
+    """
+    error_message = None
+    job = None
+    pacientes = diretorio_pacientes(request)
+    abordagens_validas = {valor for valor, _ in TarefaExercicios.ABORDAGENS}
+
+    if request.method == 'POST':
+        abordagem_teorica = request.POST.get('abordagem_teorica', '')
+        tema_principal = request.POST.get('tema_principal', '').strip()
+        detalhes = request.POST.get('detalhes_personalizacao', '').strip()
+        ids = [int(pk) for pk in request.POST.getlist('pacientes') if pk.isdigit()]
+        # Só pacientes do próprio psicólogo entram no lote (o worker filtra de novo no banco)
+        ids = [pk for pk in dict.fromkeys(ids) if pk in pacientes]
+        max_pacientes = getattr(settings, 'IA_LOTE_MAX_PACIENTES', 100)
+
+        if abordagem_teorica not in abordagens_validas or not tema_principal:
+            error_message = "Informe a abordagem teórica e o tema principal."
+        elif not ids:
+            error_message = "Selecione ao menos um paciente."
+        elif len(ids) > max_pacientes:
+            error_message = f"Selecione no máximo {max_pacientes} pacientes por lote."
+
+        if error_message is None:
+            with envio_unico(request, 'lote_tarefas') as envio:
+                if envio.repetido:
+                    # Mesmo envio: acompanha o lote original (sem consumir cota de novo)
+                    if envio.job:
+                        return redirect(f"{reverse('tarefas_lote')}?job={envio.job.pk}")
+                    error_message = ENVIO_EM_ANDAMENTO
+                else:
+                    try:
+                        consumir_cota('tarefa', request.user.pk)
+                    except LimiteIAExcedido as e:
+                        error_message = str(e)
+                    else:
+                        job = enfileirar_job_ia(request.user, 'LOTE_TAREFAS', parametros={
+                            'pacientes': ids,
+                            'abordagem_teorica': abordagem_teorica,
+                            'tema_principal': tema_principal,
+                            'detalhes_personalizacao': detalhes or None,
+                        })
+                        envio.concluir(job=job)
+                        return redirect(f"{reverse('tarefas_lote')}?job={job.pk}")
+
+    elif request.GET.get('job', '').isdigit():
+        job = get_object_or_404(
+            JobIA, pk=request.GET['job'], usuario=request.user, tipo='LOTE_TAREFAS')
+
+    context = {
+        'job': status_job(job) if job else None,
+        'error_message': error_message,
+        'abordagens': TarefaExercicios.ABORDAGENS,
+        'pacientes': pacientes,
+        'selecionados': [int(pk) for pk in request.POST.getlist('pacientes') if pk.isdigit()],
+        'chave_idempotencia': nova_chave(),
+    }
+
+    return render(request, 'psico_saas/tarefas_lote_form.html', context)
+
+
 # ------------------------------------------------------------------
 # 9. VIEW DE LISTAGEM DE TAREFAS/EXERCÍCIOS
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(3)
 def listar_tarefas_view(request):
     """
     Exibe a lista de todos os exercícios/tarefas criadas pelo usuário.
     """
-    tarefas = TarefaExercicios.objects.filter(
-        usuario=request.user).order_by('-data_criacao')
-    context = {'tarefas': tarefas}
+    # Só as colunas da lista (exercicio_excerto no lugar do exercício inteiro)
+    tarefas = TarefaExercicios.objects.filter(usuario=request.user).only(*TarefaExercicios.CAMPOS_LISTA)
+    pagina = paginar_request(request, tarefas)
+    context = {'tarefas': pagina.itens, 'pagina': pagina}
     return render(request, 'psico_saas/tarefas_lista.html', context)
 
 
@@ -346,6 +505,7 @@ def listar_tarefas_view(request):
 # 10. VIEW DE DETALHE E IMPRESSÃO DE TAREFA
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(3)
 def tarefas_detail_view(request, pk):
     """
     Exibe uma única tarefa. Usado como base para a impressão.
@@ -372,65 +532,79 @@ def conteudo_educacional_form_view(request):
         )
 
         if serializer.is_valid():
-            try:
-                conteudo_salvo = serializer.save(usuario=request.user)
-                
-                print("=== DEBUG VIEW ANTES DE RETORNAR JSON ===")
-                print("SUGESTÕES DE IMAGENS NO OBJETO SALVO:", repr(conteudo_salvo.sugestoes_imagens))  # Usar repr para ver caracteres especiais
-                print("=======================")
-                
-                # Se for requisição AJAX, retorne JSON
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    response_data = {
-                        'success': True,
-                        'id': conteudo_salvo.id,
-                        'conteudo_gerado': conteudo_salvo.conteudo_gerado or '',
-                        'sugestoes_titulos': conteudo_salvo.sugestoes_titulos or '',
-                        'hashtags': conteudo_salvo.hashtags or '',
-                        'sugestoes_imagens': conteudo_salvo.sugestoes_imagens or '',
-                    }
-                    print("=== DEBUG JSON RESPONSE ===")
-                    print("RESPONSE DATA:", response_data)
-                    print("SUGESTÕES DE IMAGENS NO RESPONSE:", repr(response_data['sugestoes_imagens']))
-                    print("=======================")
-                    
-                    return JsonResponse(response_data)
-                else:
-                    return redirect('listar_conteudos_educacionais')
-                
-            except Exception as e:
-                error_msg = f"Erro ao gerar conteúdo: {str(e)}"
-                print("ERRO NA VIEW:", error_msg)
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return JsonResponse({'success': False, 'error': error_msg})
+            with envio_unico(request, 'conteudo') as envio:
+                if envio.repetido:
+                    # Mesmo envio (duplo clique/reenvio): devolve o job do original
+                    if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+                        return redirect('listar_conteudos_educacionais')
+                    if envio.job is None:
+                        return JsonResponse({'success': False, 'error': ENVIO_EM_ANDAMENTO}, status=409,
+                                            headers=REPETIR_APOS)
+                    return JsonResponse(_resposta_job_conteudo(envio.objeto_id, envio.job), status=202)
+                try:
+                    conteudo_salvo = serializer.save(usuario=request.user)
+                    envio.concluir(conteudo_salvo, conteudo_salvo.job_ia)
+
+                    # Se for requisição AJAX, retorne o job para o frontend acompanhar
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return JsonResponse(_resposta_job_conteudo(conteudo_salvo.id, conteudo_salvo.job_ia), status=202)
+                    else:
+                        return redirect('listar_conteudos_educacionais')
+
+                except Throttled as e:
+                    error_msg = str(e.detail)
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return _resposta_limite(error_msg, e.wait)
+                except Exception as e:
+                    error_msg = f"Erro ao gerar conteúdo: {str(e)}"
+                    logger.exception("Erro ao salvar conteúdo educacional")
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return JsonResponse({'success': False, 'error': error_msg})
         else:
             error_msg = f"Erro de validação: {serializer.errors}"
-            print("ERRO DE VALIDAÇÃO:", error_msg)
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': False, 'error': error_msg})
 
     context = {
         'tipos_conteudo': ConteudoEducacional.TIPOS_CONTEUDO,
+        'chave_idempotencia': nova_chave(),
     }
     
     return render(request, 'psico_saas/conteudo_educacional_form.html', context)
 
+
+def _resposta_job_conteudo(conteudo_id, job):
+    """Corpo do 202 do formulário AJAX: status do job para o frontend acompanhar."""
+    response_data = status_job(job)
+    response_data.update({
+        'success': True,
+        'id': conteudo_id,
+        'job_id': job.pk,
+        'status_url': reverse('status_job_ia', args=[job.pk]),
+    })
+    return response_data
+
+
 @login_required
+@orcamento_consultas(3)
 def listar_conteudos_educacionais_view(request):
     """
     Lista todos os conteúdos educacionais do usuário.
     """
-    conteudos = ConteudoEducacional.objects.filter(
-        usuario=request.user).order_by('-data_criacao')
+    conteudos = (ConteudoEducacional.objects.filter(usuario=request.user)
+                 .only(*ConteudoEducacional.CAMPOS_LISTA))
+    pagina = paginar_request(request, conteudos)
 
     context = {
-        'conteudos': conteudos
+        'conteudos': pagina.itens,
+        'pagina': pagina,
     }
 
     return render(request, 'psico_saas/conteudo_educacional_lista.html', context)
 
 
 @login_required
+@orcamento_consultas(3)
 def ver_conteudo_educacional_view(request, pk):
     """
     Exibe os detalhes de um conteúdo educacional.
@@ -452,29 +626,13 @@ def salvar_conteudo_educacional_view(request, pk):
     """
     if request.method == 'POST':
         try:
-            print("=== 🚀 INICIANDO SALVAMENTO ===")
-            print("ID do conteúdo:", pk)
-            print("Usuário:", request.user)
-            print("Dados POST recebidos:", dict(request.POST))
-            
             conteudo = get_object_or_404(ConteudoEducacional, pk=pk, usuario=request.user)
             
-            # Log dos valores atuais
-            print("Valores atuais no BD:")
-            print(f"  Título: {conteudo.titulo}")
-            print(f"  Conteúdo: {len(conteudo.conteudo_gerado or '')} chars")
-            print(f"  Imagens: {len(conteudo.sugestoes_imagens or '')} chars")
-            
             # Atualizar os campos
             novo_titulo = request.POST.get('titulo')
             novo_conteudo = request.POST.get('conteudo_gerado')
             novas_imagens = request.POST.get('sugestoes_imagens')
             
-            print("Novos valores recebidos:")
-            print(f"  Título: {novo_titulo}")
-            print(f"  Conteúdo: {len(novo_conteudo or '')} chars")
-            print(f"  Imagens: {len(novas_imagens or '')} chars")
-            
             if novo_titulo:
                 conteudo.titulo = novo_titulo
             if novo_conteudo:
@@ -486,16 +644,9 @@ def salvar_conteudo_educacional_view(request, pk):
             if novas_imagens is not None:  # Permite string vazia
                 conteudo.sugestoes_imagens = novas_imagens
             
-            # SALVAR EFETIVAMENTE
             conteudo.save()
-            
-            # Verificar se salvou
-            conteudo.refresh_from_db()
-            print("Valores após salvamento:")
-            print(f"  Título: {conteudo.titulo}")
-            print(f"  Conteúdo: {len(conteudo.conteudo_gerado or '')} chars")
-            print(f"  Imagens: {len(conteudo.sugestoes_imagens or '')} chars")
-            print("=== ✅ SALVAMENTO CONCLUÍDO ===")
+            logger.info("Conteúdo educacional %s salvo (%d chars, %d chars de imagens)",
+                        conteudo.pk, len(conteudo.conteudo_gerado or ''), len(conteudo.sugestoes_imagens or ''))
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': True, 'message': 'Conteúdo salvo com sucesso!'})
@@ -503,9 +654,7 @@ def salvar_conteudo_educacional_view(request, pk):
                 return redirect('listar_conteudos_educacionais')
                 
         except Exception as e:
-            print(f"=== ❌ ERRO NO SALVAMENTO: {str(e)} ===")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Erro ao salvar conteúdo educacional %s", pk)
             
             error_msg = f"Erro ao salvar conteúdo: {str(e)}"
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -514,16 +663,260 @@ def salvar_conteudo_educacional_view(request, pk):
     return JsonResponse({'success': False, 'error': 'Método não permitido'})
 
 
+# ------------------------------------------------------------------
+# STREAMING (SSE) DA GERAÇÃO DE EXERCÍCIOS E CONTEÚDOS
+# Views assíncronas servidas pelo app_core/asgi.py. O registro é criado antes
+# do stream e os campos de IA são salvos quando o stream termina. Se a OpenAI
+# falhar no meio do caminho, a geração segue pela fila de jobs.
+# ------------------------------------------------------------------
+def _resposta_sse(eventos):
+    response = StreamingHttpResponse(eventos, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evita buffer em proxies (nginx/heroku router)
+    return response
+
+
+def _resposta_limite(mensagem, tentar_em):
+    # 429 rápido em vez de prender um worker esperando a OpenAI
+    response = JsonResponse({'success': False, 'error': mensagem, 'tentar_em': tentar_em}, status=429)
+    response['Retry-After'] = str(int(tentar_em or 1))
+    return response
+
+
+async def _reservar_ia(endpoint, usuario):
+    """Cota + vagas simultâneas para um stream; levanta LimiteIAExcedido."""
+    await sync_to_async(consumir_cota)(endpoint, usuario.pk)
+    return await sync_to_async(adquirir_vagas)(endpoint, usuario.pk)
+
+
+async def _enfileirar_apos_falha(usuario, tipo, objeto, erro, envio):
+    job = await sync_to_async(enfileirar_job_ia)(usuario, tipo, objeto)
+    await sync_to_async(envio.concluir)(job=job)
+    return evento_sse('erro', {
+        'erro': str(erro),
+        'status_url': reverse('status_job_ia', args=[job.pk]),
+    })
+
+
+async def _repetir_stream(envio, usuario, tipo, modelo, campo, evento_fim):
+    """
+    Stream repetido com a mesma chave (idempotencia.py): não chama a IA. Espera a
+    geração do envio original e devolve o mesmo 'fim' (ou o job da fila, se o
+    original falhou). Se o original não terminar no prazo (cliente caiu no meio
+    do stream), a geração passa para a fila de jobs.
+    """
+    prazo = time.monotonic() + espera_stream()
+    yield evento_sse('inicio', {'id': envio.objeto_id})
+
+    while True:
+        registro = await EnvioIA.objects.filter(pk=envio.registro.pk).afirst()
+        if registro is None or registro.objeto_id is None:
+            yield evento_sse('erro', {'erro': ENVIO_EM_ANDAMENTO})
+            return
+        if registro.job_id is None:
+            objeto = await modelo.objects.filter(pk=registro.objeto_id).afirst()
+            if objeto is None:
+                yield evento_sse('erro', {'erro': "O registro deste envio foi excluído."})
+                return
+            if getattr(objeto, campo) is not None:
+                yield evento_sse('fim', evento_fim(objeto))
+                return
+            if time.monotonic() < prazo:
+                await asyncio.sleep(1)
+                continue
+            job = await sync_to_async(enfileirar_job_ia)(usuario, tipo, objeto)
+            await EnvioIA.objects.filter(pk=registro.pk).aupdate(job=job)
+            registro.job_id = job.pk
+
+        yield evento_sse('erro', {
+            'erro': "A geração deste envio continua pela fila de jobs.",
+            'status_url': reverse('status_job_ia', args=[registro.job_id]),
+        })
+        return
+
+
+def _fim_tarefa(tarefa):
+    return {
+        'id': tarefa.pk,
+        'exercicio_ia': tarefa.exercicio_ia,
+        'detalhe_url': reverse('tarefas_detail', args=[tarefa.pk]),
+    }
+
+
+def _fim_conteudo(conteudo):
+    return {
+        'success': True,
+        'id': conteudo.pk,
+        'conteudo_gerado': conteudo.conteudo_gerado or '',
+        'sugestoes_titulos': conteudo.sugestoes_titulos or '',
+        'hashtags': conteudo.hashtags or '',
+        'sugestoes_imagens': conteudo.sugestoes_imagens or '',
+    }
+
+
+@login_required
+@require_POST
+async def tarefas_stream_view(request):
+    """Gera o exercício transmitindo os tokens da OpenAI como Server-Sent Events."""
+    serializer = TarefaExerciciosSerializer(
+        data=request.POST.copy(),
+        context={'request': request}
+    )
+
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse({'success': False, 'error': f"Erro de validação: {serializer.errors}"}, status=400)
+
+    usuario = await request.auser()
+    envio = await sync_to_async(reservar_envio)(usuario.pk, chave_da_requisicao(request), 'tarefa_stream')
+    if envio.repetido:
+        return _resposta_sse(_repetir_stream(
+            envio, usuario, 'TAREFA', TarefaExercicios, 'exercicio_ia', _fim_tarefa))
+
+    dados = serializer.validated_data
+    reaproveitado = await sync_to_async(exercicio_reaproveitavel)(
+        usuario.pk, dados['abordagem_teorica'], dados['tema_principal'],
+        dados.get('detalhes_personalizacao'))
+
+    vagas = []
+    if not reaproveitado:
+        try:
+            vagas = await _reservar_ia("tarefa", usuario)
+        except LimiteIAExcedido as e:
+            await sync_to_async(envio.liberar)()
+            return _resposta_limite(str(e), e.tentar_em)
+
+    tarefa = await TarefaExercicios.objects.acreate(usuario=usuario, **dados)
+    await sync_to_async(envio.concluir)(tarefa)
+    mensagens = montar_mensagens_exercicio(
+        tarefa.abordagem_teorica, tarefa.tema_principal, tarefa.detalhes_personalizacao)
+
+    async def eventos():
+        try:
+            yield evento_sse('inicio', {'id': tarefa.pk})
+
+            partes = []
+            if reaproveitado:
+                # Exercício quase idêntico já existe: sai de uma vez, sem chamar a IA
+                partes.append(reaproveitado)
+                yield evento_sse('token', {'texto': reaproveitado})
+            else:
+                try:
+                    async for delta in transmitir_chat("tarefa", "gpt-3.5-turbo", mensagens, **PARAMETROS_EXERCICIO):
+                        partes.append(delta)
+                        yield evento_sse('token', {'texto': delta})
+                except ErroIA as e:
+                    yield await _enfileirar_apos_falha(usuario, 'TAREFA', tarefa, e, envio)
+                    return
+
+            tarefa.exercicio_ia = ''.join(partes)
+            await tarefa.asave(update_fields=['exercicio_ia'])
+
+            yield evento_sse('fim', _fim_tarefa(tarefa))
+        finally:
+            await sync_to_async(liberar_vagas)(vagas)
+
+    return _resposta_sse(eventos())
+
+
+@login_required
+@require_POST
+async def conteudo_educacional_stream_view(request):
+    """Gera o conteúdo educacional transmitindo o JSON da OpenAI como Server-Sent Events."""
+    serializer = ConteudoEducacionalSerializer(
+        data=request.POST.copy(),
+        context={'request': request}
+    )
+
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse({'success': False, 'error': f"Erro de validação: {serializer.errors}"}, status=400)
+
+    usuario = await request.auser()
+    envio = await sync_to_async(reservar_envio)(usuario.pk, chave_da_requisicao(request), 'conteudo_stream')
+    if envio.repetido:
+        return _resposta_sse(_repetir_stream(
+            envio, usuario, 'CONTEUDO', ConteudoEducacional, 'conteudo_gerado', _fim_conteudo))
+
+    try:
+        vagas = await _reservar_ia("conteudo", usuario)
+    except LimiteIAExcedido as e:
+        await sync_to_async(envio.liberar)()
+        return _resposta_limite(str(e), e.tentar_em)
+
+    conteudo = await ConteudoEducacional.objects.acreate(
+        usuario=usuario, **serializer.validated_data)
+    await sync_to_async(envio.concluir)(conteudo)
+    mensagens = montar_mensagens_conteudo(conteudo)
+
+    async def eventos():
+        try:
+            yield evento_sse('inicio', {'id': conteudo.pk})
+
+            partes = []
+            try:
+                async for delta in transmitir_chat("conteudo", "gpt-3.5-turbo-1106", mensagens,
+                                                   response_format={"type": "json_object"}):
+                    partes.append(delta)
+                    yield evento_sse('token', {'texto': delta})
+
+                try:
+                    ia_output = json.loads(''.join(partes))
+                except ValueError as e:
+                    raise ErroIA(f"Resposta da IA não é um JSON válido: {e}")
+            except ErroIA as e:
+                yield await _enfileirar_apos_falha(usuario, 'CONTEUDO', conteudo, e, envio)
+                return
+
+            aplicar_saida_conteudo(conteudo, ia_output)
+            await conteudo.asave(update_fields=['conteudo_gerado', 'sugestoes_titulos',
+                                                'hashtags', 'sugestoes_imagens', 'data_atualizacao'])
+
+            yield evento_sse('fim', _fim_conteudo(conteudo))
+        finally:
+            await sync_to_async(liberar_vagas)(vagas)
+
+    return _resposta_sse(eventos())
+
+
+# ------------------------------------------------------------------
+# STATUS DOS JOBS DE IA (POLLING)
+# ------------------------------------------------------------------
+@login_required
+def status_job_ia_view(request, pk):
+    """Retorna o status de um job de IA e, quando concluído, os campos gerados."""
+    job = get_object_or_404(JobIA, pk=pk, usuario=request.user)
+    return JsonResponse(status_job(job))
+
+
+@staff_member_required
+def estatisticas_cache_ia_view(request):
+    """Contadores de hit/miss do cache de completions (apenas equipe)."""
+    return JsonResponse(ia_cache.estatisticas())
+
+
+@staff_member_required
+def metricas_ia_view(request):
+    """Latência (p50/p95/p99), tokens e erros das chamadas à IA por dia e endpoint (apenas equipe)."""
+    dias = request.GET.get('dias', '7')
+    dias = min(max(int(dias), 1), 90) if dias.isdigit() else 7
+    context = {
+        'linhas': resumo_por_dia(dias),
+        'dias': dias,
+    }
+    return render(request, 'psico_saas/metricas_ia.html', context)
+
+
 # ------------------------------------------------------------------
 # 12. VIEWS PARA PACIENTES
 # ------------------------------------------------------------------
 @login_required
+@orcamento_consultas(3)
 def listar_pacientes_view(request):
     """Lista todos os pacientes do usuário"""
-    pacientes = Paciente.objects.filter(usuario=request.user).order_by('nome_completo')
+    pagina = paginar_request(request, Paciente.objects.filter(usuario=request.user), POR_NOME)
     
     context = {
-        'pacientes': pacientes
+        'pacientes': pagina.itens,
+        'pagina': pagina,
     }
     return render(request, 'psico_saas/pacientes_lista.html', context)
 
@@ -603,6 +996,35 @@ def paciente_form_view(request, pk=None):
     return render(request, 'psico_saas/paciente_form.html', context)
 
 @login_required
+def importar_pacientes_view(request):
+    """Upload de CSV/XLSX com vários pacientes; mostra o relatório por linha."""
+    relatorio = None
+    error_message = None
+    max_mb = tamanho_maximo_mb()
+
+    if request.method == 'POST':
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            error_message = "Selecione um arquivo .csv ou .xlsx."
+        elif arquivo.size > max_mb * 1024 * 1024:
+            error_message = f"Arquivo maior que {max_mb} MB."
+        else:
+            try:
+                relatorio = importar_pacientes(
+                    request.user, arquivo.file, arquivo.name, simular=bool(request.POST.get('simular')))
+            except ArquivoInvalido as e:
+                error_message = str(e)
+
+    context = {
+        'relatorio': relatorio,
+        'simulacao': bool(request.POST.get('simular')),
+        'error_message': error_message,
+        'max_mb': max_mb,
+    }
+    return render(request, 'psico_saas/pacientes_importar.html', context)
+
+@login_required
+@orcamento_consultas(3)
 def ver_paciente_view(request, pk):
     """Visualiza detalhes de um paciente"""
     paciente = get_object_or_404(Paciente, pk=pk, usuario=request.user)
@@ -639,4 +1061,79 @@ def excluir_paciente_view(request, pk):
         return JsonResponse({
             'success': False,
             'error': f'Erro ao excluir paciente: {str(e)}'
-        })
\ No newline at end of file
+        })
+
+
+# ------------------------------------------------------------------
+# 13. BUSCA DE TEXTO COMPLETO
+# ------------------------------------------------------------------
+@login_required
+@orcamento_consultas(3)
+def buscar_pacientes_view(request):
+    """JSON do seletor de pacientes: ?q= (início das palavras do nome)."""
+    pacientes = buscar_pacientes(request.user.pk, request.GET.get('q', '')[:100])
+    return JsonResponse({
+        'resultados': [
+            {'id': p.pk, 'nome': p.nome_completo, 'idade': p.get_idade()} for p in pacientes
+        ],
+    })
+
+
+@login_required
+@orcamento_consultas(6)
+def busca_view(request):
+    """Busca nas anotações de sessão, resumos da IA, planos e exercícios do usuário."""
+    termo = request.GET.get('q', '').strip()[:200]
+    tipo = request.GET.get('tipo', '')
+    numero = request.GET.get('pagina', '1')
+    numero = int(numero) if numero.isdigit() else 1
+
+    resultados, ha_proxima = buscar(request.user.pk, termo, [tipo] if tipo else None, numero)
+
+    # Mesmo formato de pagina que o include de paginação usa
+    parametros = request.GET.copy()
+    pagina = {'tem_outras': numero > 1 or ha_proxima, 'link_anterior': None, 'link_proximo': None}
+    if numero > 1:
+        parametros['pagina'] = numero - 1
+        pagina['link_anterior'] = '?' + parametros.urlencode()
+    if ha_proxima:
+        parametros['pagina'] = numero + 1
+        pagina['link_proximo'] = '?' + parametros.urlencode()
+
+    context = {
+        'termo': termo,
+        'tipo': tipo,
+        'tipos': IndiceBusca.TIPOS,
+        'resultados': resultados,
+        'pagina': pagina,
+        'numero_pagina': numero,
+    }
+    return render(request, 'psico_saas/busca.html', context)
+
+
+# ------------------------------------------------------------------
+# 14. EXPORTAÇÃO DOS DADOS (LGPD)
+# ------------------------------------------------------------------
+@login_required
+def exportar_dados_view(request, pk=None):
+    """
+    Download em streaming de todo o prontuário do usuário (ou de um paciente, pk).
+    ?formato=jsonl|csv|zip (padrão zip) e ?secao= (obrigatória no CSV).
+    """
+    paciente_id = None
+    if pk is not None:
+        paciente_id = get_object_or_404(Paciente.objects.only('id'), pk=pk, usuario=request.user).pk
+
+    try:
+        conteudo, content_type, nome_arquivo = exportar(
+            request.GET.get('formato', 'zip'), request.user.pk, paciente_id, request.GET.get('secao'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Iterador assíncrono: no ASGI cada pedaço sai assim que é gerado
+    response = StreamingHttpResponse(em_partes_assincronas(conteudo), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    # Sem buffer em proxies (nginx) e sem cache de dados clínicos
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-store'
+    return response